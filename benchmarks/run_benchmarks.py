@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Benchmarks of the hot paths of the prediction scripts.
+
+ITURHFProp is replaced by the stand-in in hfprop/fake_iturhfprop.py with a
+fixed latency, so the timings only cover the work done by the scripts.
+The D1 tables are synthetic copies of d1/d1_data_measured.csv scaled by
+each of the --scales factors.  The results are written to a JSON file,
+use --compare to print the change from an earlier run, e.g.
+
+    python3 run_benchmarks.py -o before.json
+    (make a change)
+    python3 run_benchmarks.py -o after.json --compare before.json
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+sys.path.insert(1, ROOT_DIR)
+sys.path.insert(1, os.path.join(ROOT_DIR, 'd1'))
+sys.path.insert(1, os.path.join(ROOT_DIR, 'radcom'))
+from hfprop.fake_iturhfprop import read_deck, write_synthetic_report
+from hfprop.iturhfprop import FAKE_LATENCY_ENV, FAKE_MODE_ENV, get_command, set_executable
+from hfprop.results import PredictionResult, get_predictions_as_dict
+
+import generate1148Report
+import generatePredictionTable
+import radcom
+from residuals import write_residual_csv
+from stratify import Stratification
+
+D1_MEASURED_FN = os.path.join(ROOT_DIR, 'd1', 'd1_data_measured.csv')
+HOUR_COLUMNS = ['{:d}:00'.format(hour) for hour in range(1, 25)]
+RADCOM_FREQUENCIES = [28.85, 24.94, 21.225, 18.118, 14.175, 10.125, 7.1, 5.0, 3.65]
+
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_LATENCY = 0.05 # seconds
+DEFAULT_REPEAT = 5
+
+
+def time_calls(fn, repeat, number=1):
+    """
+    Returns a list of the mean time of a call to fn in each of repeat
+    batches of number calls.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return times
+
+
+class Benchmarks:
+
+    def __init__(self, repeat=DEFAULT_REPEAT, name_filter=None):
+        self.repeat = repeat
+        self.name_filter = name_filter
+        self.results = []
+
+    def run(self, name, fn, scale=1, number=1, items=1, repeat=None, **extra):
+        """
+        Times fn and records the result.  items is the number of rows,
+        runs etc. handled by each call and is used for the throughput.
+        """
+        if self.name_filter and self.name_filter not in name:
+            return None
+        times = time_calls(fn, repeat or self.repeat, number)
+        median = statistics.median(times)
+        result = {'name': name,
+                  'scale': scale,
+                  'repeat': len(times),
+                  'number': number,
+                  'min': min(times),
+                  'median': median,
+                  'mean': statistics.mean(times),
+                  'max': max(times),
+                  'items': items,
+                  'items_per_s': items / median if median else None}
+        result.update(extra)
+        self.results.append(result)
+        print("{:32s} x{:<4d} {:>12.6f}s {:>14.1f}/s".format(name, scale, median, result['items_per_s'] or 0))
+        return result
+
+
+def write_d1_tables(scale, measured_fn, predicted_fn, seed=1148):
+    """
+    Writes a measured D1 table of scale copies of the D1 data, each copy
+    with its own ids, and a matching predicted table of the measured values
+    plus random errors.  Hours without data are predicted with random
+    values.
+    """
+    with open(D1_MEASURED_FN) as d1_file:
+        reader = csv.DictReader(d1_file)
+        headers = reader.fieldnames
+        rows = list(reader)
+    rng = np.random.default_rng(seed)
+    measured = np.array([[float(row[key]) for key in HOUR_COLUMNS] for row in rows])
+    max_id = max(int(row['id']) for row in rows)
+
+    with open(measured_fn, 'w') as meas_file, open(predicted_fn, 'w') as pred_file:
+        meas_writer = csv.DictWriter(meas_file, fieldnames=headers, lineterminator='\n')
+        pred_writer = csv.DictWriter(pred_file, fieldnames=headers, lineterminator='\n')
+        meas_writer.writeheader()
+        pred_writer.writeheader()
+        for copy_idx in range(scale):
+            predicted = np.where(measured == 99, rng.uniform(-20, 60, measured.shape), measured + rng.normal(0, 8, measured.shape))
+            for row, pred_values in zip(rows, predicted):
+                row = dict(row, id=str(int(row['id']) + copy_idx * max_id))
+                meas_writer.writerow(row)
+                row.update(zip(HOUR_COLUMNS, ('{:.2f}'.format(value) for value in pred_values)))
+                pred_writer.writerow(row)
+    return len(rows) * scale
+
+
+def write_report(deck_fn, report_fn, points):
+    """
+    Writes a synthetic BCR report for a row of points receive locations
+    (the radcom frequencies and 24 hours at each).  Returns the number of
+    rows in the report.
+    """
+    text_in = radcom.get_input_deck(45.0, 1.5, 51.5, 0.0, 50, "./data/", area=(51.0, 0.0, 51.0, points - 1.0), area_step=1.0)
+    with open(deck_fn, 'w') as deck_file:
+        deck_file.write(text_in)
+    write_synthetic_report(read_deck(deck_fn), report_fn)
+    return len(RADCOM_FREQUENCIES) * 24 * points
+
+
+def get_d1_deck():
+    return generatePredictionTable.get_input_deck(49.4, 6.19, 51.07, 7.16, 40,
+                    path_name="Test Case ID: 1 Year 1984 Month 8",
+                    path_tx_name="LUXEMBURG",
+                    path_rx_name="BOCKHACKEN",
+                    path_month=8,
+                    path_year=1984,
+                    path_frequency=[6.1, 9.545, 15.105],
+                    path_bw=1000,
+                    path_SNRr=10,
+                    path_SNRXXp=50,
+                    tx_power=1000,
+                    path_manmade_noise="RURAL",
+                    report_format=["RPT_E"])
+
+
+def run_deck_benchmarks(bench):
+    bench.run('deck.d1', get_d1_deck, number=1000)
+    bench.run('deck.radcom', lambda: radcom.get_input_deck(45.0, 1.5, 51.5, 0.0, 50, "./data/", path_month=8, path_year=2019), number=1000)
+
+
+def run_launch_benchmarks(bench, latency):
+    """
+    The cost of starting a bare interpreter, of starting the stand-in with
+    no latency and of a whole point to point prediction with the fixed
+    latency, without the cache.  The overhead of the prediction is its time
+    less the latency.
+    """
+    bench.run('launch.python', lambda: subprocess.call([sys.executable, '-c', '']))
+    with tempfile.TemporaryDirectory() as work_dir:
+        deck_fn = os.path.join(work_dir, 'launch.in')
+        with open(deck_fn, 'w') as deck_file:
+            deck_file.write(get_d1_deck())
+        os.environ[FAKE_LATENCY_ENV] = '0'
+        bench.run('launch.stub', lambda: subprocess.call(get_command() + ['-s', '-c', deck_fn, os.path.join(work_dir, 'launch.out')]))
+    os.environ[FAKE_LATENCY_ENV] = str(latency)
+    result = bench.run('p2p.d1', lambda: generatePredictionTable.run_p2p_prediction(49.4, 6.19, 51.07, 7.16, 40,
+                    path_month=8,
+                    path_year=1984,
+                    path_frequency=[6.1, 9.545, 15.105],
+                    report_format=["RPT_E"],
+                    report_dict_keys=['Ep']), latency=latency)
+    if result:
+        result['overhead'] = result['median'] - latency
+
+
+def run_parse_benchmarks(bench, scales):
+    with tempfile.TemporaryDirectory() as work_dir:
+        for scale in scales:
+            report_fn = os.path.join(work_dir, 'report_{:d}.csv'.format(scale))
+            rows = write_report(os.path.join(work_dir, 'report.in'), report_fn, scale)
+            bench.run('parse.report', lambda: get_predictions_as_dict(report_fn, ['BCR']), scale=scale, items=rows)
+
+
+def run_residual_benchmarks(bench, scale, work_dir):
+    """
+    Times the residual step, without and then with the columnar cache, and
+    returns the name of the residual table for the report benchmarks.
+    """
+    measured_fn = os.path.join(work_dir, 'measured.csv')
+    predicted_fn = os.path.join(work_dir, 'predicted.csv')
+    residual_fn = os.path.join(work_dir, 'residuals.csv')
+    rows = write_d1_tables(scale, measured_fn, predicted_fn)
+    bench.run('residuals.uncached', lambda: write_residual_csv(predicted_fn, measured_fn, residual_fn, use_cache=False), scale=scale, items=rows)
+    write_residual_csv(predicted_fn, measured_fn, residual_fn)
+    bench.run('residuals.cached', lambda: write_residual_csv(predicted_fn, measured_fn, residual_fn), scale=scale, items=rows)
+    return residual_fn, rows
+
+
+def run_report_benchmarks(bench, scale, residual_fn, rows):
+    """
+    Times each section of the 1148 report on its own, with a new
+    Stratification for every call as the sections add their dimensions to
+    it.
+    """
+    generate1148Report.read_report_table(residual_fn)
+    bench.run('report.read', lambda: generate1148Report.read_report_table(residual_fn), scale=scale, items=rows)
+    df = generate1148Report.read_report_table(residual_fn)
+    residuals = df.loc[:, 'er_0100':'er_2400'].values
+    bench.run('report.strata', lambda: Stratification(residuals), scale=scale, items=rows)
+    for name, section in generate1148Report.SECTIONS.items():
+        bench.run('report.section.{:s}'.format(name), lambda: section(df, Stratification(residuals), []), scale=scale, items=rows)
+
+
+def run_html_benchmarks(bench):
+    rng = np.random.default_rng(0)
+    predictions = PredictionResult.from_rows(np.repeat(RADCOM_FREQUENCIES, 24), rng.uniform(0, 100, len(RADCOM_FREQUENCIES) * 24), ['BCR'])
+    json_data = {'meta': {'location': 'New York'}, 'predictions': predictions}
+    bench.run('radcom.html_table', lambda: radcom.get_html_table(json_data, 'BCR'), number=100)
+
+
+def get_git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def get_meta(args):
+    commit, dirty = get_git_commit()
+    return {'commit': commit,
+            'dirty': dirty,
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'scales': args.scales,
+            'latency': args.latency,
+            'repeat': args.repeat}
+
+
+def print_comparison(results, baseline_fn):
+    """
+    Prints the ratio of the median times to those in an earlier results
+    file, ratios above 1 are slower.
+    """
+    with open(baseline_fn) as baseline_file:
+        baseline = json.load(baseline_file)
+    baseline_results = {(result['name'], result['scale']): result for result in baseline['results']}
+    print("\nCompared with {:s} ({:s})".format(baseline_fn, str(baseline['meta'].get('commit'))))
+    print("{:32s} {:>5s} {:>12s} {:>12s} {:>7s}".format("", "Scale", "Before", "After", "Ratio"))
+    for result in results:
+        before = baseline_results.get((result['name'], result['scale']))
+        if before:
+            print("{:32s} {:>5d} {:>12.6f} {:>12.6f} {:>7.2f}".format(result['name'], result['scale'], before['median'], result['median'], result['median'] / before['median']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the prediction scripts against a stand-in for ITURHFProp.")
+    parser.add_argument("-o", "--output", default="benchmarks.json",
+                        help="JSON file the results are written to (default: benchmarks.json)")
+    parser.add_argument("--scales", default=",".join(str(scale) for scale in DEFAULT_SCALES),
+                        help="comma separated scale factors of the D1 tables and reports (default: 1,10,100)")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY,
+                        help="latency of the ITURHFProp stand-in in seconds (default: {:g})".format(DEFAULT_LATENCY))
+    parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="number of times each benchmark is repeated (default: {:d})".format(DEFAULT_REPEAT))
+    parser.add_argument("-k", "--filter",
+                        help="only run the benchmarks with names containing this string")
+    parser.add_argument("--compare",
+                        help="JSON file of earlier results to compare with")
+    args = parser.parse_args()
+    args.scales = [int(scale) for scale in args.scales.split(',')]
+
+    set_executable('fake')
+    os.environ[FAKE_MODE_ENV] = 'synthetic'
+    bench = Benchmarks(args.repeat, args.filter)
+    run_deck_benchmarks(bench)
+    run_launch_benchmarks(bench, args.latency)
+    run_parse_benchmarks(bench, args.scales)
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory() as work_dir:
+            residual_fn, rows = run_residual_benchmarks(bench, scale, work_dir)
+            run_report_benchmarks(bench, scale, residual_fn, rows)
+    run_html_benchmarks(bench)
+
+    with open(args.output, 'w') as output_file:
+        json.dump({'meta': get_meta(args), 'results': bench.results}, output_file, indent=2)
+    print("Results written to {:s}".format(args.output))
+    if args.compare:
+        print_comparison(bench.results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+A single file store for the ITURHFProp runs made while building a
+prediction table.
+
+With --artifacts the D1 builders run ITURHFProp in the scratch space and
+keep the compressed input deck, the raw output, the return code and the
+usage of each run in an SQLite file instead of writing a .in and .out file
+per run to the run directory.  Runs are indexed by the D1 id, frequency,
+year and month of each row they predict.  Rows are written in batches, by
+the parent process only, so the worker processes never contend for the
+database.
+
+Run this module to list the runs in a store or to extract the .in/.out
+files of some of them, e.g.
+
+    python3 artifacts.py list run/artifacts.sqlite --id 179
+    python3 artifacts.py extract run/artifacts.sqlite --id 179 --year 85 --month 3 -o run
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import zlib
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from hfprop.usage import USAGE_FIELDS
+
+DEFAULT_ARTIFACTS_FILE = os.path.join('run', 'artifacts.sqlite')
+
+# Number of pending runs written in each transaction
+FLUSH_RUNS = 64
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+        name TEXT PRIMARY KEY,
+        deck BLOB,
+        output BLOB,
+        created REAL,
+        {:s})""".format(",\n        ".join("{:s} REAL".format(field) for field in USAGE_FIELDS)),
+    """CREATE TABLE IF NOT EXISTS run_rows (
+        name TEXT,
+        id INTEGER,
+        freq REAL,
+        year INTEGER,
+        month INTEGER)""",
+    "CREATE INDEX IF NOT EXISTS run_rows_idx ON run_rows (id, year, month, freq)",
+    "CREATE INDEX IF NOT EXISTS run_rows_name_idx ON run_rows (name)",
+]
+
+
+class ArtifactRun:
+    """
+    A run that is about to be made.  rows is a list of (id, freq, year,
+    month) tuples for the rows of the table it predicts.
+    """
+
+    def __init__(self, store, name, rows):
+        self.store = store
+        self.name = name
+        self.rows = rows
+
+    def record(self, text_in, output_file, usage):
+        """
+        Queues the deck and the output of the finished run for writing to
+        the store.  output_file may not exist if the run failed.
+        """
+        try:
+            with open(output_file, 'rb') as f:
+                output = zlib.compress(f.read())
+        except OSError:
+            output = None
+        usage = usage.as_dict() if usage is not None else {}
+        self.store.add((self.name, zlib.compress(text_in.encode()), output, time.time(),
+                        [usage.get(field) for field in USAGE_FIELDS], self.rows))
+
+
+class ArtifactStore:
+
+    def __init__(self, path=DEFAULT_ARTIFACTS_FILE):
+        self.path = path
+        self.pending = []
+        self.runs = 0
+        self.bytes_stored = 0
+        self._conn = None
+        self._pid = os.getpid()
+
+    def __getstate__(self):
+        # Worker processes only queue their runs, the parent writes them
+        # (see pop_pending() and add_pending())
+        state = self.__dict__.copy()
+        state['pending'] = []
+        state['runs'] = 0
+        state['bytes_stored'] = 0
+        state['_conn'] = None
+        state['_pid'] = None
+        return state
+
+    def get_connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            with self._conn:
+                for statement in SCHEMA:
+                    self._conn.execute(statement)
+        return self._conn
+
+    def new_run(self, name, rows):
+        return ArtifactRun(self, name, rows)
+
+    def add(self, pending_run):
+        self.pending.append(pending_run)
+        if self._pid == os.getpid() and len(self.pending) >= FLUSH_RUNS:
+            self.flush()
+
+    def pop_pending(self):
+        pending, self.pending = self.pending, []
+        return pending
+
+    def add_pending(self, pending):
+        for pending_run in pending:
+            self.add(pending_run)
+
+    def flush(self):
+        """
+        Writes the pending runs in a single transaction, replacing any
+        earlier runs with the same names.
+        """
+        if not self.pending:
+            return
+        pending = self.pop_pending()
+        conn = self.get_connection()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO runs (name, deck, output, created, {:s}) VALUES (?, ?, ?, ?, {:s})".format(
+                                ", ".join(USAGE_FIELDS), ", ".join("?" * len(USAGE_FIELDS))),
+                             [(name, deck, output, created) + tuple(usage) for name, deck, output, created, usage, rows in pending])
+            conn.executemany("DELETE FROM run_rows WHERE name = ?", [(name,) for name, *_ in pending])
+            conn.executemany("INSERT INTO run_rows (name, id, freq, year, month) VALUES (?, ?, ?, ?, ?)",
+                             [(name,) + tuple(row) for name, deck, output, created, usage, rows in pending for row in rows])
+        self.runs += len(pending)
+        self.bytes_stored += sum(len(deck) + len(output or b'') for name, deck, output, created, usage, rows in pending)
+
+    def close(self):
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def find_runs(self, name=None, id=None, freq=None, year=None, month=None):
+        """
+        Returns a list of (name, return_code, wall, ids) tuples for the runs
+        predicting any row matching all of the given values.
+        """
+        conditions = []
+        values = []
+        for column, value in [('name', name), ('id', id), ('freq', freq), ('year', year), ('month', month)]:
+            if value is not None:
+                conditions.append("run_rows.{:s} = ?".format(column))
+                values.append(value)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        sql = ("SELECT runs.name, runs.return_code, runs.wall, GROUP_CONCAT(DISTINCT run_rows.id) FROM runs "
+               "JOIN run_rows ON run_rows.name = runs.name {:s} GROUP BY runs.name ORDER BY runs.name").format(where)
+        return self.get_connection().execute(sql, values).fetchall()
+
+    def get_run(self, name):
+        """
+        Returns the (input deck, output) text of a run, output is None if the
+        run didn't write one.
+        """
+        row = self.get_connection().execute("SELECT deck, output FROM runs WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        deck, output = row
+        return zlib.decompress(deck).decode(), zlib.decompress(output).decode() if output is not None else None
+
+    def extract(self, name, directory='.'):
+        """
+        Writes the run's NAME.in and NAME.out files to the directory and
+        returns their paths.
+        """
+        deck, output = self.get_run(name)
+        paths = []
+        for suffix, text in [('.in', deck), ('.out', output)]:
+            if text is None:
+                continue
+            path = os.path.join(directory, name + suffix)
+            with open(path, 'w') as f:
+                f.write(text)
+            paths.append(path)
+        return paths
+
+    def __str__(self):
+        return "Artifact store {:s}: {:d} runs written, {:d} compressed bytes".format(self.path, self.runs, self.bytes_stored)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the ITURHFProp runs in an artifact store or extract their .in/.out files.")
+    parser.add_argument("command", choices=['list', 'extract'])
+    parser.add_argument("store", help="artifact store, e.g. {:s}".format(DEFAULT_ARTIFACTS_FILE))
+    parser.add_argument("--name", help="run name, e.g. 179-3-85")
+    parser.add_argument("--id", type=int, help="D1 path id")
+    parser.add_argument("--freq", type=float, help="frequency (MHz)")
+    parser.add_argument("--year", type=int, help="year as given in the D1 table, e.g. 85")
+    parser.add_argument("--month", type=int)
+    parser.add_argument("-o", "--output-dir", default='.', help="directory the extracted files are written to (default: %(default)s)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.store):
+        parser.error("{:s} doesn't exist".format(args.store))
+    store = ArtifactStore(args.store)
+    runs = store.find_runs(args.name, args.id, args.freq, args.year, args.month)
+    if args.command == 'list':
+        for name, return_code, wall, ids in runs:
+            # Both are NULL for a run that didn't start ITURHFProp, e.g. a
+            # prediction read from the cache
+            return_code = "{:.0f}".format(return_code) if return_code is not None else '-'
+            wall = "{:.2f}s".format(wall) if wall is not None else '-'
+            print("{:s}\tids {:s}\treturn code {:s}\t{:s}".format(name, ids, return_code, wall))
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for name, return_code, wall, ids in runs:
+            for path in store.extract(name, args.output_dir):
+                print(path)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
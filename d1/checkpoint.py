@@ -0,0 +1,169 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Checkpoints of the ITURHFProp runs made while building a prediction table.
+
+Each completed run is appended to a journal (checkpoint.jsonl in the
+working directory) with a hash of its input deck and the size and
+modification time of its output file.  When the table is built again the
+output of a run is read back instead of running ITURHFProp if the deck is
+unchanged, the run succeeded and the output file hasn't been changed
+since.  Runs that failed, are missing from the journal or whose deck has
+changed (e.g. an edited row of the measured table) are run again.
+
+Each entry is written with a single append so the journal may be shared by
+worker processes, and an entry is only written once its run is complete so
+an interrupted build loses at most the runs in progress.
+"""
+
+import hashlib
+import json
+import os
+
+CHECKPOINT_FILE_NAME = 'checkpoint.jsonl'
+
+# The journal entries read by this process, keyed by journal path
+_journals = {}
+
+
+def get_deck_hash(text_in):
+    return hashlib.sha256(text_in.encode()).hexdigest()
+
+
+class Checkpoint:
+
+    def __init__(self, working_dir, file_name=CHECKPOINT_FILE_NAME):
+        self.path = os.path.join(working_dir, file_name)
+        self.entries = _journals[self.path] = self._load()
+        self.reused = 0
+        self.completed = 0
+        self.failed = 0
+
+    def __getstate__(self):
+        # Worker processes count their own runs, the parent adds them to its
+        # own (see add_stats()).  The entries aren't sent with each task,
+        # workers read the journal once (see get_entries()).
+        state = self.__dict__.copy()
+        state['entries'] = None
+        state['reused'] = 0
+        state['completed'] = 0
+        state['failed'] = 0
+        return state
+
+    def _load(self):
+        """
+        Returns the latest journal entry for each output file.  Lines that
+        can't be read, e.g. the last line of an interrupted write, are
+        ignored.
+        """
+        entries = {}
+        try:
+            with open(self.path) as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                        entries[entry['output']] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def get_entries(self):
+        if self.entries is None:
+            if self.path not in _journals:
+                _journals[self.path] = self._load()
+            self.entries = _journals[self.path]
+        return self.entries
+
+    def get(self, output_file, text_in, parse):
+        """
+        Returns the result of parse(output_file) if the output file holds the
+        valid output of a completed run of the deck, otherwise None.
+        """
+        entry = self.get_entries().get(os.path.basename(output_file))
+        if not entry or entry['status'] != 'ok' or entry['deck'] != get_deck_hash(text_in):
+            return None
+        try:
+            st = os.stat(output_file)
+        except OSError:
+            return None
+        if st.st_size != entry['size'] or st.st_mtime_ns != entry['mtime_ns']:
+            return None
+        try:
+            result = parse(output_file)
+        except Exception:
+            return None
+        self.reused += 1
+        return result
+
+    def record(self, output_file, text_in, ok, return_code):
+        """
+        Appends the outcome of a run to the journal.
+        """
+        entry = {'output': os.path.basename(output_file),
+                 'deck': get_deck_hash(text_in),
+                 'status': 'ok' if ok else 'failed',
+                 'return_code': return_code}
+        if ok:
+            st = os.stat(output_file)
+            entry['size'] = st.st_size
+            entry['mtime_ns'] = st.st_mtime_ns
+            self.completed += 1
+        else:
+            self.failed += 1
+        self._append(entry)
+        self.get_entries()[entry['output']] = entry
+
+    def _append(self, entry):
+        data = (json.dumps(entry) + '\n').encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def compact(self):
+        """
+        Rewrites the journal with only the latest entry for each output
+        file.
+        """
+        self.entries = _journals[self.path] = self._load()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as journal:
+            for entry in self.entries.values():
+                journal.write(json.dumps(entry) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def add_stats(self, reused, completed, failed):
+        self.reused += reused
+        self.completed += completed
+        self.failed += failed
+
+    def get_stats(self):
+        return self.reused, self.completed, self.failed
+
+    def __str__(self):
+        return "Checkpoint {:s}: {:d} runs reused, {:d} completed, {:d} failed".format(self.path, self.reused, self.completed, self.failed)
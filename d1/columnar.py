@@ -0,0 +1,261 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Columnar binary cache of the D1 csv tables (measured, predicted and
+residual).
+
+The first time a table is read it's parsed and its columns are saved as
+.npy files in a directory next to the csv file, e.g. residuals.csv.cache/.
+Later reads load the columns memory mapped and don't parse the csv at all,
+as long as the csv file is unchanged (the size and modification time are
+checked first, then a sha256 of the contents).
+
+The text columns are stored as categoricals (int16 codes and the distinct
+strings) so they can be written back exactly as they were read.  Text
+columns holding numbers are also stored as numbers, ints use the smallest
+type that holds them.  The hourly values are float64, with anything that
+isn't a number (e.g. NO_DATA) stored as NaN.  For tables with tx_lat/tx_lng/
+rx_lat/rx_lng columns the numeric coordinates, path midpoint and geomagnetic
+latitude of the midpoint are stored as well.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from geometry import get_geomagnetic_latitude, get_midpoint, parse_lat, parse_lng
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = '.cache'
+
+# The hourly values start at this column
+FIRST_HOUR_COLUMN = 12
+
+LAT_COLUMNS = ['tx_lat', 'rx_lat']
+LNG_COLUMNS = ['tx_lng', 'rx_lng']
+DERIVED_COLUMNS = ['mid_lat', 'mid_lng', 'gm_mid_lat']
+
+
+def get_cache_dir(csv_fn):
+    return csv_fn + CACHE_SUFFIX
+
+
+def get_file_hash(fn):
+    h = hashlib.sha256()
+    with open(fn, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def get_int_dtype(values):
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if values.min() >= info.min and values.max() <= info.max:
+            return dtype
+    return np.int64
+
+
+class ColumnarTable:
+    """
+    The columns of a D1 table.  text holds (codes, categories) for each of
+    the text columns, values the (rows x hours) float64 hourly values and
+    numeric the numeric version of the text columns and the derived
+    columns.
+    """
+
+    def __init__(self, columns, text, values, numeric, first_hour=FIRST_HOUR_COLUMN):
+        self.columns = list(columns)
+        self.first_hour = first_hour
+        self.text = text
+        self.values = values
+        self.numeric = numeric
+
+    @property
+    def hour_columns(self):
+        return self.columns[self.first_hour:]
+
+    def __len__(self):
+        return len(self.values)
+
+    def get_text(self, column):
+        codes, categories = self.text[column]
+        return categories.astype(object)[codes]
+
+    def to_dataframe(self, text=False, derived=False):
+        """
+        Returns the table as a DataFrame with the hourly values as floats.
+        The other columns are numbers where possible, or the original text
+        if text is set.  If derived is set the midpoint columns are
+        appended.
+        """
+        data = {}
+        for column in self.columns[:self.first_hour]:
+            if not text and column in self.numeric:
+                data[column] = self.numeric[column]
+            else:
+                data[column] = self.get_text(column)
+        for idx, column in enumerate(self.hour_columns):
+            data[column] = self.values[:, idx]
+        if derived:
+            for column in DERIVED_COLUMNS:
+                if column in self.numeric:
+                    data[column] = self.numeric[column]
+        return pd.DataFrame(data)
+
+
+def parse_table(csv_fn, first_hour=FIRST_HOUR_COLUMN):
+    """
+    Parses a D1 csv file into a ColumnarTable.  Conversions are made on the
+    distinct values of each text column, not on every row.
+    """
+    df = pd.read_csv(csv_fn, dtype=str, keep_default_na=False, skipinitialspace=True)
+    columns = [column.strip() for column in df.columns]
+    df.columns = columns
+
+    text = {}
+    numeric = {}
+    for column in columns[:first_hour]:
+        codes, categories = pd.factorize(df[column], sort=False)
+        categories = np.asarray(categories, dtype=str)
+        codes = codes.astype(get_int_dtype(np.array([0, len(categories)])))
+        text[column] = (codes, categories)
+        numbers = pd.to_numeric(pd.Series(categories), errors='coerce').to_numpy(dtype=np.float64)
+        if len(numbers) and not np.isnan(numbers).any():
+            if np.all(numbers == np.trunc(numbers)):
+                numbers = numbers.astype(get_int_dtype(numbers))
+            numeric[column] = numbers[codes]
+
+    values = df[columns[first_hour:]].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+
+    if all(column in text for column in LAT_COLUMNS + LNG_COLUMNS):
+        for column in LAT_COLUMNS + LNG_COLUMNS:
+            codes, categories = text[column]
+            parse = parse_lat if column in LAT_COLUMNS else parse_lng
+            numeric[column] = parse(categories)[codes]
+        distance = numeric.get('distance')
+        numeric['mid_lat'], numeric['mid_lng'] = get_midpoint(numeric['tx_lat'], numeric['tx_lng'],
+                                                              numeric['rx_lat'], numeric['rx_lng'],
+                                                              distance)
+        numeric['gm_mid_lat'] = get_geomagnetic_latitude(numeric['mid_lat'], numeric['mid_lng'])
+
+    return ColumnarTable(columns, text, values, numeric, first_hour)
+
+
+def get_source_key(csv_fn):
+    st = os.stat(csv_fn)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def write_cache(csv_fn, table, source_key=None):
+    """
+    Saves the table's columns in the cache directory of csv_fn.  The
+    directory is written under a temporary name and renamed into place.
+    """
+    source_key = dict(source_key or get_source_key(csv_fn))
+    if 'sha256' not in source_key:
+        source_key['sha256'] = get_file_hash(csv_fn)
+    cache_dir = get_cache_dir(csv_fn)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp_', dir=os.path.dirname(os.path.abspath(csv_fn)))
+    try:
+        for idx, column in enumerate(table.columns[:table.first_hour]):
+            codes, categories = table.text[column]
+            np.save(os.path.join(tmp_dir, 'text_{:d}_codes.npy'.format(idx)), codes)
+            np.save(os.path.join(tmp_dir, 'text_{:d}_categories.npy'.format(idx)), categories)
+        np.save(os.path.join(tmp_dir, 'values.npy'), table.values)
+        numeric_columns = list(table.numeric.keys())
+        for idx, column in enumerate(numeric_columns):
+            np.save(os.path.join(tmp_dir, 'numeric_{:d}.npy'.format(idx)), table.numeric[column])
+        meta = {'version': CACHE_VERSION,
+                'source': source_key,
+                'columns': table.columns,
+                'first_hour': table.first_hour,
+                'numeric': numeric_columns}
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.replace(tmp_dir, cache_dir)
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_cache(csv_fn):
+    """
+    Returns the cached ColumnarTable of csv_fn, with the columns memory
+    mapped, or None if there's no cache or the csv file has changed.
+    """
+    cache_dir = get_cache_dir(csv_fn)
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    source_key = get_source_key(csv_fn)
+    cached_key = meta['source']
+    if (cached_key['size'], cached_key['mtime_ns']) != (source_key['size'], source_key['mtime_ns']):
+        # The file may only have been touched
+        if cached_key['size'] != source_key['size'] or cached_key['sha256'] != get_file_hash(csv_fn):
+            return None
+
+    def load(name):
+        return np.load(os.path.join(cache_dir, name), mmap_mode='r')
+
+    columns = meta['columns']
+    first_hour = meta['first_hour']
+    text = {column: (load('text_{:d}_codes.npy'.format(idx)), load('text_{:d}_categories.npy'.format(idx)))
+            for idx, column in enumerate(columns[:first_hour])}
+    numeric = {column: load('numeric_{:d}.npy'.format(idx)) for idx, column in enumerate(meta['numeric'])}
+    return ColumnarTable(columns, text, load('values.npy'), numeric, first_hour)
+
+
+def load_table(csv_fn, use_cache=True):
+    """
+    Returns a ColumnarTable of the csv file, from the cache if it's fresh.
+    Otherwise the file is parsed and the cache written, if possible.
+    """
+    if use_cache:
+        table = load_cache(csv_fn)
+        if table is not None:
+            return table
+    # Key the cache on the file as it was before it was parsed
+    source_key = get_source_key(csv_fn)
+    source_key['sha256'] = get_file_hash(csv_fn)
+    table = parse_table(csv_fn)
+    if use_cache:
+        try:
+            write_cache(csv_fn, table, source_key)
+        except OSError as e:
+            print("Unable to write the table cache for {:s}: {:s}".format(csv_fn, str(e)), file=sys.stderr)
+    return table
@@ -7,69 +7,65 @@ as input (i.e. produced by script '40').
 
 The default values below bin the errors into 6dB chunks, centred about zero.
 """
-import pandas as pd
+import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-import sys
 
-def rmse(residuals): 
-    return np.sqrt(np.mean([i ** 2 for i in residuals]))
-    #return np.sqrt(sum([i ** 2 for i in residuals]) / len(residuals))
+from streamstats import get_residual_stats
 
 
 # Constants
 BIN_WIDTH = 6
 CLIP_LOWER = -99.0
 CLIP_UPPER = 99.0
+# Histogram colours when comparing several files
+FACE_COLOURS = ['green', 'blue', 'orange', 'purple', 'grey']
 
-values = []
+parser = argparse.ArgumentParser(description="Plot the distribution of the residuals in one or more difference tables.")
+parser.add_argument("difference_tables", nargs='+', metavar="difference_table.csv")
+parser.add_argument("-o", "--output", default="distribution.png", help="plot file name (default: %(default)s)")
+parser.add_argument("--show", action='store_true', help="show the plot in a window as well as saving it")
+parser.add_argument("--no-plot", action='store_true', help="only print the statistics")
+args = parser.parse_args()
 
-if len(sys.argv) != 2:
-    print("USAGE:")
-    print("python3 createDifferenceCSV.py difference_table.csv")
-    sys.exit(1)
+fns = args.difference_tables
 
-df = pd.read_csv(sys.argv[1])
+bin_limits = np.arange(CLIP_LOWER, CLIP_UPPER+BIN_WIDTH, BIN_WIDTH)
 
 """
-Extract data for each hour as a series in which '(no data)' is converted to NaN,
-which is then dropped from the series before conversion to a list.  The final
-list ('values') contains only the numeric elements of the hourly predictions.
+The files are read a chunk at a time, '(no data)' values are ignored.  The
+count, mean, std.dev and RMSE are of the values before clipping, the values
+are clipped before they're added to the histogram.
 """
-for col in df.ix[:,'1:00':'24:00']:
-    values.extend(pd.to_numeric(df[col], errors='coerce').dropna().tolist())
-
-#print(values)
-
-#Calculate the mean and std.dev before clipping...
-count = len(values)
-mean = np.mean(values)
-std_dev = np.std(values)
-rmse = rmse(values)
-
-values = np.clip(values, CLIP_LOWER, CLIP_UPPER)
-
-bin_limits = np.arange(CLIP_LOWER, CLIP_UPPER+BIN_WIDTH, BIN_WIDTH)
-
-n, bins, patches = plt.hist(values, bin_limits, facecolor='green', alpha=0.5)
-
-print("         Bin             Count")
-print("-----------------------------------")
-for bin_num in range(0, len(bin_limits)-1):
-    percentage = 100 *(n[bin_num] / count)
-    print("{:5.1f}dB <--> {:5.1f}dB: {:4.0f} ({:.1f}%)".format(bins[bin_num], bins[bin_num+1], n[bin_num], percentage))
-print("\nMean: {:.2f} SD: {:.2f} RMSE: {:.2f}".format(mean, std_dev, rmse))
-
-plt.ylim([0,5000])
-
-plt.axvline(x=mean, color='r')
-plt.axvline(x=mean-std_dev, ls='dashed', color='r')
-plt.axvline(x=mean+std_dev, ls='dashed', color='r')
-
-plt.xlabel('Error (dB)'.format(len(values), mean, std_dev))
-plt.ylabel('Count')
-plt.title('Predicted vs. Measured Field Strength')
-bbox_props = dict(fc="white", ec="k", lw=1)
-summary = "Count = {:d}\nMean = {:.2f}\n$\sigma$ = {:.2f}".format(count, mean, std_dev)
-plt.text(-90,3400, summary, bbox=bbox_props)
-plt.show()
+all_stats = get_residual_stats(fns, bin_limits, CLIP_LOWER, CLIP_UPPER)
+
+for fn, stats in zip(fns, all_stats):
+    if len(fns) > 1:
+        print("\n{:s}".format(fn))
+    print("         Bin             Count")
+    print("-----------------------------------")
+    for bin_num in range(0, len(bin_limits)-1):
+        percentage = 100 *(stats.bin_counts[bin_num] / stats.count)
+        print("{:5.1f}dB <--> {:5.1f}dB: {:4.0f} ({:.1f}%)".format(bin_limits[bin_num], bin_limits[bin_num+1], stats.bin_counts[bin_num], percentage))
+    print("\nMean: {:.2f} SD: {:.2f} RMSE: {:.2f}".format(stats.mean, stats.std, stats.rmse))
+
+# Only the bin counts are passed to the plot
+plot_spec = {'file_name': args.output,
+            'bin_edges': bin_limits,
+            'series': [{'label': fn,
+                        'colour': FACE_COLOURS[idx % len(FACE_COLOURS)],
+                        'bin_counts': stats.bin_counts,
+                        'count': stats.count,
+                        'mean': stats.mean,
+                        'std': stats.std} for idx, (fn, stats) in enumerate(zip(fns, all_stats))]}
+
+if args.show:
+    import matplotlib.pyplot as plt
+    from plots import draw_dist_plot
+    fig = plt.figure()
+    draw_dist_plot(fig, plot_spec)
+    fig.savefig(args.output)
+    plt.show()
+elif not args.no_plot:
+    # Only import matplotlib if there's something to plot
+    from plots import render_dist_plot
+    render_dist_plot(plot_spec)
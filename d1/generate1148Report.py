@@ -31,22 +31,21 @@ https://www.itu.int/dms_pubrec/itu-r/rec/p/R-REC-P.1148-1-199705-I!!PDF-E.pdf
 
 """
 
+import argparse
 import math
+import os
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import sys
 
-# Earth radius
-R0 = 6371.0
-GeoMagPolelat = math.radians(78.5)
-GeoMagPolelng = math.radians(-68.2)
+from columnar import DERIVED_COLUMNS, load_table
+from stratify import Stratification, get_member_index
 
 #######################################
-# This function originally appeared in the ITU suite of scripts
+# This function originally appeared in the ITU suite of scripts,
+# modified here to accept an array of months
 #######################################
 def eot(month, day=15):
-        doty = [ 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334 ]
+        doty = np.array([ 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334 ])
         #D2R = math.pi/180.0
 
         # Earth's mean angular orbital velocity
@@ -54,18 +53,18 @@ def eot(month, day=15):
 
         # The angle the earth has moved in it's orbit from the December solstice to date D
         # the approximate number of days between the Dec solstice and Jan 1st is 10 days
-        D = doty[month-1] + day
+        D = doty[np.asarray(month)-1] + day
         A = W*(D + 10) # radians
 
         # The angle the Earth has moved from the Dec solstice, including the correction for the Earth's orbital eccentricity, 0.0167
         # The number 12 is the number of days from the solstice to the Earth's perihelion
-        B = A + (0.0167*math.sin(A - (12.0*W)))
+        B = A + (0.0167*np.sin(A - (12.0*W)))
 
         # The difference between the angles moved and the mean speed
-        C = (A - math.atan2(math.tan(B), math.cos(math.radians(23.44))))/math.pi
+        C = (A - np.arctan2(np.tan(B), math.cos(math.radians(23.44))))/math.pi
 
         # The equation of time is then
-        return(4.0*math.pi*(C - (int(C + 0.5)))) # minutes
+        return(4.0*math.pi*(C - (np.trunc(C + 0.5)))) # minutes
 
 
 def mode_sort_key(item):
@@ -94,384 +93,367 @@ def mode_sort_key(item):
         prec = 0
     return key
 
-def get_subgroups(df, field, limits):
-    vals = []
-    for limit in limits:
-        subgroup = df.loc[((abs(df[field]) > limit[0]) & (abs(df[field]) <= limit[1])), 'er_0100':'er_2400'].values.ravel()
-        vals.append(subgroup[np.logical_not(np.isnan(subgroup))])
-    return vals
-
-
-def get_abs_subgroups(df, field, limits):
-    vals = []
-    for limit in limits:
-        subgroup = df.loc[((df[field] > limit[0]) & (df[field] <= limit[1])), 'er_0100':'er_2400'].values.ravel()
-        vals.append(subgroup[np.logical_not(np.isnan(subgroup))])
-    return vals
-
-
-def get_season_subgroups(df, field, seasons):
-    vals = []
-    for season in seasons:
-        subgroup = df.loc[((df['mid_lat'] >= 0) & (df['month'].isin(season[0]))) | ((df['mid_lat'] < 0) & (df['month'].isin(season[1]))), 'er_0100':'er_2400'].values.ravel()
-        vals.append(subgroup[np.logical_not(np.isnan(subgroup))])
-    return vals
-
-
-def midPoint(row):
-    # Find the path mid point
-    tx_lat = math.radians(row['tx_lat'])
-    tx_lng = math.radians(row['tx_lng'])
-    rx_lat = math.radians(row['rx_lat'])
-    rx_lng = math.radians(row['rx_lng'])
-    d = row['distance']/R0
-    A = math.sin(0.5*d)/math.sin(d)
-    B = math.sin(0.5*d)/math.sin(d)
-    x = A*math.cos(tx_lat)*math.cos(tx_lng) +  B*math.cos(rx_lat)*math.cos(rx_lng)
-    y = A*math.cos(tx_lat)*math.sin(tx_lng) +  B*math.cos(rx_lat)*math.sin(rx_lng)
-    z = A*math.sin(tx_lat) +  B*math.sin(rx_lat)
-    mid_lat = math.atan2(z,math.sqrt(math.pow(x,2)+math.pow(y,2)))
-    mid_lng = math.atan2(y,x)
-    gm_mid_lat = math.fabs(math.asin(math.sin(mid_lat)*math.sin(GeoMagPolelat) + math.cos(mid_lat)*math.cos(GeoMagPolelat)*math.cos(mid_lng - GeoMagPolelng)));
-
-    return pd.Series({'mid_lat': math.degrees(mid_lat),
-                        'mid_lng': math.degrees(mid_lng),
-                        'gm_mid_lat':math.degrees(gm_mid_lat)})
-
-clean_lat = lambda lat: float(lat[:-1]) if lat.endswith('N') else float('-'+lat[:-1])
-clean_lng = lambda lng: float(lng[:-1]) if lng.endswith('E') else float('-'+lng[:-1])
-
-#######################################################################
-# START
-#######################################################################
-
-if len(sys.argv) not in (2, 3):
-    print("USAGE:")
-    print("python3 create1148BoxPlots.py residual_table.csv mode_table.csv")
-    sys.exit(1)
-
-do_mode_analysis = True if len(sys.argv)==3 else False
-
-df = pd.read_csv(sys.argv[1], na_values='NO_DATA')
-df.columns = ["id", "tx", "rx", "freq", "tx_lat", "tx_lng", "rx_lat", "rx_lng", "distance", "ssn", "year", "month", "er_0100", "er_0200", "er_0300", "er_0400", "er_0500", "er_0600", "er_0700", "er_0800", "er_0900", "er_1000", "er_1100", "er_1200", "er_1300", "er_1400", "er_1500", "er_1600", "er_1700", "er_1800", "er_1900", "er_2000", "er_2100", "er_2200", "er_2300", "er_2400"]
-
-df['tx_lat'] = df['tx_lat'].apply(clean_lat)
-df['tx_lng'] = df['tx_lng'].apply(clean_lat)
-df['rx_lat'] = df['rx_lat'].apply(clean_lat)
-df['rx_lng'] = df['rx_lng'].apply(clean_lat)
-
-if do_mode_analysis:
-    old_fields = ['{:d}:00'.format(v) for v in range(1, 24)]
-    old_fields.append('24:00:00')
-    new_fields = ['m_{:0>2d}00'.format(v) for v in range(1, 25)]
-    mode_df = pd.read_csv(sys.argv[2], usecols=old_fields)
-    mode_df.columns = new_fields
-    df = pd.concat([df, mode_df], axis=1)
-
-mid_points_df = df.apply (lambda row: midPoint (row),axis=1)
-df = pd.concat([df, mid_points_df], axis=1)
-
-df.to_csv('p1148.csv')
-str_buf = []
-str_buf.append("{:30s}{:>10s}{:>10s}{:>10s}".format("", "Count", "Mean", "SD"))
+def get_mode_stats(df, max_distance=7000):
+    """
+    Returns a tuple of DataFrames, indexed by mode, holding the count, mean
+    and standard deviation of the residuals on paths shorter than
+    max_distance and on all paths.  The (mode, residual) pairs of all 24
+    hours are reduced to sums with a single groupby, both sets of
+    statistics are derived from the sums.
+    """
+    modes = df.loc[:, 'm_0100':'m_2400'].values.ravel()
+    residuals = df.loc[:, 'er_0100':'er_2400'].values.astype(float).ravel()
+    is_short = np.repeat((df['distance'] < max_distance).values, 24)
+    valid = ~np.isnan(residuals)
+    long_df = pd.DataFrame({'mode': modes[valid],
+                            'short': is_short[valid],
+                            'er': residuals[valid],
+                            'er2': residuals[valid]**2})
+    sums = long_df.groupby(['mode', 'short']).agg(count=('er', 'size'), sum=('er', 'sum'), sumsq=('er2', 'sum'))
+
+    def get_stats(sums):
+        stats = pd.DataFrame({'count': sums['count']})
+        stats['mean'] = sums['sum'] / sums['count']
+        stats['std'] = np.sqrt(np.maximum(sums['sumsq'] / sums['count'] - stats['mean']**2, 0))
+        return stats
+
+    short_sums = sums[sums.index.get_level_values('short')].droplevel('short')
+    return get_stats(short_sums), get_stats(sums.groupby(level='mode').sum())
+
+
+def get_sorted_modes(df, rows=slice(None)):
+    modes = [mode for mode in pd.unique(df.loc[rows, 'm_0100':'m_2400'].values.ravel()) if isinstance(mode, str)]
+    return sorted(modes, key=mode_sort_key)
+
+
+def format_mode_stats(stats, modes):
+    buf = []
+    stats = stats.reindex(modes)
+    for mode, row in stats.iterrows():
+        count = 0 if np.isnan(row['count']) else int(row['count'])
+        buf.append("Mode: {:<24s}{:>10d}{:>10.2f}{:>10.2f}".format(mode, count, row['mean'], row['std']))
+    return buf
+
+
+COLUMN_NAMES = ["id", "tx", "rx", "freq", "tx_lat", "tx_lng", "rx_lat", "rx_lng", "distance", "ssn", "year", "month", "er_0100", "er_0200", "er_0300", "er_0400", "er_0500", "er_0600", "er_0700", "er_0800", "er_0900", "er_1000", "er_1100", "er_1200", "er_1300", "er_1400", "er_1500", "er_1600", "er_1700", "er_1800", "er_1900", "er_2000", "er_2100", "er_2200", "er_2300", "er_2400"]
+
+DATA_ORIGINS = {'Germany':(8, 9, 10, 11, 12, 13, 16, 17, 18, 19, 20, 21, 22, 23, 24,
+                        25, 26, 27, 28, 29, 30, 41, 42, 43, 44, 50, 72, 75, 76, 94,
+                        95, 96, 97, 98, 99, 103, 104, 105, 106, 107, 111, 112, 113,
+                        114, 115, 116, 131, 132, 133, 134, 135, 137, 138, 139, 142,
+                        143, 144, 145, 161, 162, 163, 164, 165, 166, 167, 168, 170,
+                        171, 172, 173, 175, 176, 177, 178),
+                'Japan':(3, 4, 5, 6, 33, 102, 136, 152, 157, 158, 159, 160, 180, 181),
+                'China':(31, 34, 35, 36, 37, 38, 39, 40, 45, 46, 47, 62, 63, 64, 65,
+                        66, 80, 81, 82, 83, 108, 120, 122, 123, 124, 125, 149),
+                'India':(2, 7, 32, 49, 52, 53, 54, 55, 58, 59, 61, 67, 68, 69, 70, 77,
+                        78, 79, 117, 118, 128, 150),
+                'Deutsche Welle':(1, 14, 15, 51, 73, 74, 90, 91, 92, 129, 130, 148,
+                        174),
+                'BBC/EBU':(56, 57, 60, 71, 84, 85, 86, 87, 88, 89, 93, 100, 101, 109,
+                        110, 119, 121, 126, 127, 140, 141, 146, 147, 151, 153, 154,
+                        155, 156, 169, 179),
+                'Australia':(48,)}
+
+
+def read_report_table(residual_fn, mode_fn=None):
+    """
+    Returns a DataFrame of the residual table, with the predicted modes if
+    a mode table is given, and the path midpoints.
+    """
+    # The coordinates are parsed and the path midpoints found when the table
+    # is cached
+    table = load_table(residual_fn)
+    df = table.to_dataframe()
+    df.columns = COLUMN_NAMES
+
+    if mode_fn:
+        old_fields = ['{:d}:00'.format(v) for v in range(1, 24)]
+        old_fields.append('24:00:00')
+        new_fields = ['m_{:0>2d}00'.format(v) for v in range(1, 25)]
+        mode_df = pd.read_csv(mode_fn, usecols=old_fields)
+        mode_df.columns = new_fields
+        df = pd.concat([df, mode_df], axis=1)
+
+    for column in DERIVED_COLUMNS:
+        df[column] = table.numeric[column]
+    return df
+
+
+"""
+Each of the report sections appends its lines to str_buf.  If box_plots
+isn't None the section's box plot, if it has one, is appended to it as a
+spec for plots.render_box_plot().
+"""
 
 ##################################
 # FREQUENCY
 ##################################
-groups = [(2, 5), (5, 10), (10, 15), (15, 30)]
-box_data = get_subgroups(df, 'freq', groups)
-labels = ["{:d}-{:d}MHz\n({:d})".format(g[0], g[1],len(s)) for g,s in zip(groups, box_data)]
-
-plt.boxplot(box_data, showmeans=True, labels=labels)
-plt.axhline(y=0, color='r')
-plt.ylim(-80, 80)
-plt.xlabel('Frequency Group')
-plt.ylabel('Residual (dB)')
-plt.tight_layout()
-plt.savefig('freq.png')
-plt.clf()
-
-str_buf.append("Frequency groups (MHz):")
-for g,s in zip(groups, box_data):
-    str_buf.append("{:>5d} \u2264 f < {:<18d}{:>10d}{:>10.2f}{:>10.2f}".format(g[0], g[1], len(s), np.mean(s), np.std(s)))
+
+def frequency_section(df, strata, str_buf, box_plots=None):
+    groups = [(2, 5), (5, 10), (10, 15), (15, 30)]
+    strata.add_range('freq', np.abs(df['freq']), groups)
+    stats = strata.get_stats('freq')
+
+    if box_plots is not None:
+        labels = ["{:d}-{:d}MHz\n({:d})".format(g[0], g[1], n) for g,n in zip(groups, stats['count'])]
+        box_plots.append({'file_name': 'freq.png', 'data': strata.get_samples('freq'), 'labels': labels, 'xlabel': 'Frequency Group'})
+
+    str_buf.append("Frequency groups (MHz):")
+    for g,(idx, s) in zip(groups, stats.iterrows()):
+        str_buf.append("{:>5d} \u2264 f < {:<18d}{:>10d}{:>10.2f}{:>10.2f}".format(g[0], g[1], int(s['count']), s['mean'], s['std']))
+
 
 ##################################
 # DISTANCE
 ##################################
 
-groups =[(0, 1000), (1000, 2000), (2000, 3000),
-        (3000, 4000), (4000, 5000), (5000, 7000),
-        (7000, 9000), (9000, 12000), (12000, 15000),
-        (15000, 18000), (18000, 22000), (22000, 40000)]
-box_data = get_subgroups(df, 'distance', groups)
-labels = ["{:d}-\n{:d}\n({:d})".format(g[0], g[1],len(s)) for g,s in zip(groups, box_data)]
-
-plt.boxplot(box_data, showmeans=True, labels=labels)
-plt.axhline(y=0, color='r')
-plt.ylim(-80, 80)
-plt.xlabel('Distance Group')
-plt.ylabel('Residual (dB)')
-plt.tight_layout()
-plt.savefig('dist.png')
-plt.clf()
-
-str_buf.append("\nDistance (km):")
-for g,s in zip(groups, box_data):
-    if len(s):
-        str_buf.append("{:>5d} \u2264 d < {:<18d}{:>10d}{:>10.2f}{:>10.2f}".format(g[0], g[1], len(s), np.mean(s), np.std(s)))
-    else:
-        str_buf.append("{:>5d} \u2264 d < {:<18d}{:>10d}{:>10s}{:>10s}".format(g[0], g[1], len(s), '---', '---'))
+def distance_section(df, strata, str_buf, box_plots=None):
+    groups =[(0, 1000), (1000, 2000), (2000, 3000),
+            (3000, 4000), (4000, 5000), (5000, 7000),
+            (7000, 9000), (9000, 12000), (12000, 15000),
+            (15000, 18000), (18000, 22000), (22000, 40000)]
+    strata.add_range('distance', np.abs(df['distance']), groups)
+    stats = strata.get_stats('distance')
+
+    if box_plots is not None:
+        labels = ["{:d}-\n{:d}\n({:d})".format(g[0], g[1], n) for g,n in zip(groups, stats['count'])]
+        box_plots.append({'file_name': 'dist.png', 'data': strata.get_samples('distance'), 'labels': labels, 'xlabel': 'Distance Group'})
+
+    str_buf.append("\nDistance (km):")
+    for g,(idx, s) in zip(groups, stats.iterrows()):
+        if s['count']:
+            str_buf.append("{:>5d} \u2264 d < {:<18d}{:>10d}{:>10.2f}{:>10.2f}".format(g[0], g[1], int(s['count']), s['mean'], s['std']))
+        else:
+            str_buf.append("{:>5d} \u2264 d < {:<18d}{:>10d}{:>10s}{:>10s}".format(g[0], g[1], 0, '---', '---'))
+
 
 ##################################
 # GEO LATITUDE
 ##################################
 
-groups =[(0, 20), (20, 40), (40, 60), (60, 90)]
-box_data = get_abs_subgroups(df, 'gm_mid_lat', groups)
-labels = ["{:d}-{:d}\n({:d})".format(g[0], g[1],len(s)) for g,s in zip(groups, box_data)]
+def geomagnetic_latitude_section(df, strata, str_buf, box_plots=None):
+    groups =[(0, 20), (20, 40), (40, 60), (60, 90)]
+    strata.add_range('gm_lat', df['gm_mid_lat'], groups)
+    stats = strata.get_stats('gm_lat')
 
-plt.boxplot(box_data, showmeans=True, labels=labels)
-plt.axhline(y=0, color='r')
-plt.ylim(-80, 80)
-plt.xlabel('Geo Latitude')
-plt.ylabel('Residual (dB)')
-plt.tight_layout()
-plt.savefig('geolat.png')
-plt.clf()
+    if box_plots is not None:
+        labels = ["{:d}-{:d}\n({:d})".format(g[0], g[1], n) for g,n in zip(groups, stats['count'])]
+        box_plots.append({'file_name': 'geolat.png', 'data': strata.get_samples('gm_lat'), 'labels': labels, 'xlabel': 'Geo Latitude'})
 
-
-str_buf.append("\nGeomagnetic latitude (degrees) at path midpoint:")
-for g,s in zip(groups, box_data):
-    range_str = "".format(g[0], g[1])
-    str_buf.append("{:>2d}\u00B0 \u2264 \u03D5 \u2264 {:<2d}\u00B0{:<17s}{:>10d}{:>10.2f}{:>10.2f}".format(g[0], g[1], "", len(s), np.mean(s), np.std(s)))
+    str_buf.append("\nGeomagnetic latitude (degrees) at path midpoint:")
+    for g,(idx, s) in zip(groups, stats.iterrows()):
+        str_buf.append("{:>2d}\u00B0 \u2264 \u03D5 \u2264 {:<2d}\u00B0{:<17s}{:>10d}{:>10.2f}{:>10.2f}".format(g[0], g[1], "", int(s['count']), s['mean'], s['std']))
 
 
 ##################################
 # SSN
 ##################################
 
-groups =[(0, 15), (15, 45), (45, 75), (75, 105), (105, 150), (150, 300)]
-box_data = get_subgroups(df, 'ssn', groups)
-labels = ["{:d}-{:d}\n({:d})".format(g[0], g[1],len(s)) for g,s in zip(groups, box_data)]
-
-plt.boxplot(box_data, showmeans=True, labels=labels)
-plt.axhline(y=0, color='r')
-plt.ylim(-80, 80)
-plt.xlabel('SSN Group')
-plt.ylabel('Residual (dB)')
-plt.tight_layout()
-plt.savefig('ssn.png')
-plt.clf()
+def ssn_section(df, strata, str_buf, box_plots=None):
+    groups =[(0, 15), (15, 45), (45, 75), (75, 105), (105, 150), (150, 300)]
+    strata.add_range('ssn', np.abs(df['ssn']), groups)
+    stats = strata.get_stats('ssn')
 
-str_buf.append("\nSunspot number:")
-for g,s in zip(groups, box_data):
-    str_buf.append("{:>3d} \u2264 R12 < {:<18d}{:>10d}{:>10.2f}{:>10.2f}".format(g[0], g[1], len(s), np.mean(s), np.std(s)))
+    if box_plots is not None:
+        labels = ["{:d}-{:d}\n({:d})".format(g[0], g[1], n) for g,n in zip(groups, stats['count'])]
+        box_plots.append({'file_name': 'ssn.png', 'data': strata.get_samples('ssn'), 'labels': labels, 'xlabel': 'SSN Group'})
 
+    str_buf.append("\nSunspot number:")
+    for g,(idx, s) in zip(groups, stats.iterrows()):
+        str_buf.append("{:>3d} \u2264 R12 < {:<18d}{:>10d}{:>10.2f}{:>10.2f}".format(g[0], g[1], int(s['count']), s['mean'], s['std']))
 
 
 ##################################
 # SEASONS
 ##################################
 
-# Winter, Spring, Summer, Autumn
-# Tuples for the Northern Hemisphere and the Southern
-label_str = ['Winter', 'Spring', 'Summer', 'Autumn']
-groups =[((11, 12, 1, 2), (5, 6, 7, 8)), ((3, 4), (9, 10)), ((5, 6, 7, 8), (11, 12, 1, 2)), ((9, 10), (3, 4))]
-box_data = get_season_subgroups(df, 'month', groups)
-labels = ["{:s}\n({:d})".format(g, len(s)) for g,s in zip(label_str, box_data)]
+def season_section(df, strata, str_buf, box_plots=None):
+    # Winter, Spring, Summer, Autumn
+    # Tuples for the Northern Hemisphere and the Southern
+    label_str = ['Winter', 'Spring', 'Summer', 'Autumn']
+    groups =[((11, 12, 1, 2), (5, 6, 7, 8)), ((3, 4), (9, 10)), ((5, 6, 7, 8), (11, 12, 1, 2)), ((9, 10), (3, 4))]
+    # The season is taken from the hemisphere of the path midpoint
+    strata.add_dimension('season',
+                        np.where(df['mid_lat'] >= 0,
+                                get_member_index(df['month'], [g[0] for g in groups]),
+                                get_member_index(df['month'], [g[1] for g in groups])),
+                        len(groups))
+    stats = strata.get_stats('season')
 
-plt.boxplot(box_data, showmeans=True, labels=labels)
-plt.axhline(y=0, color='r')
-plt.ylim(-80, 80)
-plt.xlabel('Season (at path midpoint)')
-plt.ylabel('Residual (dB)')
+    if box_plots is not None:
+        labels = ["{:s}\n({:d})".format(g, n) for g,n in zip(label_str, stats['count'])]
+        box_plots.append({'file_name': 'seasons.png', 'data': strata.get_samples('season'), 'labels': labels, 'xlabel': 'Season (at path midpoint)'})
 
-plt.savefig('seasons.png')
-plt.clf()
-
-str_buf.append("\nSeason at path midpoint:")
-for g,s in zip(label_str, box_data):
-    str_buf.append("{:<25s}{:>15d}{:>10.2f}{:>10.2f}".format(g, len(s), np.mean(s), np.std(s)))
+    str_buf.append("\nSeason at path midpoint:")
+    for g,(idx, s) in zip(label_str, stats.iterrows()):
+        str_buf.append("{:<25s}{:>15d}{:>10.2f}{:>10.2f}".format(g, int(s['count']), s['mean'], s['std']))
 
 
 ##################################
 # LOCAL TIME AT MID-POINT
 ##################################
 
-str_buf.append("\nLocal time at path midpoint (h):")
-
-# Use 1-24 to avoid confusion
-vals = [[] for i in range(24)]
-hour_step = 4
-box_data = []
-labels = ["{:d}-{:d}".format(h, h+hour_step) for h in range(0, 24, hour_step)]
-
-for index, row in df.iterrows():
-    #print("Lng: {:.2f}".format(row['mid_lng']))
-    ltimeoffset = eot(row['month'])/60.0 + (row['mid_lng']/15.0)
-    for colname, col in row['er_0100':'er_2400'].iteritems():
-        #print("{:.2f} {:.2f}".format(float(colname[3:5]), ltimeoffset))
-        ltime = float(colname[3:5]) + ltimeoffset
-        if(ltime > 24):
-            ltime = ltime - 24
-        elif(ltime <= 0):
-            ltime = ltime + 24
-        if not math.isnan(col):
-            vals[math.floor(ltime)].append(col)
-
-for h in range(0, 24, hour_step):
-    sample = [item for sublist in vals[h:h+hour_step] for item in sublist]
-    str_buf.append(">{:0>2d}00-{:0>2d}00{:>30d}{:>10.2f}{:10.2f}".format(h, h+hour_step,
-                                                                    len(sample),
-                                                                    np.mean(sample),
-                                                                    np.std(sample)))
-    box_data.append(sample)
-
-plt.boxplot(box_data, showmeans=True, labels=labels)
-plt.axhline(y=0, color='r')
-plt.ylim(-80, 80)
-plt.xlabel('Local time at path midpoint (h)')
-plt.ylabel('Residual (dB)')
-plt.tight_layout()
-plt.savefig('local_time.png')
-plt.clf()
+def local_time_section(df, strata, str_buf, box_plots=None):
+    str_buf.append("\nLocal time at path midpoint (h):")
+
+    # Use 1-24 to avoid confusion
+    hour_step = 4
+    labels = ["{:d}-{:d}".format(h, h+hour_step) for h in range(0, 24, hour_step)]
+
+    # Local time of each residual, a (rows x 24) matrix of the UTC hour plus
+    # each row's offset, wrapped into the range 0-24.
+    er_values = df.loc[:, 'er_0100':'er_2400'].values.astype(float)
+    ltimeoffset = eot(df['month'].values)/60.0 + (df['mid_lng'].values/15.0)
+    ltime = np.arange(1, 25) + ltimeoffset[:, np.newaxis]
+    ltime = np.where(ltime > 24, ltime - 24, np.where(ltime <= 0, ltime + 24, ltime))
+
+    # Sort the residuals by local time group and split them into samples
+    valid = ~np.isnan(er_values)
+    ltime_group = np.minimum(np.floor(ltime[valid]).astype(int) // hour_step, (24 // hour_step) - 1)
+    order = np.argsort(ltime_group, kind='stable')
+    group_counts = np.bincount(ltime_group, minlength=24 // hour_step)
+    samples = np.split(er_values[valid][order], np.cumsum(group_counts)[:-1])
+
+    for h, sample in zip(range(0, 24, hour_step), samples):
+        str_buf.append(">{:0>2d}00-{:0>2d}00{:>30d}{:>10.2f}{:10.2f}".format(h, h+hour_step,
+                                                                        len(sample),
+                                                                        np.mean(sample),
+                                                                        np.std(sample)))
+
+    if box_plots is not None:
+        box_plots.append({'file_name': 'local_time.png', 'data': samples, 'labels': labels, 'xlabel': 'Local time at path midpoint (h)'})
 
 
 ##################################
 # MODES
 ##################################
 
-if do_mode_analysis:
-    str_buf.append("\nModes (Paths < 7000km):")
-    modes = pd.unique(df.loc[(df['distance'] < 7000),'m_0100':'m_2400'].values.ravel()).tolist()
-    modes = sorted(modes, key=mode_sort_key)
-    mode_residuals = []
-    for mode in modes:
-        vals = []
-        for utc in range(1, 24+1):
-            er_col_name = 'er_{:0>2d}00'.format(utc)
-            m_col_name = 'm_{:0>2d}00'.format(utc)
-            subgroup = df.loc[(df[m_col_name]==mode) & (df['distance'] < 7000)][er_col_name].values.ravel().tolist()
-            vals = vals + subgroup
-        str_buf.append("Mode: {:<24s}{:>10d}{:>10.2f}{:>10.2f}".format(mode,
-                                                                        np.count_nonzero(~np.isnan(vals)),
-                                                                        np.nanmean(vals),
-                                                                        np.nanstd(vals)))
-    """
-    print("modes in the range 3-4000km")
+def modes_section(df, strata, str_buf, box_plots=None):
+    # Requires the mode table
+    if 'm_0100' not in df.columns:
+        return
+    short_mode_stats, all_mode_stats = get_mode_stats(df)
     str_buf.append("\nModes (Paths < 7000km):")
-    modes = pd.unique(df.loc[(df['distance'] > 3000) & (df['distance'] <= 4000),'m_0100':'m_2400'].values.ravel()).tolist()
-    modes = sorted(modes, key=mode_sort_key)
-    mode_residuals = []
-    for mode in modes:
-        vals = []
-        for utc in range(1, 24+1):
-            er_col_name = 'er_{:0>2d}00'.format(utc)
-            m_col_name = 'm_{:0>2d}00'.format(utc)
-            subgroup = df.loc[(df[m_col_name]==mode) & (df['distance'] > 3000) & (df['distance'] <= 4000)][er_col_name].values.ravel().tolist()
-            vals = vals + subgroup
-        print("Mode: {:<24s}{:>10d}{:>10.2f}{:>10.2f}".format(mode,
-                                                                        np.count_nonzero(~np.isnan(vals)),
-                                                                        np.nanmean(vals),
-                                                                        np.nanstd(vals)))
-    """
+    str_buf.extend(format_mode_stats(short_mode_stats, get_sorted_modes(df, df['distance'] < 7000)))
 
     #ITURHFProp doesn't include modes for paths > 7000km.  If thre are no
     # modes then skip this section
     if len(pd.unique(df.loc[(df['distance'] >= 7000),'m_0100':'m_2400'].values.ravel()).tolist()) > 1:
         str_buf.append("\nModes (All Paths):")
-        modes = pd.unique(df.loc[:,'m_0100':'m_2400'].values.ravel()).tolist()
-        modes = sorted(modes, key=mode_sort_key)
-        mode_residuals = []
-        for mode in modes:
-            #print(mode)
-            vals = []
-            for utc in range(1, 24+1):
-                er_col_name = 'er_{:0>2d}00'.format(utc)
-                m_col_name = 'm_{:0>2d}00'.format(utc)
-                subgroup = df.loc[df[m_col_name]==mode][er_col_name].values.ravel().tolist()
-                #print(subgroup)
-                vals = vals + subgroup
-            str_buf.append("Mode: {:<24s}{:>10d}{:>10.2f}{:>10.2f}".format(mode,
-                                                                        np.count_nonzero(~np.isnan(vals)),
-                                                                        np.nanmean(vals),
-                                                                        np.nanstd(vals)))
+        str_buf.extend(format_mode_stats(all_mode_stats, get_sorted_modes(df)))
+
 
 ##################################
 # DATA ORIGIN
 ##################################
 
-str_buf.append("\nOrigin of Data:")
-data_origin_dict = {'Germany':(8, 9, 10, 11, 12, 13, 16, 17, 18, 19, 20, 21, 22, 23, 24,
-                        25, 26, 27, 28, 29, 30, 41, 42, 43, 44, 50, 72, 75, 76, 94,
-                        95, 96, 97, 98, 99, 103, 104, 105, 106, 107, 111, 112, 113,
-                        114, 115, 116, 131, 132, 133, 134, 135, 137, 138, 139, 142,
-                        143, 144, 145, 161, 162, 163, 164, 165, 166, 167, 168, 170,
-                        171, 172, 173, 175, 176, 177, 178),
-                'Japan':(3, 4, 5, 6, 33, 102, 136, 152, 157, 158, 159, 160, 180, 181),
-                'China':(31, 34, 35, 36, 37, 38, 39, 40, 45, 46, 47, 62, 63, 64, 65,
-                        66, 80, 81, 82, 83, 108, 120, 122, 123, 124, 125, 149),
-                'India':(2, 7, 32, 49, 52, 53, 54, 55, 58, 59, 61, 67, 68, 69, 70, 77,
-                        78, 79, 117, 118, 128, 150),
-                'Deutsche Welle':(1, 14, 15, 51, 73, 74, 90, 91, 92, 129, 130, 148,
-                        174),
-                'BBC/EBU':(56, 57, 60, 71, 84, 85, 86, 87, 88, 89, 93, 100, 101, 109,
-                        110, 119, 121, 126, 127, 140, 141, 146, 147, 151, 153, 154,
-                        155, 156, 169, 179),
-                'Australia':(48,)}
+def origin_section(df, strata, str_buf, box_plots=None):
+    str_buf.append("\nOrigin of Data:")
+    strata.add_members('origin', df['id'], DATA_ORIGINS.values())
+    stats = strata.get_stats('origin')
+    labels = list(DATA_ORIGINS.keys())
+    for origin,(idx, s) in zip(labels, stats.iterrows()):
+        str_buf.append("{:<30s}{:>10d}{:>10.2f}{:>10.2f}".format(origin, int(s['count']), s['mean'], s['std']))
+
+    if box_plots is not None:
+        box_plots.append({'file_name': 'origin.png', 'data': strata.get_samples('origin'), 'labels': labels, 'xlabel': 'Origin of data'})
 
-box_data = []
-labels = []
-for origin, id_list in data_origin_dict.items():
-    subgroup = df.loc[df['id'].isin(id_list), 'er_0100':'er_2400'].values.ravel()
-    box_data.append(subgroup[np.logical_not(np.isnan(subgroup))])
-    labels.append(origin)
-    str_buf.append("{:<30s}{:>10d}{:>10.2f}{:>10.2f}".format(origin,
-                                                        np.count_nonzero(~np.isnan(subgroup)),
-                                                        np.nanmean(subgroup),
-                                                        np.nanstd(subgroup)))
-
-
-plt.boxplot(box_data, showmeans=True, labels=labels)
-plt.axhline(y=0, color='r')
-plt.ylim(-80, 80)
-plt.xlabel('Origin of data')
-plt.ylabel('Residual (dB)')
-plt.tight_layout()
-plt.savefig('origin.png')
-plt.clf()
 
 ##################################
 # ALL DISTANCES
 ##################################
 
-groups =[(0, 40000)]
-summary_vals = get_subgroups(df, 'distance', groups)[0]
-str_buf.append('-' * 60)
-str_buf.append("{:<30}{:>10d}{:>10.2f}{:>10.2f}".format("All data:",
-                                                        len(summary_vals),
-                                                        np.mean(summary_vals),
-                                                        np.std(summary_vals)))
-str_buf.append('-' * 60)
+def summary_section(df, strata, str_buf, box_plots=None):
+    groups =[(0, 40000)]
+    strata.add_range('all', np.abs(df['distance']), groups)
+    summary = strata.get_stats('all').iloc[0]
+    str_buf.append('-' * 60)
+    str_buf.append("{:<30}{:>10d}{:>10.2f}{:>10.2f}".format("All data:",
+                                                            int(summary['count']),
+                                                            summary['mean'],
+                                                            summary['std']))
+    str_buf.append('-' * 60)
+
 
 ##################################
 # PATHS / FREQUENCIES
 ##################################
 
-str_buf.append("\nPath / Frequency Combinations:")
-for name, group in df.groupby(['tx', 'rx', 'freq']):
-    #print(name)
-    er_values = group.loc[:,'er_0100':'er_2400'].values.ravel()
-    str_buf.append("{:<15s}{:<15s}{:>4.1f}{:>6d}{:>10.2f}{:>10.2f}".format(name[0],
-                                                                    name[1],
-                                                                    name[2],
-                                                                    np.count_nonzero(~np.isnan(er_values)),
-                                                                    np.nanmean(er_values),
-                                                                    np.nanstd(er_values)))
-
-
-
-
-##################################
-report_str = "{:s}\n".format('\n'.join(str_buf))
-print(report_str.replace(' nan', ' ---'))
+def paths_section(df, strata, str_buf, box_plots=None):
+    str_buf.append("\nPath / Frequency Combinations:")
+    for name, group in df.groupby(['tx', 'rx', 'freq']):
+        er_values = group.loc[:,'er_0100':'er_2400'].values.ravel()
+        str_buf.append("{:<15s}{:<15s}{:>4.1f}{:>6d}{:>10.2f}{:>10.2f}".format(name[0],
+                                                                        name[1],
+                                                                        name[2],
+                                                                        np.count_nonzero(~np.isnan(er_values)),
+                                                                        np.nanmean(er_values),
+                                                                        np.nanstd(er_values)))
+
+
+# The sections in report order
+SECTIONS = {'freq': frequency_section,
+            'distance': distance_section,
+            'geolat': geomagnetic_latitude_section,
+            'ssn': ssn_section,
+            'season': season_section,
+            'local_time': local_time_section,
+            'modes': modes_section,
+            'origin': origin_section,
+            'all': summary_section,
+            'paths': paths_section}
+
+
+def generate_report(df, sections=None, plots=False):
+    """
+    Returns a tuple of (report text, box plot specs) for the named
+    sections, by default all of them.  The box plot specs are only
+    collected if plots is set, otherwise the list is empty.
+    """
+    strata = Stratification(df.loc[:, 'er_0100':'er_2400'].values)
+    box_plots = [] if plots else None
+    str_buf = []
+    str_buf.append("{:30s}{:>10s}{:>10s}{:>10s}".format("", "Count", "Mean", "SD"))
+    for name, section in SECTIONS.items():
+        if sections is None or name in sections:
+            section(df, strata, str_buf, box_plots)
+    report_str = "{:s}\n".format('\n'.join(str_buf))
+    return report_str.replace(' nan', ' ---'), box_plots or []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Produce an ITU-R P.1148-1 style report from a residual table.")
+    parser.add_argument("residual_table", help="residual table, e.g. residuals.csv")
+    parser.add_argument("mode_table", nargs='?', help="table of the predicted modes")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of processes used to render the plots (default: %(default)s)")
+    parser.add_argument("-s", "--sections", type=lambda arg: arg.split(','), default=None,
+                        help="comma separated list of the sections to include, from {:s} (default: all)".format(', '.join(SECTIONS)))
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--text-only", "--no-plots", dest='text_only', action='store_true',
+                        help="only print the report, matplotlib isn't imported")
+    output.add_argument("--plots-only", action='store_true', help="only render the box plots")
+    args = parser.parse_args()
+
+    if args.sections:
+        unknown = [name for name in args.sections if name not in SECTIONS]
+        if unknown:
+            parser.error("unknown section(s): {:s}".format(', '.join(unknown)))
+
+    df = read_report_table(args.residual_table, args.mode_table)
+    df.to_csv('p1148.csv')
+
+    report_str, box_plots = generate_report(df, args.sections, plots=not args.text_only)
+
+    if not args.plots_only:
+        print(report_str)
+
+    if box_plots:
+        # Only import matplotlib if there's something to plot
+        from plots import render_box_plot, render_plots
+        render_plots(render_box_plot, box_plots, args.jobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Great circle geometry for arrays of paths.
+
+All of the functions accept scalars or array-likes of equal length and
+return NumPy arrays, angles are in degrees and distances in km.
+"""
+
+import numpy as np
+
+# Earth radius
+R0 = 6371.0
+# Location of the (northern) geomagnetic pole
+GEOMAG_POLE_LAT = 78.5
+GEOMAG_POLE_LNG = -68.2
+
+
+def parse_coordinate(values, positive, negative):
+    """
+    Converts coordinates in the form used by the D1 data set, e.g. '49.40N'
+    or '6.19E', to signed decimal degrees.  Values without a hemisphere
+    suffix, or that are already numeric, are returned as they are.  A
+    ValueError is raised for any other letter, e.g. a latitude ending in 'E'.
+
+    The strings are parsed a character column at a time across all of the
+    values rather than value by value.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in 'biuf':
+        return values.astype(np.float64)
+    shape = values.shape
+    chars = values.astype('S').reshape(-1)
+    codes = chars.view(np.uint8).reshape(len(chars), -1)
+    mantissa = np.zeros(len(chars), dtype=np.int64)
+    frac_digits = np.zeros(len(chars), dtype=np.int64)
+    seen_point = np.zeros(len(chars), dtype=bool)
+    sign = np.ones(len(chars))
+    invalid = np.zeros(len(chars), dtype=bool)
+    hemispheres = [ord(c) for c in (positive, positive.lower(), negative, negative.lower())]
+    for col in codes.T:
+        is_digit = (col >= ord('0')) & (col <= ord('9'))
+        mantissa = np.where(is_digit, mantissa * 10 + (col.astype(np.int64) - ord('0')), mantissa)
+        frac_digits += is_digit & seen_point
+        seen_point |= (col == ord('.'))
+        sign[(col == ord('-')) | (col == ord(negative)) | (col == ord(negative.lower()))] *= -1.0
+        is_letter = ((col | 0x20) >= ord('a')) & ((col | 0x20) <= ord('z'))
+        invalid |= is_letter & ~np.isin(col, hemispheres)
+    if invalid.any():
+        raise ValueError("Expected a coordinate ending in {:s} or {:s}: {!r}".format(positive, negative, chars[invalid][0].decode()))
+    # Dividing the exact integer mantissa gives the same value as float()
+    return (sign * (mantissa / 10.0**frac_digits)).reshape(shape)
+
+
+def parse_lat(values):
+    return parse_coordinate(values, 'N', 'S')
+
+
+def parse_lng(values):
+    return parse_coordinate(values, 'E', 'W')
+
+
+def get_distance(tx_lat, tx_lng, rx_lat, rx_lng):
+    """
+    Returns the great circle distance between the points (haversine).
+    """
+    tx_lat, tx_lng, rx_lat, rx_lng = (np.radians(np.asarray(v, dtype=np.float64)) for v in (tx_lat, tx_lng, rx_lat, rx_lng))
+    a = np.sin(0.5 * (rx_lat - tx_lat))**2 + np.cos(tx_lat) * np.cos(rx_lat) * np.sin(0.5 * (rx_lng - tx_lng))**2
+    return 2.0 * R0 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def get_midpoint(tx_lat, tx_lng, rx_lat, rx_lng, distance=None):
+    """
+    Returns a tuple of (mid_lat, mid_lng) arrays.  If the path distance is
+    given it's used to weight the end points, so paths longer than half the
+    earth's circumference (long path) take the midpoint on the far side of
+    the globe.  Otherwise the short path is assumed.
+    """
+    if distance is None:
+        distance = get_distance(tx_lat, tx_lng, rx_lat, rx_lng)
+    tx_lat, tx_lng, rx_lat, rx_lng = (np.radians(np.asarray(v, dtype=np.float64)) for v in (tx_lat, tx_lng, rx_lat, rx_lng))
+    d = np.asarray(distance, dtype=np.float64) / R0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        A = np.sin(0.5 * d) / np.sin(d)
+    # Zero length paths
+    A = np.where(np.isfinite(A), A, 0.5)
+    x = A * (np.cos(tx_lat) * np.cos(tx_lng) + np.cos(rx_lat) * np.cos(rx_lng))
+    y = A * (np.cos(tx_lat) * np.sin(tx_lng) + np.cos(rx_lat) * np.sin(rx_lng))
+    z = A * (np.sin(tx_lat) + np.sin(rx_lat))
+    return np.degrees(np.arctan2(z, np.hypot(x, y))), np.degrees(np.arctan2(y, x))
+
+
+def get_geomagnetic_latitude(lat, lng):
+    """
+    Returns the absolute geomagnetic latitude of the points.
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    pole_lat = np.radians(GEOMAG_POLE_LAT)
+    pole_lng = np.radians(GEOMAG_POLE_LNG)
+    return np.degrees(np.abs(np.arcsin(np.clip(np.sin(lat) * np.sin(pole_lat) + np.cos(lat) * np.cos(pole_lat) * np.cos(lng - pole_lng), -1.0, 1.0))))
@@ -0,0 +1,120 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Headless rendering of the D1 plots.
+
+The figures are built with matplotlib's object oriented API on the Agg
+canvas, so no display is needed and there's no shared pyplot state.  Each
+plot is described by a dict of the data to be plotted (computed before the
+plots are rendered) and the plots may be rendered concurrently in worker
+processes.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# boxplot()'s labels argument was renamed in matplotlib 3.9
+BOXPLOT_LABELS = 'tick_labels' if tuple(int(v) for v in matplotlib.__version__.split('.')[:2]) >= (3, 9) else 'labels'
+
+
+def new_figure():
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def render_box_plot(spec):
+    """
+    Renders a residual box plot.  spec is a dict holding the file_name,
+    data (a list of arrays, one per box), labels and xlabel.
+    """
+    fig = new_figure()
+    ax = fig.add_subplot()
+    ax.boxplot(spec['data'], showmeans=True, **{BOXPLOT_LABELS: spec['labels']})
+    ax.axhline(y=0, color='r')
+    ax.set_ylim(-80, 80)
+    ax.set_xlabel(spec['xlabel'])
+    ax.set_ylabel('Residual (dB)')
+    fig.tight_layout()
+    fig.savefig(spec['file_name'])
+    return spec['file_name']
+
+
+def draw_dist_plot(fig, spec):
+    """
+    Draws the residual distribution plot from the histogram counts of one
+    or more residual files.  spec is a dict holding the bin_edges and a list
+    of series, each a dict of the label, colour, bin_counts, count, mean and
+    std of a file.
+    """
+    ax = fig.add_subplot()
+    bin_edges = spec['bin_edges']
+    series = spec['series']
+    summaries = []
+    for s in series:
+        line_colour = 'r' if len(series) == 1 else s['colour']
+        ax.hist(bin_edges[:-1], bin_edges, weights=s['bin_counts'], facecolor=s['colour'], alpha=0.5, label=s['label'])
+
+        ax.axvline(x=s['mean'], color=line_colour)
+        ax.axvline(x=s['mean']-s['std'], ls='dashed', color=line_colour)
+        ax.axvline(x=s['mean']+s['std'], ls='dashed', color=line_colour)
+
+        summary = "Count = {:d}\nMean = {:.2f}\n$\\sigma$ = {:.2f}".format(s['count'], s['mean'], s['std'])
+        summaries.append(summary if len(series) == 1 else "{:s}\n{:s}".format(s['label'], summary))
+
+    ax.set_ylim([0,5000])
+    ax.set_xlabel('Error (dB)')
+    ax.set_ylabel('Count')
+    ax.set_title('Predicted vs. Measured Field Strength')
+    bbox_props = dict(fc="white", ec="k", lw=1)
+    if len(series) == 1:
+        ax.text(-90,3400, summaries[0], bbox=bbox_props)
+    else:
+        ax.legend(loc='upper right')
+        ax.text(0.02, 0.98, "\n\n".join(summaries), transform=ax.transAxes, va='top', fontsize='small', bbox=bbox_props)
+
+
+def render_dist_plot(spec):
+    """
+    Renders the distribution plot to spec['file_name'].
+    """
+    fig = new_figure()
+    draw_dist_plot(fig, spec)
+    fig.savefig(spec['file_name'])
+    return spec['file_name']
+
+
+def render_plots(render, specs, jobs=1):
+    """
+    Renders each of the specs with the render function, in up to jobs
+    worker processes.  Returns the names of the files written.
+    """
+    if jobs > 1 and len(specs) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(specs))) as executor:
+            return list(executor.map(render, specs))
+    return [render(spec) for spec in specs]
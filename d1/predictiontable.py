@@ -0,0 +1,580 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+The prediction table builders shared by generatePredictionTable.py and
+buildPredictionTable.py.  The scripts only differ in the parameters of their
+ITURHFProp runs and the names of their run files, given by a TableSettings,
+and each passes its own settings to make_prediction_table() and main().
+"""
+
+import argparse
+import csv
+import datetime
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from hfprop.cache import DEFAULT_CACHE_DIR, PredictionCache
+from hfprop.failures import FailureLedger
+from hfprop.iturhfprop import RETURN_OK, ITURHFPropError, run_iturhfprop_checked, set_executable, set_retries, set_timeout
+from hfprop.results import format_value, get_predictions_as_dict
+from hfprop.scheduler import AdaptiveScheduler, get_job_cost
+from hfprop.scratch import default_scratch_space
+from hfprop.timing import stage_timer
+from hfprop.usage import UsageSummary
+
+from artifacts import DEFAULT_ARTIFACTS_FILE, ArtifactStore
+from checkpoint import CHECKPOINT_FILE_NAME, Checkpoint
+from geometry import parse_lat, parse_lng
+
+FAILURES_FILE = os.path.join('run', 'failures.jsonl')
+
+
+class TableSettings:
+    """
+    The settings of a prediction table.  separator joins the ids, month and
+    year in the names of the runs and path_name is formatted with the ids,
+    tx_name, rx_name, year and month of a group to give the PathName of its
+    deck.  If with_names is set the TX and RX names are also added to the
+    deck and if verbose is set the path name of each run is printed.
+    options are the ITURHFProp command line options, the remaining keyword
+    arguments are passed to run_p2p_prediction().
+    """
+
+    def __init__(self, separator='-', path_name="", with_names=False, verbose=False, options=['-s', '-c'], **prediction_args):
+        self.separator = separator
+        self.path_name = path_name
+        self.with_names = with_names
+        self.verbose = verbose
+        self.options = options
+        self.prediction_args = prediction_args
+
+
+def get_input_deck(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
+                    path_name="",
+                    path_tx_name=None,
+                    tx_antenna="ISOTROPIC",
+                    tx_gos=0.0,
+                    path_rx_name=None,
+                    rx_antenna="ISOTROPIC",
+                    rx_gos=0.0,
+                    path_month=None,
+                    path_year=None,
+                    path_hour=[1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24],
+                    path_frequency=[10],
+                    path_bw=3000,
+                    path_SNRr=15,
+                    path_SNRXXp=90,
+                    tx_power=100,
+                    path_sorl="SHORTPATH",
+                    path_manmade_noise="CITY",
+                    report_format=["RPT_BCR"],
+                    data_path="./data/"
+                    ):
+    """
+    Returns the input deck for a point to point prediction.
+    """
+    tx_power = 10 * (math.log10(tx_power/1000.0))
+
+    report_format_str = " | ".join(report_format)
+    path_frequency_str = ", ".join([str(n) for n in path_frequency])
+    path_hour_str = ", ".join([str(n) for n in path_hour])
+    buf = []
+    if path_name:
+        buf.append('PathName "{:s}"'.format(path_name))
+    if path_tx_name:
+        buf.append('PathTXName "{:s}"'.format(path_tx_name))
+    buf.append('Path.L_tx.lat {:.6f}'.format(tx_lat))
+    buf.append('Path.L_tx.lng {:.6f}'.format(tx_lng))
+    buf.append('TXAntFilePath "{:s}"'.format(tx_antenna))
+    if tx_antenna == "ISOTROPIC":
+        buf.append('TXGOS {:.2f}'.format(tx_gos))
+    #buf.append('AntennaOrientation TX2RX')
+    if path_rx_name:
+        buf.append('PathRXName "{:s}"'.format(path_rx_name))
+    buf.append('Path.L_rx.lat {:.6f}'.format(rx_lat))
+    buf.append('Path.L_rx.lng {:.6f}'.format(rx_lng))
+    buf.append('RXAntFilePath "{:s}"'.format(rx_antenna))
+    if rx_antenna == "ISOTROPIC":
+        buf.append('RXGOS {:.2f}'.format(rx_gos))
+    #buf.append('AntennaOrientation RX2TX')
+
+    if not path_year:
+        now = datetime.datetime.utcnow()
+        path_year = now.year
+    buf.append('Path.year {:d}'.format(path_year))
+    if not path_month:
+        now = datetime.datetime.utcnow()
+        path_month = now.month
+    buf.append('Path.month {:d}'.format(path_month))
+
+    buf.append('Path.hour {:s}'.format(path_hour_str))
+    buf.append('Path.SSN {:d}'.format(path_ssn))
+    buf.append('Path.frequency {:s}'.format(path_frequency_str))
+    buf.append('Path.txpower {:.2f}'.format(tx_power))
+    buf.append('Path.BW {:.2f}'.format(path_bw))
+    buf.append('Path.SNRr {:.2f}'.format(path_SNRr))
+    buf.append('Path.SNRXXp {:d}'.format(path_SNRXXp))
+    buf.append('Path.ManMadeNoise "{:s}"'.format(path_manmade_noise))
+    buf.append('Path.SorL "{:s}"'.format(path_sorl))
+    buf.append('RptFileFormat "{:s}"'.format(report_format_str))
+    buf.append('LL.lat {:.6f}'.format(rx_lat))
+    buf.append('LL.lng {:.6f}'.format(rx_lng))
+    buf.append('LR.lat {:.6f}'.format(rx_lat))
+    buf.append('LR.lng {:.6f}'.format(rx_lng))
+    buf.append('UL.lat {:.6f}'.format(rx_lat))
+    buf.append('UL.lng {:.6f}'.format(rx_lng))
+    buf.append('UR.lat {:.6f}'.format(rx_lat))
+    buf.append('UR.lng {:.6f}'.format(rx_lng))
+    buf.append('DataFilePath "{:s}"'.format(data_path))
+
+    return "{:s}\n".format('\n'.join(buf))
+
+
+def run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
+                    path_name="",
+                    path_tx_name=None,
+                    tx_antenna="ISOTROPIC",
+                    tx_gos=0.0,
+                    path_rx_name=None,
+                    rx_antenna="ISOTROPIC",
+                    rx_gos=0.0,
+                    path_month=None,
+                    path_year=None,
+                    path_hour=[1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24],
+                    path_frequency=[10],
+                    path_bw=3000,
+                    path_SNRr=15,
+                    path_SNRXXp=90,
+                    tx_power=100,
+                    path_sorl="SHORTPATH",
+                    path_manmade_noise="CITY",
+                    report_format=["RPT_BCR"],
+                    data_path="./data/",
+                    input_file_path = None,
+                    output_file_path = None,
+                    report_dict_keys=['BCR'],
+                    zeroMidnight=False,
+                    returnInputFile=False,
+                    returnOutputFile=False,
+                    options=['-s', '-c'],
+                    cache=None,
+                    checkpoint=None,
+                    artifact=None,
+                    scratch=default_scratch_space
+                    ):
+    """
+    Run a single ITURHFProp prediction, options are the ITURHFProp command
+    line options.  If a checkpoint is given the output
+    of an earlier run of the same deck in output_file_path is read instead
+    of running ITURHFProp, and the outcome of a new run is recorded.  The
+    deck and output of the run are added to the artifact store if an
+    artifact (see artifacts.py) is given.  A prediction found in the cache
+    writes the same files, journal entry and artifact as a run.  Raises
+    ITURHFPropError if the run fails or its report can't be read.
+    """
+    with stage_timer.stage('deck'):
+        text_in = get_input_deck(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
+                        path_name=path_name,
+                        path_tx_name=path_tx_name,
+                        tx_antenna=tx_antenna,
+                        tx_gos=tx_gos,
+                        path_rx_name=path_rx_name,
+                        rx_antenna=rx_antenna,
+                        rx_gos=rx_gos,
+                        path_month=path_month,
+                        path_year=path_year,
+                        path_hour=path_hour,
+                        path_frequency=path_frequency,
+                        path_bw=path_bw,
+                        path_SNRr=path_SNRr,
+                        path_SNRXXp=path_SNRXXp,
+                        tx_power=tx_power,
+                        path_sorl=path_sorl,
+                        path_manmade_noise=path_manmade_noise,
+                        report_format=report_format,
+                        data_path=data_path)
+    if checkpoint:
+        with stage_timer.stage('parse'):
+            prediction_dict = checkpoint.get(output_file_path, text_in, lambda fn: get_predictions_as_dict(fn, report_dict_keys, zeroMidnight=zeroMidnight))
+        if prediction_dict is not None:
+            return prediction_dict
+
+    if cache:
+        cache_key = cache.get_key(text_in, data_path, report_dict_keys, zeroMidnight)
+        prediction_dict, report = cache.get(cache_key, with_report=True)
+        if prediction_dict is not None:
+            if report is not None and (output_file_path or artifact is not None):
+                with scratch.open_run(text_in, input_file_path, output_file_path) as run:
+                    with stage_timer.stage('write_output'):
+                        with open(run.output_file, 'w') as output_file:
+                            output_file.write(report)
+                    if artifact is not None:
+                        artifact.record(text_in, run.output_file, None)
+                    if checkpoint:
+                        checkpoint.record(run.output_file, text_in, True, RETURN_OK)
+            return prediction_dict
+
+    with scratch.open_run(text_in, input_file_path, output_file_path) as run:
+        try:
+            with stage_timer.stage('iturhfprop'):
+                usage = run_iturhfprop_checked(options, run.input_file, run.output_file, text_in)
+        except ITURHFPropError as e:
+            if artifact is not None:
+                artifact.record(text_in, run.output_file, e.usage)
+            if checkpoint:
+                checkpoint.record(run.output_file, text_in, False, e.return_code)
+            raise
+
+        if artifact is not None:
+            artifact.record(text_in, run.output_file, usage)
+
+        try:
+            with stage_timer.stage('parse'):
+                prediction_dict = get_predictions_as_dict(run.output_file, report_dict_keys, zeroMidnight=zeroMidnight)
+        except Exception as e:
+            if checkpoint:
+                checkpoint.record(run.output_file, text_in, False, usage.return_code)
+            raise ITURHFPropError("Error parsing file: {:s}".format(str(e)), usage.return_code, usage) from e
+
+        if cache:
+            with open(run.output_file) as output_file:
+                cache.put(cache_key, prediction_dict, output_file.read())
+        # Set after the result is cached, cached results have no usage
+        prediction_dict.usage = usage
+        if checkpoint:
+            checkpoint.record(run.output_file, text_in, True, usage.return_code)
+
+    return prediction_dict
+
+# Rows of the D1 table sharing these values only differ in frequency and may
+# be predicted with a single ITURHFProp run.
+PATH_GROUP_KEYS = ['tx_lat', 'tx_lng', 'rx_lat', 'rx_lng', 'ssn', 'year', 'month']
+
+def get_path_groups(rows):
+    """
+    Returns a list of groups of row indices, the rows in each group share the
+    same path, SSN and date.  Groups are ordered by their first appearance in
+    the table.
+    """
+    path_groups = {}
+    for idx, row in enumerate(rows):
+        path_groups.setdefault(tuple(row[key] for key in PATH_GROUP_KEYS), []).append(idx)
+    return list(path_groups.values())
+
+
+def get_group_ids(group):
+    """
+    Returns the D1 ids of the rows in the group, in order of appearance.
+    """
+    ids = []
+    for group_row in group:
+        if group_row['id'] not in ids:
+            ids.append(group_row['id'])
+    return ids
+
+
+def get_group_name(group, separator='-'):
+    """
+    Returns the name of the run predicting the group, used for its .in and
+    .out files and as its key in the artifact store and failure ledger.
+    """
+    return separator.join(["_".join(get_group_ids(group)), group[0]['month'], group[0]['year']])
+
+
+def get_row_keys(group):
+    """
+    Returns the (id, freq, year, month) of each of the rows in the group.
+    """
+    return [(int(group_row['id']), float(group_row['freq']), int(group_row['year']), int(group_row['month'])) for group_row in group]
+
+
+def get_group_cost(group):
+    """
+    Returns the estimated cost of the group's run, used to start the longest
+    runs first.
+    """
+    return get_job_cost(float(group[0]['distance']), len(set(group_row['freq'] for group_row in group)))
+
+
+def get_group_predictions(group, settings, working_dir="run", cache=None, usage_summary=None, checkpoint=None, artifacts=None, failures=None):
+    """
+    Run ITURHFProp once for a group of rows from the D1 table, with all of
+    the group's frequencies and the parameters in settings, and return copies of the rows with the hourly
+    values replaced by the predicted field strengths.  The usage of the
+    ITURHFProp run is added to usage_summary if it's given.  If an artifact
+    store is given the run is kept there instead of in working_dir.  If the
+    run fails it's added to the failures ledger, if given, and no rows are
+    returned.
+    """
+    row = group[0]
+    frequencies = sorted(set(float(group_row['freq']) for group_row in group))
+    path_name = settings.path_name.format(ids=", ".join(get_group_ids(group)), tx_name=row['tx_name'], rx_name=row['rx_name'], year=row['year'], month=row['month'])
+    file_name = get_group_name(group, settings.separator)
+    if artifacts:
+        input_file_path = output_file_path = None
+        artifact = artifacts.new_run(file_name, get_row_keys(group))
+    else:
+        input_file_path = os.path.join(working_dir, file_name+'.in')
+        output_file_path = os.path.join(working_dir, file_name+'.out')
+        artifact = None
+    tx_lat, rx_lat = parse_lat([row['tx_lat'], row['rx_lat']])
+    tx_lng, rx_lng = parse_lng([row['tx_lng'], row['rx_lng']])
+    path_ssn = int(row['ssn'])
+    if settings.verbose:
+        print(path_name)
+    try:
+        p = run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
+                            path_name=path_name,
+                            path_tx_name=row['tx_name'] if settings.with_names else None,
+                            tx_antenna="ISOTROPIC",
+                            tx_gos=0.0,
+                            path_rx_name=row['rx_name'] if settings.with_names else None,
+                            rx_antenna="ISOTROPIC",
+                            rx_gos=0.0,
+                            path_month=int(row['month']),
+                            path_year=1900 + int(row['year']),
+                            path_hour=[1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24],
+                            path_frequency=frequencies,
+                            tx_power=1000,
+                            path_sorl="SHORTPATH",
+                            report_format=["RPT_E"],
+                            data_path="./data/",
+                            input_file_path = input_file_path,
+                            output_file_path = output_file_path,
+                            report_dict_keys=['Ep'],
+                            zeroMidnight=False,
+                            returnInputFile=False,
+                            returnOutputFile=False,
+                            options=settings.options,
+                            cache=cache,
+                            checkpoint=checkpoint,
+                            artifact=artifact,
+                            **settings.prediction_args
+                            )
+    except ITURHFPropError as e:
+        if failures is None:
+            raise
+        failures.add(file_name, e, rows=get_row_keys(group))
+        return []
+    #print(p)
+    if usage_summary is not None:
+        usage_summary.add(p.usage)
+    ep = p.get_parameter('Ep')
+    pred_dicts = []
+    for group_row in group:
+        pred_dict = dict(group_row)
+        freq_idx = p.get_frequency_index(group_row['freq'])
+        for utc in range(1,25):
+            utc_key = "{:d}:00".format(utc)
+            pred_dict[utc_key] = format_value(ep[freq_idx, utc-1])
+        pred_dicts.append(pred_dict)
+    return pred_dicts
+
+
+def get_group_predictions_with_stats(group, settings, working_dir="run", cache=None, checkpoint=None, artifacts=None):
+    """
+    Used by the worker processes.  The cache, checkpoint and scratch space
+    counters, stage timings, ITURHFProp usage, failures and runs for the
+    artifact store are returned with the predictions, in a dict, so they
+    can be added to the parent's.
+    """
+    usage_summary = UsageSummary()
+    failures = FailureLedger()
+    pred_dicts = get_group_predictions(group, settings, working_dir, cache, usage_summary, checkpoint, artifacts, failures)
+    stats = {'stages': stage_timer.pop_records(), 'scratch': default_scratch_space.pop_stats(), 'usage': usage_summary, 'failures': failures}
+    if cache:
+        stats['cache'] = (cache.hits, cache.misses)
+    if checkpoint:
+        stats['checkpoint'] = checkpoint.get_stats()
+    if artifacts:
+        stats['artifacts'] = artifacts.pop_pending()
+    return pred_dicts, stats
+
+
+def get_existing_predictions(predicted_fn, rows):
+    """
+    Returns the rows of an existing predicted table matching each of the
+    rows of the measured table, None where there isn't one.
+    """
+    with open(predicted_fn) as prediction_file:
+        existing = {(row['id'], row['freq'], row['year'], row['month']): row for row in csv.DictReader(prediction_file)}
+    return [existing.get((row['id'], row['freq'], row['year'], row['month'])) for row in rows]
+
+
+def make_prediction_table(settings, measured_fn="d1_data_measured.csv", predicted_fn="d1_data_predicted.csv", working_dir="run", jobs=1, cache=None, usage_summary=None, checkpoint=None, artifacts=None, failures=None, rerun=None, scheduler=None):
+    """
+    Create a table of predictions, made with settings (a TableSettings),
+    for each of the paths in the D1 table.  Rows
+    that only differ in frequency are predicted with a single ITURHFProp run.
+    When jobs > 1 the predictions are farmed out to a pool of worker processes,
+    if a scheduler is given it runs them instead and jobs is ignored (see
+    hfprop/scheduler.py).
+    The rows are always written in the same order as the measured table.  The
+    usage of each ITURHFProp run is added to usage_summary if it's given.  If
+    a checkpoint is given only the runs that haven't already been completed
+    are made (see checkpoint.py).  If an artifact store is given the input
+    and output of each run are kept there rather than in the run directory
+    (see artifacts.py).
+
+    A run that fails is added to the failures ledger and its rows are left
+    out of the table, the residual scripts skip rows without a match.  If
+    rerun is given only the runs it names are made, the rest of the rows
+    are kept from the existing predicted table.
+    """
+    d1_fn = measured_fn
+    pr_fn = predicted_fn
+
+    with stage_timer.stage('read_table'):
+        with open(d1_fn,'r') as d1file:
+            d_reader = csv.DictReader(d1file)
+            headers = d_reader.fieldnames
+            rows = list(d_reader)
+
+    if failures is None:
+        failures = FailureLedger()
+    path_groups = get_path_groups(rows)
+    predictions = [None] * len(rows)
+    if rerun is not None:
+        rerun = set(rerun)
+        predictions = get_existing_predictions(pr_fn, rows)
+        path_groups = [path_group for path_group in path_groups if get_group_name([rows[idx] for idx in path_group], settings.separator) in rerun]
+    groups = [[rows[idx] for idx in path_group] for path_group in path_groups]
+    if scheduler or jobs > 1:
+        group_args = (get_group_predictions_with_stats, groups, repeat(settings), repeat(working_dir), repeat(cache), repeat(checkpoint), repeat(artifacts))
+        if scheduler:
+            results = scheduler.map(*group_args, costs=[get_group_cost(group) for group in groups])
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(*group_args))
+        for path_group, (pred_dicts, stats) in zip(path_groups, results):
+            for idx, pred_dict in zip(path_group, pred_dicts):
+                predictions[idx] = pred_dict
+            if cache:
+                cache.add_stats(*stats['cache'])
+            if checkpoint:
+                checkpoint.add_stats(*stats['checkpoint'])
+            if artifacts:
+                artifacts.add_pending(stats['artifacts'])
+            failures.update(stats['failures'])
+            stage_timer.add_records(stats['stages'])
+            default_scratch_space.add_stats(stats['scratch'])
+            if usage_summary is not None:
+                usage_summary.update(stats['usage'])
+    else:
+        for path_group, group in zip(path_groups, groups):
+            for idx, pred_dict in zip(path_group, get_group_predictions(group, settings, working_dir, cache, usage_summary, checkpoint, artifacts, failures)):
+                predictions[idx] = pred_dict
+
+    with stage_timer.stage('write_csv'):
+        with open(pr_fn,'w') as prediction_file:
+            d_writer = csv.DictWriter(prediction_file, fieldnames=headers)
+            d_writer.writeheader()
+            d_writer.writerows(prediction for prediction in predictions if prediction is not None)
+    if checkpoint:
+        checkpoint.compact()
+    if artifacts:
+        artifacts.close()
+
+
+def main(make_table):
+    """
+    Parses the command line and builds the table with make_table, which
+    takes the keyword arguments of make_prediction_table() other than the
+    settings and file names.
+    """
+    parser = argparse.ArgumentParser(description="Create a table of ITURHFProp predictions for the D1 dataset.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of ITURHFProp processes to run in parallel (default: number of cores)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="adjust the number of ITURHFProp processes to the host as the table is built, starting from --jobs, and start the longest runs first")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="directory used to cache predictions (default: {:s})".format(DEFAULT_CACHE_DIR))
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always run ITURHFProp, ignoring any cached predictions")
+    parser.add_argument("--executable",
+                        help="ITURHFProp executable to run, 'fake' selects the stand-in in hfprop/fake_iturhfprop.py (default: $PSC_ITURHFPROP or ITURHFProp)")
+    runs = parser.add_mutually_exclusive_group()
+    runs.add_argument("--incremental", action="store_true",
+                        help="only run the predictions that weren't completed by an earlier run, the completed runs are recorded in run/{:s}".format(CHECKPOINT_FILE_NAME))
+    runs.add_argument("--artifacts", nargs='?', const=DEFAULT_ARTIFACTS_FILE, metavar="FILE",
+                        help="keep the input and output of each run in this SQLite file rather than as .in and .out files in run/ (default: {:s})".format(DEFAULT_ARTIFACTS_FILE))
+    parser.add_argument("--timeout", type=float,
+                        help="kill an ITURHFProp run after this many seconds (default: $PSC_TIMEOUT or no limit)")
+    parser.add_argument("--retries", type=int,
+                        help="number of times a failed run is retried (default: $PSC_RETRIES or 0)")
+    parser.add_argument("--failures", default=FAILURES_FILE,
+                        help="write the runs that failed to this file (default: %(default)s)")
+    parser.add_argument("--rerun-failures", action="store_true",
+                        help="only make the runs listed in the failures file, keeping the other rows of the predicted table")
+    parser.add_argument("--usage",
+                        help="write the CPU time, memory and wall time of each ITURHFProp run to this csv file")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the time spent in each stage of the predictions")
+    parser.add_argument("--trace",
+                        help="write the stage timings to this file as a Chrome trace (implies --profile)")
+    args = parser.parse_args()
+    if args.executable:
+        set_executable(args.executable)
+    if args.timeout is not None:
+        set_timeout(args.timeout)
+    if args.retries is not None:
+        set_retries(args.retries)
+    rerun = FailureLedger.read(args.failures).get_keys() if args.rerun_failures else None
+    if rerun is not None and not rerun:
+        print("{:s}: no failed runs to re-run".format(args.failures))
+        return
+    if args.profile or args.trace:
+        stage_timer.enable(args.trace)
+    cache = None if args.no_cache else PredictionCache(args.cache_dir)
+    checkpoint = Checkpoint("run") if args.incremental else None
+    artifacts = ArtifactStore(args.artifacts) if args.artifacts else None
+    usage_summary = UsageSummary()
+    failures = FailureLedger()
+    scheduler = AdaptiveScheduler(initial=args.jobs, executor='process') if args.adaptive else None
+    make_table(jobs=args.jobs, cache=cache, usage_summary=usage_summary, checkpoint=checkpoint, artifacts=artifacts, failures=failures, rerun=rerun, scheduler=scheduler)
+    if cache:
+        print(cache)
+    if scheduler:
+        print(scheduler)
+    if checkpoint:
+        print(checkpoint)
+    if artifacts:
+        print(artifacts)
+    print(usage_summary)
+    print(default_scratch_space)
+    failures.write(args.failures)
+    if failures:
+        print(failures)
+        print("Run again with --rerun-failures to retry them")
+    if args.usage:
+        usage_summary.write_csv(args.usage)
+    if stage_timer.enabled:
+        print(stage_timer)
+        stage_timer.write_trace()
+
@@ -0,0 +1,117 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Computes the residual (predicted - measured) table from the predicted and
+measured D1 csv files.
+
+The rows of the two files are joined on (id, freq, year, month) so the
+predicted file may be written in any order.  The predicted file's order is
+kept in the output.  Hourly values of 99 (no data) and 999 (error) in
+either file are written as the no_data and error labels.  Values below
+-99dB are clamped to -99dB before the residual is taken.
+"""
+
+import numpy as np
+import pandas as pd
+
+from columnar import FIRST_HOUR_COLUMN, load_table
+
+KEY_COLUMNS = ['id', 'freq', 'year', 'month']
+SSN_COLUMN = 'ssn'
+
+NO_DATA_VALUE = 99
+ERROR_VALUE = 999
+MIN_VALUE = -99
+
+
+def read_d1_table(fn, use_cache=True):
+    """
+    Reads a D1 csv file, from its columnar cache if it's fresh.  The hourly
+    values are read as floats, the other columns are held as text so they
+    are written back to the residual table unchanged.
+    """
+    return load_table(fn, use_cache=use_cache).to_dataframe(text=True)
+
+
+def get_join_keys(df):
+    """
+    Returns a DataFrame of the join keys.  Repeated keys are numbered so the
+    nth occurrence in one file is paired with the nth occurrence in the
+    other.
+    """
+    keys = pd.DataFrame({'id': pd.to_numeric(df['id']).astype(np.int64),
+                         'freq': pd.to_numeric(df['freq']).astype(np.float64),
+                         'year': pd.to_numeric(df['year']).astype(np.int64),
+                         'month': pd.to_numeric(df['month']).astype(np.int64)})
+    keys['n'] = keys.groupby(KEY_COLUMNS, sort=False).cumcount()
+    return keys
+
+
+def get_residual_table(predicted_df, measured_df, no_data='NO_DATA', error=' (error)'):
+    """
+    Returns a tuple of (residual DataFrame, unmatched predicted rows,
+    unmatched measured rows).  Every column of the residual table is text.
+    """
+    pred_keys = get_join_keys(predicted_df)
+    meas_keys = get_join_keys(measured_df)
+    pred_keys['pred_idx'] = np.arange(len(pred_keys))
+    meas_keys['meas_idx'] = np.arange(len(meas_keys))
+    joined = pred_keys.merge(meas_keys, how='inner', on=KEY_COLUMNS + ['n'], sort=False).sort_values('pred_idx', kind='stable')
+    pred_idx = joined['pred_idx'].to_numpy()
+    meas_idx = joined['meas_idx'].to_numpy()
+
+    pred = predicted_df.iloc[pred_idx].reset_index(drop=True)
+    meas = measured_df.iloc[meas_idx].reset_index(drop=True)
+    hour_columns = list(predicted_df.columns[FIRST_HOUR_COLUMN:])
+
+    p = np.maximum(pred[hour_columns].to_numpy(dtype=np.float64), MIN_VALUE)
+    m = np.maximum(meas[hour_columns].to_numpy(dtype=np.float64), MIN_VALUE)
+    is_error = (p == ERROR_VALUE) | (m == ERROR_VALUE)
+    is_no_data = (p == NO_DATA_VALUE) | (m == NO_DATA_VALUE)
+    # '%' formatting of a list is quicker than np.char.mod()
+    values = np.array(['%.2f' % value for value in (p - m).ravel().tolist()], dtype=object).reshape(p.shape)
+    values[is_no_data] = no_data
+    values[is_error] = error
+
+    residuals = pred.copy()
+    residuals[hour_columns] = values
+    ssn_diff = pred[SSN_COLUMN].astype(np.int64) - meas[SSN_COLUMN].astype(np.int64)
+    residuals[SSN_COLUMN] = pred[SSN_COLUMN].where(pred[SSN_COLUMN] == meas[SSN_COLUMN], "diff: " + ssn_diff.astype(str))
+    return residuals, len(predicted_df) - len(joined), len(measured_df) - len(joined)
+
+
+def write_residual_csv(predicted_fn, measured_fn, residual_fn, no_data='NO_DATA', error=' (error)', use_cache=True):
+    """
+    Writes the residual table to residual_fn in a single write.  Returns a
+    tuple of (rows written, unmatched predicted rows, unmatched measured
+    rows).
+    """
+    residuals, pred_unmatched, meas_unmatched = get_residual_table(read_d1_table(predicted_fn, use_cache),
+                                                                   read_d1_table(measured_fn, use_cache),
+                                                                   no_data=no_data,
+                                                                   error=error)
+    with open(residual_fn, 'w') as f:
+        f.write(residuals.to_csv(index=False, lineterminator='\n'))
+    return len(residuals), pred_unmatched, meas_unmatched
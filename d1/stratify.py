@@ -0,0 +1,131 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Stratification of a residual table into sub-groups, e.g. the frequency,
+distance and season groups of ITU-R P.1148.
+
+Each dimension assigns every row of the table a bin index (-1 if the row
+isn't in any bin) with a single vectorized operation over the rows.  The
+residuals are reduced to a count, sum and sum of squares per row once, so
+the statistics for a dimension, or for a combination of dimensions such as
+distance x season, come from one groupby of the row sums rather than a
+scan of the residual matrix for each bin.
+
+    strata = Stratification(df.loc[:, 'er_0100':'er_2400'].values)
+    strata.add_range('distance', df['distance'], [(0, 1000), (1000, 2000)])
+    strata.add_members('season', df['month'], [(12, 1, 2), (3, 4, 5)])
+    stats = strata.get_stats('distance', 'season')
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def get_range_index(values, limits):
+    """
+    Returns the index of the (lower, upper] range holding each value or -1
+    if it's not in any of the ranges.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    index = np.full(len(values), -1, dtype=np.int64)
+    for idx, (lower, upper) in enumerate(limits):
+        index[(index < 0) & (values > lower) & (values <= upper)] = idx
+    return index
+
+
+def get_member_index(values, groups):
+    """
+    Returns the index of the group containing each value or -1 if it's not
+    in any of the groups.
+    """
+    values = np.asarray(values)
+    index = np.full(len(values), -1, dtype=np.int64)
+    for idx, members in enumerate(groups):
+        index[(index < 0) & np.isin(values, list(members))] = idx
+    return index
+
+
+class Stratification:
+
+    def __init__(self, residuals):
+        self.residuals = np.asarray(residuals, dtype=np.float64)
+        self.bins = pd.DataFrame(index=pd.RangeIndex(len(self.residuals)))
+        self.sizes = {}
+        valid = ~np.isnan(self.residuals)
+        values = np.where(valid, self.residuals, 0.0)
+        self.row_sums = pd.DataFrame({'count': valid.sum(axis=1),
+                                      'sum': values.sum(axis=1),
+                                      'sumsq': (values**2).sum(axis=1)})
+
+    def add_dimension(self, name, index, size):
+        """
+        Adds a dimension from an array holding the bin index of each row.
+        """
+        self.bins[name] = np.asarray(index, dtype=np.int64)
+        self.sizes[name] = size
+
+    def add_range(self, name, values, limits):
+        self.add_dimension(name, get_range_index(values, limits), len(limits))
+
+    def add_members(self, name, values, groups):
+        groups = list(groups)
+        self.add_dimension(name, get_member_index(values, groups), len(groups))
+
+    def get_stats(self, *dims):
+        """
+        Returns a DataFrame of the count, mean, standard deviation and RMSE
+        of the residuals in each cell of the dimensions, indexed by bin
+        index.  Empty cells have a count of 0 and NaN statistics.
+        """
+        dims = list(dims)
+        inside = (self.bins[dims] >= 0).all(axis=1).values
+        sums = self.row_sums[inside].groupby([self.bins[dim].values[inside] for dim in dims]).sum()
+        if len(dims) > 1:
+            cells = pd.MultiIndex.from_product([range(self.sizes[dim]) for dim in dims], names=dims)
+        else:
+            cells = pd.RangeIndex(self.sizes[dims[0]], name=dims[0])
+        sums = sums.reindex(cells, fill_value=0)
+        stats = pd.DataFrame({'count': sums['count']}, index=cells)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stats['mean'] = sums['sum'] / sums['count']
+            mean_sq = sums['sumsq'] / sums['count']
+        stats['std'] = np.sqrt(np.maximum(mean_sq - stats['mean']**2, 0))
+        stats['rmse'] = np.sqrt(mean_sq)
+        return stats
+
+    def get_samples(self, dim):
+        """
+        Returns a list holding an array of the residuals in each bin of the
+        dimension, NaNs removed.  The residuals are in row order.
+        """
+        index = self.bins[dim].values
+        rows = np.flatnonzero(index >= 0)
+        rows = rows[np.argsort(index[rows], kind='stable')]
+        counts = np.bincount(index[rows], minlength=self.sizes[dim])
+        samples = []
+        for group in np.split(self.residuals[rows], np.cumsum(counts)[:-1]):
+            group = group.ravel()
+            samples.append(group[~np.isnan(group)])
+        return samples
@@ -0,0 +1,114 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Streaming statistics of residual tables.
+
+The hourly residuals are read a chunk of rows at a time and folded into
+running totals: the count, mean and sum of squared differences from the
+mean (Welford's method, with each chunk merged using Chan's formula), the
+sum of squares for the RMSE and the counts of a histogram with fixed bin
+edges.  Memory use depends on the chunk size, not on the size of the file,
+and only the final counts need to be passed on to be plotted.
+"""
+
+import numpy as np
+import pandas as pd
+
+from columnar import FIRST_HOUR_COLUMN, load_cache
+
+DEFAULT_CHUNK_ROWS = 10000
+
+
+class ResidualStats:
+
+    def __init__(self, bin_edges, clip_lower=None, clip_upper=None):
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        self.clip_lower = self.bin_edges[0] if clip_lower is None else clip_lower
+        self.clip_upper = self.bin_edges[-1] if clip_upper is None else clip_upper
+        self.bin_counts = np.zeros(len(self.bin_edges) - 1, dtype=np.int64)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sumsq = 0.0
+
+    def update(self, values):
+        """
+        Adds an array of residuals, NaNs are ignored.  The statistics are
+        of the values before they're clipped to the histogram's range.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        n = len(values)
+        mean = values.mean()
+        m2 = np.sum((values - mean)**2)
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta**2 * self.count * n / total
+        self.count = total
+        self.sumsq += np.sum(values**2)
+        self.bin_counts += np.histogram(np.clip(values, self.clip_lower, self.clip_upper), self.bin_edges)[0]
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def rmse(self):
+        return np.sqrt(self.sumsq / self.count) if self.count else np.nan
+
+
+def iter_residual_chunks(fn, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Yields (rows x hours) float arrays of the hourly residuals in the file.
+    Values that aren't numbers, e.g. NO_DATA, are NaN.  The columnar cache
+    is used if it's fresh, otherwise the csv file is read a chunk at a time.
+    """
+    table = load_cache(fn)
+    if table is not None:
+        for start in range(0, len(table), chunk_rows):
+            yield np.asarray(table.values[start:start + chunk_rows])
+        return
+    for chunk in pd.read_csv(fn, chunksize=chunk_rows, dtype=str, keep_default_na=False, skipinitialspace=True):
+        yield chunk.iloc[:, FIRST_HOUR_COLUMN:].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+
+
+def get_residual_stats(fns, bin_edges, clip_lower=None, clip_upper=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Returns a list with the ResidualStats of each of the files.
+    """
+    all_stats = []
+    for fn in fns:
+        stats = ResidualStats(bin_edges, clip_lower, clip_upper)
+        for chunk in iter_residual_chunks(fn, chunk_rows):
+            stats.update(chunk)
+        all_stats.append(stats)
+    return all_stats
@@ -0,0 +1,6 @@
+"""
+Helpers shared by the scripts that drive ITURHFProp (d1, noise and radcom).
+
+The scripts are run from their own directories, they add the root of this
+repository to sys.path before importing from this package.
+"""
@@ -0,0 +1,173 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Helpers for predicting many receive locations from a single transmitter
+with one ITURHFProp area prediction.
+
+ITURHFProp steps the receiver across the area defined by the LL/LR/UL/UR
+corners in increments of latinc/lnginc.  The area used here is aligned to
+multiples of the step so each target zone is represented by its nearest
+grid point, i.e. a zone may be moved by up to half a step in latitude and
+longitude.  get_zone_offset() returns the distance a zone is moved, the
+scripts report it with the zone's predictions.
+
+The run time of an area prediction grows with the number of grid points,
+not the number of zones, so zones spread around the world are much faster
+predicted one at a time.  get_area_groups() divides the zones into small
+areas of nearby zones, a zone without near neighbours is left to be
+predicted on its own with a point to point run.
+"""
+
+import numpy as np
+
+from hfprop.results import DEFAULT_CHUNK_ROWS, PredictionResult, iter_report_chunks
+from hfprop.usage import get_path_distance
+
+DEFAULT_AREA_STEP = 2.0 # degrees
+# Largest number of grid points per zone in an area prediction, zones that
+# can't be grouped within this are predicted individually
+MAX_POINTS_PER_ZONE = 4
+
+# Column names of the receiver location in the ITURHFProp csv report
+AREA_LAT_KEY = 'rxlat'
+AREA_LNG_KEY = 'rxlng'
+
+
+def get_grid_index(lat, lng, step):
+    return (int(round(lat / step)), int(round(lng / step)))
+
+
+def get_grid_keys(lat, lng, step):
+    """
+    Returns a single integer key for each of the grid points in the arrays
+    of lat and lng.
+    """
+    return np.rint(np.asarray(lat) / step).astype(np.int64) * 100000 + np.rint(np.asarray(lng) / step).astype(np.int64)
+
+
+def get_area(zones, step=DEFAULT_AREA_STEP):
+    """
+    Returns a tuple of (LL lat, LL lng, UR lat, UR lng) defining the smallest
+    area, aligned to multiples of step, containing all of the zones.
+    """
+    lat_idx = [get_grid_index(float(zone['lat']), float(zone['lng']), step)[0] for zone in zones]
+    lng_idx = [get_grid_index(float(zone['lat']), float(zone['lng']), step)[1] for zone in zones]
+    return (max(min(lat_idx) * step, -90.0),
+            max(min(lng_idx) * step, -180.0),
+            min(max(lat_idx) * step, 90.0),
+            min(max(lng_idx) * step, 180.0))
+
+
+def get_area_size(area, step=DEFAULT_AREA_STEP):
+    """
+    Returns the number of receive locations in the area.
+    """
+    ll_lat, ll_lng, ur_lat, ur_lng = area
+    return (int(round((ur_lat - ll_lat) / step)) + 1) * (int(round((ur_lng - ll_lng) / step)) + 1)
+
+
+def get_area_groups(zones, step=DEFAULT_AREA_STEP, max_points=MAX_POINTS_PER_ZONE):
+    """
+    Divides the zones into groups of nearby zones, each to be predicted with
+    one area prediction of no more than max_points grid points per zone.
+    Each zone joins the first group it fits in, or starts a new one.
+    Returns a tuple of (list of groups of two or more zones, list of the
+    zones left to be predicted individually), the zones keep their order.
+    """
+    groups = []
+    for zone in zones:
+        for group in groups:
+            if get_area_size(get_area(group + [zone], step), step) <= max_points * (len(group) + 1):
+                group.append(zone)
+                break
+        else:
+            groups.append([zone])
+    return [group for group in groups if len(group) > 1], [group[0] for group in groups if len(group) == 1]
+
+
+def get_zone_offset(zone, step=DEFAULT_AREA_STEP):
+    """
+    Returns the distance in km from the zone to the grid point it's
+    predicted at.
+    """
+    lat, lng = float(zone['lat']), float(zone['lng'])
+    lat_idx, lng_idx = get_grid_index(lat, lng, step)
+    return get_path_distance(lat, lng, lat_idx * step, lng_idx * step)
+
+
+def get_area_deck(area, step=DEFAULT_AREA_STEP):
+    """
+    Returns the input deck lines defining the area.
+    """
+    ll_lat, ll_lng, ur_lat, ur_lng = area
+    buf = []
+    buf.append('LL.lat {:.6f}'.format(ll_lat))
+    buf.append('LL.lng {:.6f}'.format(ll_lng))
+    buf.append('LR.lat {:.6f}'.format(ll_lat))
+    buf.append('LR.lng {:.6f}'.format(ur_lng))
+    buf.append('UL.lat {:.6f}'.format(ur_lat))
+    buf.append('UL.lng {:.6f}'.format(ll_lng))
+    buf.append('UR.lat {:.6f}'.format(ur_lat))
+    buf.append('UR.lng {:.6f}'.format(ur_lng))
+    buf.append('latinc {:.6f}'.format(step))
+    buf.append('lnginc {:.6f}'.format(step))
+    return buf
+
+
+def get_zone_predictions(csv_file, zones, parameters, step=DEFAULT_AREA_STEP, zeroMidnight=False):
+    """
+    Extracts the rows for each zone from an area prediction in a single pass
+    over the file.  Only the rows for the zones are kept in memory.  Returns
+    a dict of PredictionResults keyed by zone id.
+    """
+    zone_keys = get_grid_keys([float(zone['lat']) for zone in zones], [float(zone['lng']) for zone in zones], step)
+    zone_rows = {zone['id']: [] for zone in zones}
+    for chunk in iter_report_chunks(csv_file, [AREA_LAT_KEY, AREA_LNG_KEY, 'frequency'] + list(parameters)):
+        chunk_keys = get_grid_keys(chunk[:, 0], chunk[:, 1], step)
+        for zone, zone_key in zip(zones, zone_keys):
+            zone_rows[zone['id']].append(chunk[chunk_keys == zone_key, 2:])
+
+    zone_predictions = {}
+    for zone_id, rows in zone_rows.items():
+        rows = np.concatenate(rows) if rows else np.empty((0, len(parameters) + 1))
+        zone_predictions[zone_id] = PredictionResult.from_rows(rows[:, 0], rows[:, 1:], parameters, zeroMidnight=zeroMidnight)
+    return zone_predictions
+
+
+def get_area_maximum(csv_file, area, parameter, step=DEFAULT_AREA_STEP, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Returns a (lat, lng) float32 grid of the maximum value of the parameter
+    at each point in the area over all of the hours and frequencies in the
+    report, e.g. the best BCR at each location.  The report is reduced a
+    chunk at a time.
+    """
+    ll_lat, ll_lng, ur_lat, ur_lng = area
+    shape = (int(round((ur_lat - ll_lat) / step)) + 1, int(round((ur_lng - ll_lng) / step)) + 1)
+    grid = np.full(shape, np.nan, dtype=np.float32)
+    for chunk in iter_report_chunks(csv_file, [AREA_LAT_KEY, AREA_LNG_KEY, parameter], chunk_rows):
+        lat_idx = np.rint((chunk[:, 0] - ll_lat) / step).astype(np.int64)
+        lng_idx = np.rint((chunk[:, 1] - ll_lng) / step).astype(np.int64)
+        np.fmax.at(grid, (lat_idx, lng_idx), chunk[:, 2].astype(np.float32))
+    return grid
@@ -0,0 +1,220 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+An on-disk cache of parsed ITURHFProp predictions.
+
+Entries are keyed by a hash of the rendered input deck, a fingerprint of
+the ITURHFProp executable and a fingerprint of the data directory named in
+the deck.  Rerunning a prediction with an identical deck against the same
+model and data files returns the stored result without starting
+ITURHFProp.  The size of the cache is bounded, the least recently used
+entries are removed first.
+"""
+
+import hashlib
+import os
+import pickle
+import shutil
+from tempfile import NamedTemporaryFile
+
+from hfprop.iturhfprop import FAKE_EXECUTABLE, FAKE_PATH, get_executable, get_fake_settings, is_fake
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'rsgb-psc')
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024 # bytes
+# Change when the type of the stored entries changes
+CACHE_VERSION = 3
+
+_data_fingerprints = {}
+
+
+def get_iturhfprop_version(executable=None):
+    """
+    Returns a string identifying the installed ITURHFProp executable, made
+    up of its resolved path, size and modification time.  Snap installs
+    resolve to /usr/bin/snap so the current snap revision is added.  The
+    settings of the stand-in are added if it's selected.
+    """
+    executable = get_executable(executable)
+    path = FAKE_PATH if executable == FAKE_EXECUTABLE else shutil.which(executable)
+    if not path:
+        return ""
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    version = "{:s}:{:d}:{:d}".format(path, st.st_size, st.st_mtime_ns)
+    if os.path.basename(path) == 'snap':
+        version = "{:s}:{:s}".format(version, os.path.realpath('/snap/iturhfprop/current'))
+    if is_fake(path):
+        version = "{:s}:{:s}".format(version, get_fake_settings())
+    return version
+
+
+def get_data_fingerprint(data_path):
+    """
+    Returns a hash of the names, sizes and modification times of the files
+    in the ITURHFProp data directory.  The directory is only walked once
+    per process.
+    """
+    data_path = os.path.realpath(data_path)
+    if data_path not in _data_fingerprints:
+        h = hashlib.sha256()
+        for root, dirs, files in os.walk(data_path):
+            dirs.sort()
+            for fn in sorted(files):
+                file_path = os.path.join(root, fn)
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    continue
+                h.update("{:s}:{:d}:{:d}\n".format(os.path.relpath(file_path, data_path), st.st_size, st.st_mtime_ns).encode())
+        _data_fingerprints[data_path] = h.hexdigest()
+    return _data_fingerprints[data_path]
+
+
+class PredictionCache:
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE, executable=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.executable = executable
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._size = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __getstate__(self):
+        # Counters start from zero in worker processes, the parent adds
+        # the worker's counts to its own (see add_stats()).
+        state = self.__dict__.copy()
+        state['hits'] = 0
+        state['misses'] = 0
+        state['_size'] = None
+        return state
+
+    def get_key(self, text_in, data_path, *extra):
+        """
+        Returns the cache key for an input deck.  Anything else that
+        changes the parsed result (e.g. the report keys) is passed in extra.
+        """
+        if self._version is None:
+            self._version = get_iturhfprop_version(self.executable)
+        h = hashlib.sha256()
+        h.update(str(CACHE_VERSION).encode())
+        h.update(self._version.encode())
+        h.update(get_data_fingerprint(data_path).encode())
+        h.update(repr(extra).encode())
+        h.update(text_in.encode())
+        return h.hexdigest()
+
+    def _get_entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.pickle')
+
+    def get(self, key, with_report=False):
+        """
+        Returns the stored prediction or None if the key isn't in the cache.
+        If with_report is set a tuple of the prediction and the report
+        stored with it (see put()) is returned, (None, None) for a miss.
+        """
+        entry_path = self._get_entry_path(key)
+        try:
+            with open(entry_path, 'rb') as entry_file:
+                prediction, report = pickle.load(entry_file)
+            # The modification time records the last use of the entry.  An
+            # entry evicted by another process since it was read is a miss.
+            os.utime(entry_path)
+        except Exception:
+            # Missing, evicted, truncated or written by an incompatible
+            # version of a class, run the prediction again
+            self.misses += 1
+            return (None, None) if with_report else None
+        self.hits += 1
+        return (prediction, report) if with_report else prediction
+
+    def put(self, key, prediction, report=None):
+        """
+        Stores a prediction.  The text of the ITURHFProp report may be
+        stored with it, for callers that keep the output of each run.
+        """
+        entry_path = self._get_entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never
+        # see a partially written entry.
+        with NamedTemporaryFile(dir=os.path.dirname(entry_path), prefix='.', delete=False) as entry_file:
+            pickle.dump((prediction, report), entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+            entry_size = entry_file.tell()
+        os.replace(entry_file.name, entry_path)
+        if self._size is None:
+            self._size = self._get_size()
+        else:
+            self._size += entry_size
+        if self._size > self.max_size:
+            self.evict()
+
+    def _get_entries(self):
+        entries = []
+        for root, dirs, files in os.walk(self.cache_dir):
+            for fn in files:
+                if fn.endswith('.pickle'):
+                    try:
+                        st = os.stat(os.path.join(root, fn))
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, os.path.join(root, fn)))
+        return entries
+
+    def _get_size(self):
+        return sum(entry[1] for entry in self._get_entries())
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is no
+        larger than max_size.
+        """
+        entries = sorted(self._get_entries())
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, entry_path in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            size -= entry_size
+        self._size = size
+
+    def clear(self):
+        for mtime, entry_size, entry_path in self._get_entries():
+            os.remove(entry_path)
+        self._size = 0
+
+    def add_stats(self, hits, misses):
+        self.hits += hits
+        self.misses += misses
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def __str__(self):
+        return "Prediction cache {:s}: {:d} hits, {:d} misses".format(self.cache_dir, self.hits, self.misses)
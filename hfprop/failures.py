@@ -0,0 +1,100 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+A ledger of the predictions in a batch that failed.
+
+The batch drivers catch the ITURHFPropError raised by a failed run, add it
+to a FailureLedger and carry on with the rest of the batch, so a bad path
+costs at most its timeout and retries.  The ledger may be written to a
+JSON lines file and read back to run the failed items again on their own,
+e.g. with generatePredictionTable.py --rerun-failures.
+"""
+
+import json
+import os
+import time
+
+
+class FailureLedger:
+
+    def __init__(self):
+        self.failures = []
+
+    def add(self, key, error, **info):
+        """
+        Records the failure of the prediction identified by key.  info holds
+        anything needed to identify the item again, e.g. the rows of the D1
+        table it predicts.
+        """
+        failure = {'key': key,
+                   'error': str(error),
+                   'type': error.__class__.__name__,
+                   'return_code': getattr(error, 'return_code', None),
+                   'attempts': getattr(error, 'attempts', 1),
+                   'time': time.time()}
+        failure.update(info)
+        self.failures.append(failure)
+        print("Failed: {:s}: {:s}".format(str(key), str(error)))
+
+    def update(self, other):
+        self.failures.extend(other.failures)
+
+    def get_keys(self):
+        return [failure['key'] for failure in self.failures]
+
+    def write(self, path):
+        """
+        Writes the ledger to a JSON lines file, an empty ledger removes the
+        file so an old ledger isn't mistaken for the current one.
+        """
+        if not self.failures:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with open(path, 'w') as ledger_file:
+            for failure in self.failures:
+                ledger_file.write(json.dumps(failure) + '\n')
+
+    @classmethod
+    def read(cls, path):
+        """
+        Reads a ledger written by write(), a missing file is an empty ledger
+        as write() removes the file when nothing failed.
+        """
+        ledger = cls()
+        if not os.path.exists(path):
+            return ledger
+        with open(path) as ledger_file:
+            ledger.failures = [json.loads(line) for line in ledger_file if line.strip()]
+        return ledger
+
+    def __len__(self):
+        return len(self.failures)
+
+    def __str__(self):
+        buf = ["Failures: {:d}".format(len(self.failures))]
+        for failure in self.failures:
+            buf.append("  {:s}: {:s} ({:s}, {:d} attempts)".format(str(failure['key']), failure['error'], failure['type'], failure['attempts']))
+        return '\n'.join(buf)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+A stand-in for ITURHFProp for testing and load testing the scripts
+without the model or its data files.
+
+It's run in the same way as the model, e.g.
+
+    fake_iturhfprop.py -s -c input.in output.out
+
+or selected for all of the scripts with PSC_ITURHFPROP=fake (see
+hfprop/iturhfprop.py).  The input deck is parsed and a csv report is
+written with the columns for the RPT_BCR, RPT_E, RPT_NOISESOURCES and
+RPT_NOISETOTAL report formats, a report is always written in csv format.
+The stand-in returns 232 on success like the model.
+
+The mode is set with --mode or PSC_FAKE_MODE:
+
+synthetic   (default) values are calculated from the deck with a crude
+            model of the ionosphere and noise.  The values are plausible
+            but not a prediction, the same deck always gives the same
+            report.
+replay      the report recorded for the deck is copied to the output file,
+            the run fails if there's no recording.
+record      ITURHFProp (or --executable) is run and its report is saved
+            for later replay.
+
+Recordings are held in --recordings or PSC_FAKE_RECORDINGS, keyed by a
+hash of the deck.  The DataFilePath line is left out of the hash so
+recordings made on one machine may be replayed on another.
+
+--latency or PSC_FAKE_LATENCY adds a delay to every run, either a number
+of seconds or a range 'min:max' from which the delay for each deck is
+chosen.
+"""
+
+import argparse
+import hashlib
+import math
+import os
+import shutil
+import subprocess
+import sys
+import time
+from tempfile import NamedTemporaryFile
+
+import numpy as np
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from hfprop.iturhfprop import (DEFAULT_EXECUTABLE, FAKE_LATENCY_ENV, FAKE_MODE_ENV, FAKE_MODES,
+                               FAKE_RECORDINGS_ENV, RETURN_OK, get_recordings_dir, parse_deck)
+
+# Return code of a failed run
+RETURN_ERROR = 1
+
+# The columns written for each report format
+REPORT_COLUMNS = {
+    'RPT_BCR': ['BCR'],
+    'RPT_E': ['Ep'],
+    'RPT_NOISESOURCES': ['FaA', 'FaM', 'FaG'],
+    'RPT_NOISETOTAL': ['FamT'],
+}
+
+# Man-made noise at 1 MHz (dB above kT0b) and its slope (Rec. ITU-R P.372)
+MAN_MADE_NOISE = {
+    'CITY': (76.8, 27.7),
+    'RESIDENTIAL': (72.5, 27.7),
+    'RURAL': (67.2, 27.7),
+    'QUIETRURAL': (53.6, 28.6),
+    'NOISY': (83.2, 37.5),
+    'QUIET': (53.6, 28.6),
+}
+
+R0 = 6371.0 # km
+
+
+def read_deck(input_file):
+    with open(input_file) as deck_file:
+        return parse_deck(deck_file.read())
+
+
+def get_deck_hash(input_file):
+    h = hashlib.sha256()
+    with open(input_file, 'rb') as deck_file:
+        for line in deck_file:
+            if not line.startswith(b'DataFilePath'):
+                h.update(line.rstrip() + b'\n')
+    return h.hexdigest()
+
+
+def get_list(value):
+    return [float(item) for item in value.split(',') if item.strip()]
+
+
+def get_area_points(deck):
+    """
+    Returns arrays of the receiver latitude and longitude of each point in
+    the area, or of the receiver for a point to point deck.
+    """
+    if 'latinc' not in deck:
+        return np.array([float(deck['Path.L_rx.lat'])]), np.array([float(deck['Path.L_rx.lng'])])
+    lat_inc = float(deck['latinc'])
+    lng_inc = float(deck['lnginc'])
+    lats = float(deck['LL.lat']) + lat_inc * np.arange(int(round((float(deck['UR.lat']) - float(deck['LL.lat'])) / lat_inc)) + 1)
+    lngs = float(deck['LL.lng']) + lng_inc * np.arange(int(round((float(deck['UR.lng']) - float(deck['LL.lng'])) / lng_inc)) + 1)
+    lat_grid, lng_grid = np.meshgrid(lats, lngs, indexing='ij')
+    return lat_grid.ravel(), lng_grid.ravel()
+
+
+def get_synthetic_values(deck, hour, freqs, rx_lat, rx_lng):
+    """
+    Returns a dict of {column: (frequency, point) array} for a single hour.
+    """
+    tx_lat = math.radians(float(deck['Path.L_tx.lat']))
+    tx_lng = math.radians(float(deck['Path.L_tx.lng']))
+    month = float(deck.get('Path.month', 1))
+    ssn = float(deck.get('Path.SSN', 0))
+    tx_power = float(deck.get('Path.txpower', 0)) # dBW
+    rx_lat = np.radians(rx_lat)
+    rx_lng = np.radians(rx_lng)
+    f = np.asarray(freqs)[:, np.newaxis]
+
+    a = np.sin((rx_lat - tx_lat) / 2) ** 2 + np.cos(tx_lat) * np.cos(rx_lat) * np.sin((rx_lng - tx_lng) / 2) ** 2
+    distance = 2 * R0 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    mid_lat = np.degrees((tx_lat + rx_lat) / 2)
+    mid_lng = np.degrees(tx_lng + np.angle(np.exp(1j * (rx_lng - tx_lng))) / 2)
+
+    # Daylight and season at the path mid-point
+    local_hour = (hour + mid_lng / 15) % 24
+    day = (1 + np.cos(2 * np.pi * (local_hour - 13) / 24)) / 2
+    summer = np.cos(2 * np.pi * (month - 6.5) / 12) * np.sign(mid_lat)
+    fo_f2 = (2.5 + 0.04 * ssn + 5 * day * (1 + 0.15 * summer)) * (1 - 0.004 * np.abs(mid_lat))
+    muf = fo_f2 * (1 + 2.5 * np.minimum(distance, 4000) / 4000)
+    luf = 1 + 6 * day * (1 + 0.2 * summer) * np.minimum(distance, 4000) / 4000
+
+    values = {}
+    values['BCR'] = 100 / (1 + np.exp((f - muf) / (0.08 * muf))) / (1 + np.exp((luf - f) / 0.5))
+    absorption = 40 * day * (5 / f) ** 2 * (1 + distance / 4000)
+    values['Ep'] = np.maximum(107 + tx_power - 20 * np.log10(np.maximum(distance, 50)) - absorption
+                              - 40 * np.maximum(f / muf - 1, 0), -30)
+
+    c, d = MAN_MADE_NOISE.get(deck.get('Path.ManMadeNoise', 'RESIDENTIAL'), MAN_MADE_NOISE['RESIDENTIAL'])
+    night = 1 - day
+    values['FaA'] = np.maximum((60 + 25 * night) * (1 - 0.005 * np.abs(np.degrees(rx_lat))) - 30 * np.log10(f), 0)
+    values['FaM'] = np.broadcast_to(c - d * np.log10(f), values['FaA'].shape)
+    values['FaG'] = np.broadcast_to(52 - 23 * np.log10(f), values['FaA'].shape)
+    values['FamT'] = 10 * np.log10(10 ** (values['FaA'] / 10) + 10 ** (values['FaM'] / 10) + 10 ** (values['FaG'] / 10))
+    return values
+
+
+def write_synthetic_report(deck, output_file):
+    report_formats = [fmt.strip() for fmt in deck.get('RptFileFormat', 'RPT_BCR').split('|')]
+    parameters = []
+    for fmt in report_formats:
+        if fmt not in REPORT_COLUMNS:
+            print("fake_iturhfprop: ignoring report format {:s}".format(fmt), file=sys.stderr)
+            continue
+        parameters.extend(REPORT_COLUMNS[fmt])
+    hours = get_list(deck['Path.hour'])
+    freqs = get_list(deck['Path.frequency'])
+    rx_lat, rx_lng = get_area_points(deck)
+    month = int(float(deck.get('Path.month', 1)))
+    n_rows = len(freqs) * len(rx_lat)
+
+    with open(output_file, 'w') as report_file:
+        report_file.write(','.join(['Month', 'Hour', 'frequency', 'rxlat', 'rxlng'] + parameters) + '\n')
+        # The rows for each hour are written as a block, frequency by
+        # frequency
+        for hour in hours:
+            values = get_synthetic_values(deck, hour, freqs, rx_lat, rx_lng)
+            columns = [np.full(n_rows, month), np.full(n_rows, hour), np.repeat(freqs, len(rx_lat)),
+                       np.tile(rx_lat, len(freqs)), np.tile(rx_lng, len(freqs))]
+            columns.extend(np.round(values[parameter], 2).ravel() for parameter in parameters)
+            np.savetxt(report_file, np.column_stack(columns), delimiter=',',
+                       fmt=['%d', '%d', '%.3f', '%.2f', '%.2f'] + ['%.2f'] * len(parameters))
+
+
+def get_latency(latency, deck_hash):
+    """
+    Returns the delay in seconds for the deck.  A range 'min:max' gives a
+    delay chosen from the range by the deck hash.
+    """
+    if not latency:
+        return 0.0
+    low, _, high = latency.partition(':')
+    if not high:
+        return float(low)
+    return float(low) + (float(high) - float(low)) * int(deck_hash[:8], 16) / 0xffffffff
+
+
+def get_recording_path(recordings_dir, deck_hash):
+    return os.path.join(recordings_dir, deck_hash[:2], deck_hash + '.csv')
+
+
+def save_recording(output_file, recording_path):
+    os.makedirs(os.path.dirname(recording_path), exist_ok=True)
+    with NamedTemporaryFile(dir=os.path.dirname(recording_path), prefix='.', delete=False) as recording_file:
+        with open(output_file, 'rb') as report_file:
+            shutil.copyfileobj(report_file, recording_file)
+    os.replace(recording_file.name, recording_path)
+
+
+def run(input_file, output_file, mode=None, recordings_dir=None, latency=None, executable=None, silent=False):
+    """
+    Runs the stand-in and returns the ITURHFProp return code.
+    """
+    mode = mode or os.environ.get(FAKE_MODE_ENV) or FAKE_MODES[0]
+    recordings_dir = get_recordings_dir(recordings_dir)
+    if latency is None:
+        latency = os.environ.get(FAKE_LATENCY_ENV)
+    deck_hash = get_deck_hash(input_file)
+    time.sleep(get_latency(latency, deck_hash))
+
+    if mode == 'synthetic':
+        write_synthetic_report(read_deck(input_file), output_file)
+        return_code = RETURN_OK
+    elif mode == 'replay':
+        recording_path = get_recording_path(recordings_dir, deck_hash)
+        if not os.path.exists(recording_path):
+            print("fake_iturhfprop: no recording for {:s} ({:s})".format(input_file, deck_hash), file=sys.stderr)
+            return RETURN_ERROR
+        shutil.copyfile(recording_path, output_file)
+        return_code = RETURN_OK
+    elif mode == 'record':
+        return_code = subprocess.call([executable or DEFAULT_EXECUTABLE] + (['-s'] if silent else []) + ['-c', input_file, output_file])
+        if return_code == RETURN_OK:
+            save_recording(output_file, get_recording_path(recordings_dir, deck_hash))
+    else:
+        print("fake_iturhfprop: unknown mode {:s}".format(mode), file=sys.stderr)
+        return RETURN_ERROR
+
+    if not silent:
+        print("fake_iturhfprop ({:s}): {:s} -> {:s}".format(mode, input_file, output_file))
+    return return_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A stand-in for ITURHFProp.")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file")
+    parser.add_argument("-s", "--silent", action="store_true", help="don't print progress")
+    parser.add_argument("-c", "--csv", action="store_true", help="accepted for compatibility, the report is always csv")
+    parser.add_argument("--mode", choices=FAKE_MODES, help="synthetic, replay or record (default: ${:s} or synthetic)".format(FAKE_MODE_ENV))
+    parser.add_argument("--recordings", help="directory of recorded reports (default: ${:s})".format(FAKE_RECORDINGS_ENV))
+    parser.add_argument("--latency", help="delay added to each run, seconds or min:max (default: ${:s})".format(FAKE_LATENCY_ENV))
+    parser.add_argument("--executable", help="ITURHFProp executable run in record mode (default: {:s})".format(DEFAULT_EXECUTABLE))
+    args = parser.parse_args()
+    return run(args.input_file, args.output_file, args.mode, args.recordings, args.latency, args.executable, args.silent)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
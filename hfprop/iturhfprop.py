@@ -0,0 +1,238 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Selection of the ITURHFProp executable.
+
+The scripts start ITURHFProp with the command returned by get_command().
+The executable defaults to ITURHFProp on the PATH and may be changed with
+the PSC_ITURHFPROP environment variable or set_executable(), e.g. to try a
+local build of the model.  The name 'fake' selects the stand-in in
+hfprop/fake_iturhfprop.py, which needs neither the model nor its data
+files (see that file for its settings).  The setting is held in the
+environment so it's inherited by worker processes.
+
+run_iturhfprop_checked() adds a time limit and retries to each run, set
+with the PSC_TIMEOUT (seconds) and PSC_RETRIES environment variables or
+set_timeout() and set_retries().  By default a run may take as long as it
+likes and isn't retried.  A run that fails every attempt raises an
+ITURHFPropError, which the batch drivers record in a failure ledger (see
+hfprop/failures.py) before carrying on with the rest of the batch.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from hfprop.usage import RunUsage
+
+ITURHFPROP_ENV = 'PSC_ITURHFPROP'
+DEFAULT_EXECUTABLE = 'ITURHFProp'
+FAKE_EXECUTABLE = 'fake'
+FAKE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_iturhfprop.py')
+
+# Settings of the stand-in
+FAKE_MODE_ENV = 'PSC_FAKE_MODE'
+FAKE_RECORDINGS_ENV = 'PSC_FAKE_RECORDINGS'
+FAKE_LATENCY_ENV = 'PSC_FAKE_LATENCY'
+FAKE_MODES = ['synthetic', 'replay', 'record']
+DEFAULT_RECORDINGS_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'rsgb-psc-recordings')
+
+# ITURHFProp's return code for a successful run
+RETURN_OK = 232
+
+TIMEOUT_ENV = 'PSC_TIMEOUT'
+RETRIES_ENV = 'PSC_RETRIES'
+# Delay before the first retry, doubled for each further retry up to
+# MAX_RETRY_BACKOFF
+RETRY_BACKOFF = 0.5 # seconds
+MAX_RETRY_BACKOFF = 8.0
+
+
+class ITURHFPropError(Exception):
+    """
+    A run of ITURHFProp that failed or whose report couldn't be read.
+    return_code and usage are those of the last attempt, if it got as far
+    as running ITURHFProp.
+    """
+
+    def __init__(self, message, return_code=None, usage=None, attempts=1):
+        super().__init__(message)
+        self.return_code = return_code
+        self.usage = usage
+        self.attempts = attempts
+
+    def __reduce__(self):
+        # Raised in worker processes
+        return (self.__class__, (str(self), self.return_code, self.usage, self.attempts))
+
+
+class ITURHFPropTimeout(ITURHFPropError):
+    pass
+
+
+def get_executable(executable=None):
+    return executable or os.environ.get(ITURHFPROP_ENV) or DEFAULT_EXECUTABLE
+
+
+def set_executable(executable):
+    os.environ[ITURHFPROP_ENV] = executable
+
+
+def get_timeout(timeout=None):
+    if timeout is None and os.environ.get(TIMEOUT_ENV):
+        timeout = float(os.environ[TIMEOUT_ENV])
+    return timeout or None
+
+
+def set_timeout(timeout):
+    os.environ[TIMEOUT_ENV] = "{:g}".format(timeout) if timeout else ''
+
+
+def get_retries(retries=None):
+    if retries is None:
+        retries = int(os.environ.get(RETRIES_ENV) or 0)
+    return max(retries, 0)
+
+
+def set_retries(retries):
+    os.environ[RETRIES_ENV] = "{:d}".format(retries)
+
+
+def is_fake(executable=None):
+    executable = get_executable(executable)
+    return executable == FAKE_EXECUTABLE or os.path.realpath(executable) == FAKE_PATH
+
+
+def get_command(executable=None):
+    """
+    Returns the start of the command line used to run ITURHFProp, the
+    options and file names are appended by the caller.
+    """
+    executable = get_executable(executable)
+    if executable == FAKE_EXECUTABLE:
+        return [sys.executable, FAKE_PATH]
+    return [executable]
+
+
+def parse_deck(text_in):
+    """
+    Returns an input deck as a dict of {key: value}, quotes are removed
+    from the values.
+    """
+    deck = {}
+    for line in text_in.splitlines():
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        key, _, value = line.partition(' ')
+        deck[key] = value.strip().strip('"')
+    return deck
+
+
+def run_iturhfprop(options, input_file, output_file, text_in=None, executable=None, timeout=None):
+    """
+    Runs ITURHFProp and waits for it with os.wait4() to collect the
+    resources it used.  options are the command line options, e.g. ['-s',
+    '-c'].  Returns a tuple of (return code, RunUsage), the size of the
+    prediction is read from text_in if it's given.  If the run takes longer
+    than timeout seconds it's killed and ITURHFPropTimeout is raised.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(get_command(executable) + options + [input_file, output_file], stderr=subprocess.STDOUT)
+    lock = threading.Lock()
+    state = {'exited': False, 'timed_out': False}
+
+    def kill():
+        with lock:
+            if not state['exited']:
+                state['timed_out'] = True
+                process.kill()
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    try:
+        if timer:
+            timer.start()
+        # Wait for the process to exit without reaping it, so the timer
+        # can't signal a reused pid, then collect its status and usage
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        with lock:
+            state['exited'] = True
+        _, status, rusage = os.wait4(process.pid, 0)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        if timer:
+            timer.cancel()
+    wall = time.perf_counter() - start
+    # The process has been reaped, tell Popen so it doesn't wait for it
+    process.returncode = os.waitstatus_to_exitcode(status)
+    usage = RunUsage.from_rusage(wall, rusage, process.returncode, parse_deck(text_in) if text_in else None)
+    if state['timed_out']:
+        raise ITURHFPropTimeout("Timed out after {:g}s".format(timeout), process.returncode, usage)
+    return process.returncode, usage
+
+
+def run_iturhfprop_checked(options, input_file, output_file, text_in=None, executable=None, timeout=None, retries=None):
+    """
+    Runs ITURHFProp with run_iturhfprop(), making up to retries further
+    attempts, with a growing delay between them, if a run times out or
+    doesn't return RETURN_OK.  The timeout and retries default to the
+    PSC_TIMEOUT and PSC_RETRIES settings.  Returns the RunUsage of the
+    successful run, raises ITURHFPropError if every attempt fails.
+    """
+    timeout = get_timeout(timeout)
+    retries = get_retries(retries)
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(min(RETRY_BACKOFF * 2 ** (attempt - 1), MAX_RETRY_BACKOFF))
+        try:
+            return_code, usage = run_iturhfprop(options, input_file, output_file, text_in, executable, timeout)
+        except ITURHFPropTimeout as e:
+            error = e
+            continue
+        if return_code == RETURN_OK:
+            return usage
+        error = ITURHFPropError("Return Code {:d}".format(return_code), return_code, usage)
+    error.attempts = retries + 1
+    raise error
+
+
+def get_fake_settings():
+    """
+    Returns a string identifying the settings of the stand-in that change
+    its output, so that its predictions are cached apart from the model's.
+    """
+    mode = os.environ.get(FAKE_MODE_ENV, FAKE_MODES[0])
+    if mode == 'synthetic':
+        return "fake:{:s}".format(mode)
+    return "fake:{:s}:{:s}".format(mode, get_recordings_dir())
+
+
+def get_recordings_dir(recordings_dir=None):
+    return os.path.realpath(recordings_dir or os.environ.get(FAKE_RECORDINGS_ENV) or DEFAULT_RECORDINGS_DIR)
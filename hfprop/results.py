@@ -0,0 +1,197 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Parsing of ITURHFProp csv reports into NumPy arrays.
+"""
+
+import csv
+import mmap
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+# Default number of rows in the chunks returned by iter_report_chunks()
+DEFAULT_CHUNK_ROWS = 65536
+
+
+def format_value(value):
+    """
+    Returns a value as it's written in ITURHFProp's csv report.
+    """
+    return "{:.2f}".format(value)
+
+
+def format_frequency(frequency):
+    """
+    Returns a frequency (MHz) as it's written in ITURHFProp's csv report.
+    """
+    return "{:.3f}".format(frequency)
+
+
+class PredictionResult(Mapping):
+    """
+    The predictions for a single path.  The values are held in a float32
+    array shaped (frequency, hour, parameter), the frequency and hour axes
+    are sorted in ascending order.
+
+    The object may also be used as the dict of the form
+    {frequency: {parameter: [value, ...]}} returned by the original
+    get_predictions_as_dict() functions.  The frequencies are iterated in
+    the order they appear in the report and the values are strings, both
+    formatted with the precision of the report.
+
+    usage is the hfprop.usage.RunUsage of the ITURHFProp run that made the
+    prediction, None if the result was read from the cache.
+    """
+
+    usage = None
+
+    def __init__(self, frequencies, hours, parameters, values, frequency_order=None):
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.hours = np.asarray(hours, dtype=np.int16)
+        self.parameters = list(parameters)
+        self.values = np.asarray(values, dtype=np.float32).reshape(len(self.frequencies), len(self.hours), len(self.parameters))
+        if frequency_order is None:
+            frequency_order = range(len(self.frequencies))
+        # Indices of the frequencies in the order they appear in the report
+        self.frequency_order = list(frequency_order)
+        self.frequency_labels = [format_frequency(freq) for freq in self.frequencies]
+
+    @classmethod
+    def from_rows(cls, frequencies, values, parameters, zeroMidnight=False):
+        """
+        Creates a result from the rows of a report.  frequencies holds the
+        frequency of each row and values the parameters of each row.  The
+        rows for each frequency must be in hour order, hours are numbered
+        from 1 or, if zeroMidnight is set, the last hour is moved to the
+        start and numbered 0.
+        """
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float32).reshape(len(frequencies), len(parameters))
+        unique_freqs, first_idx, inverse = np.unique(frequencies, return_index=True, return_inverse=True)
+        n_hours = len(frequencies) // len(unique_freqs) if len(unique_freqs) else 0
+        values = values[np.argsort(inverse, kind='stable')].reshape(len(unique_freqs), n_hours, len(parameters))
+        hours = np.arange(1, n_hours + 1)
+        if zeroMidnight:
+            values = np.roll(values, 1, axis=1)
+            hours = np.roll(hours, 1) % 24
+        return cls(unique_freqs, hours, parameters, values, frequency_order=np.argsort(first_idx))
+
+    def get_parameter(self, parameter):
+        """
+        Returns a (frequency, hour) array of the parameter's values.
+        """
+        return self.values[:, :, self.parameters.index(parameter)]
+
+    def get_frequency_index(self, frequency):
+        idx = np.flatnonzero(np.isclose(self.frequencies, float(frequency)))
+        if not len(idx):
+            raise KeyError(frequency)
+        return int(idx[0])
+
+    def __getitem__(self, frequency):
+        freq_idx = self.get_frequency_index(frequency)
+        return {parameter: [format_value(value) for value in self.values[freq_idx, :, param_idx]]
+                for param_idx, parameter in enumerate(self.parameters)}
+
+    def __iter__(self):
+        return (self.frequency_labels[idx] for idx in self.frequency_order)
+
+    def __len__(self):
+        return len(self.frequencies)
+
+    def as_dict(self):
+        return {freq: self[freq] for freq in self}
+
+
+def get_column_indices(csv_file, columns):
+    """
+    Returns the index of each of the named columns in the report.
+    """
+    with open(csv_file) as csvfile:
+        header = [name.strip() for name in next(csv.reader(csvfile))]
+    return [header.index(column) for column in columns]
+
+
+def get_report_columns(csv_file, parameters):
+    """
+    Returns the indices of the frequency column and of each parameter's
+    column in the report.
+    """
+    return get_column_indices(csv_file, ['frequency'] + list(parameters))
+
+
+def iter_report_chunks(csv_file, columns, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Yields the named columns of a report as (chunk_rows, len(columns))
+    float64 arrays, the last chunk may be shorter.  The report is memory
+    mapped and parsed a block at a time, so memory use doesn't depend on
+    the size of the report.  This is intended for area predictions where
+    the results may be reduced as they are read, e.g.
+
+        for chunk in iter_report_chunks(fn, ['BCR']):
+            bcr_max = max(bcr_max, chunk[:, 0].max())
+    """
+    usecols = get_column_indices(csv_file, columns)
+    with open(csv_file, 'rb') as report_file:
+        if os.fstat(report_file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(report_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Skip the header
+            start = mm.find(b'\n') + 1
+            if start == 0:
+                return
+            # The file is parsed in blocks of whole lines, rows that don't
+            # fill a chunk are carried over into the next block.
+            block_size = chunk_rows * 64
+            remainder = np.empty((0, len(columns)))
+            while start < len(mm):
+                end = mm.find(b'\n', min(start + block_size, len(mm) - 1))
+                end = len(mm) if end == -1 else end + 1
+                lines = mm[start:end].decode().splitlines()
+                start = end
+                if not any(line.strip() for line in lines):
+                    continue
+                block = np.loadtxt(lines, delimiter=',', usecols=usecols, ndmin=2)
+                if len(remainder):
+                    block = np.concatenate((remainder, block))
+                n_chunks = len(block) // chunk_rows
+                for idx in range(n_chunks):
+                    yield block[idx * chunk_rows:(idx + 1) * chunk_rows]
+                remainder = block[n_chunks * chunk_rows:]
+            if len(remainder):
+                yield remainder
+
+
+def get_predictions_as_dict(csv_file, parameters, zeroMidnight=False):
+    """
+    Reads the parameters from an ITURHFProp csv report and returns a
+    PredictionResult.  (The name is kept from the original dict based
+    parser, the result may still be used as a dict.)
+    """
+    usecols = get_report_columns(csv_file, parameters)
+    data = np.loadtxt(csv_file, delimiter=',', skiprows=1, usecols=usecols, ndmin=2)
+    return PredictionResult.from_rows(data[:, 0], data[:, 1:], parameters, zeroMidnight=zeroMidnight)
@@ -0,0 +1,279 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+An adaptive scheduler for batches of ITURHFProp runs.
+
+A fixed number of workers either leaves a host idle or overloads it, and
+the best number depends on the host and on the mix of jobs.  The
+AdaptiveScheduler runs a batch of jobs on a thread or process pool and
+tunes the number running at once as it goes, AIMD style: after each
+round (as many completions as the current limit) the limit is increased
+by one while there's spare CPU or the throughput is still improving, and
+multiplied by DECREASE_FACTOR if the last increase made the throughput
+worse, the load average climbs above MAX_LOAD per core or memory runs
+low.  Throughput is measured in cost per second, where the cost of a job
+is an estimate of its run time (see get_job_cost()).  Jobs are started
+longest first so the batch doesn't end waiting on a single long run.
+
+    scheduler = AdaptiveScheduler(executor='process')
+    results = scheduler.map(run_group, groups, costs=[get_job_cost(...) for group in groups])
+    print(scheduler)
+"""
+
+import math
+import os
+import resource
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+# Fractional loss of throughput taken as a real change
+TOLERANCE = 0.05
+DECREASE_FACTOR = 0.75
+# Busy fraction of the CPUs below which there's spare capacity
+MAX_CPU = 0.9
+# 1 minute load average per core above which the limit is cut
+MAX_LOAD = 2.0
+# Fraction of memory kept free
+MEMORY_RESERVE = 0.1
+
+
+def get_job_cost(distance, frequencies, hours=24, points=1):
+    """
+    Returns an estimate of the relative run time of a prediction from its
+    path length (km) and the number of frequencies, hours and receive
+    locations.
+    """
+    return max(distance, 100.0) * frequencies * hours * points
+
+
+def get_cpu_times():
+    """
+    Returns the (busy, total) CPU time of the host from /proc/stat, None
+    where it isn't available.
+    """
+    try:
+        with open('/proc/stat') as stat_file:
+            values = [int(value) for value in stat_file.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    return sum(values) - idle, sum(values)
+
+
+def get_memory():
+    """
+    Returns the (available, total) memory of the host in bytes from
+    /proc/meminfo, None where it isn't available.
+    """
+    meminfo = {}
+    try:
+        with open('/proc/meminfo') as meminfo_file:
+            for line in meminfo_file:
+                key, _, value = line.partition(':')
+                meminfo[key] = int(value.split()[0]) * 1024
+        return meminfo['MemAvailable'], meminfo['MemTotal']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def get_grandchild_rss(pid=None):
+    """
+    Returns the largest resident set size in bytes of the live
+    grandchildren of the process (by default this one) from /proc, i.e.
+    the ITURHFProp runs of its pool worker processes.  Returns 0 where
+    there are none or /proc isn't available.
+    """
+    pid = pid or os.getpid()
+    parents = {}
+    rss = {}
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/{:s}/stat'.format(entry)) as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue
+        # The command name may hold spaces, the fields follow its last ')'
+        fields = stat[stat.rfind(')') + 2:].split()
+        parents[int(entry)] = int(fields[1])
+        rss[int(entry)] = int(fields[21]) * page_size
+    children = {child for child, parent in parents.items() if parent == pid}
+    return max((rss[grandchild] for grandchild, parent in parents.items() if parent in children), default=0)
+
+
+class AdaptiveScheduler:
+
+    def __init__(self, initial=None, min_concurrent=1, max_concurrent=None, executor='thread'):
+        cpus = os.cpu_count() or 1
+        self.max_concurrent = max_concurrent or 2 * cpus
+        self.min_concurrent = max(1, min(min_concurrent, self.max_concurrent))
+        self.limit = max(self.min_concurrent, min(initial or cpus, self.max_concurrent))
+        self.executor = executor
+        self.jobs = 0
+        self.cost = 0.0
+        self.elapsed = 0.0
+        self.peak = self.limit
+        self.adjustments = []
+        self._round_start = None
+        self._round_cost = 0.0
+        self._round_jobs = 0
+        self._round_cpu = None
+        self._last_throughput = None
+        self._last_change = 0
+        self._job_rss = 0
+
+    def get_executor(self):
+        if self.executor == 'process':
+            return ProcessPoolExecutor(max_workers=self.max_concurrent)
+        return ThreadPoolExecutor(max_workers=self.max_concurrent)
+
+    def map(self, fn, *iterables, costs=None):
+        """
+        Calls fn with the arguments taken from the iterables, like
+        Executor.map(), and returns the list of results in the same order.
+        The jobs are started in decreasing order of cost.  An exception
+        raised by a job is raised once the running jobs have finished.
+        """
+        jobs = list(zip(*iterables))
+        costs = [1.0] * len(jobs) if costs is None else [float(cost) for cost in costs]
+        queue = deque(sorted(range(len(jobs)), key=lambda idx: -costs[idx]))
+        results = [None] * len(jobs)
+        running = {}
+        start = time.perf_counter()
+        self._start_round()
+        with self.get_executor() as executor:
+            while queue or running:
+                while queue and len(running) < self.limit:
+                    idx = queue.popleft()
+                    running[executor.submit(fn, *jobs[idx])] = idx
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx = running.pop(future)
+                    try:
+                        results[idx] = future.result()
+                    except BaseException:
+                        queue.clear()
+                        raise
+                    self._job_done(costs[idx])
+        self.elapsed += time.perf_counter() - start
+        return results
+
+    def _start_round(self):
+        self._round_start = time.perf_counter()
+        self._round_cost = 0.0
+        self._round_jobs = 0
+        self._round_cpu = get_cpu_times()
+
+    def _job_done(self, cost):
+        self.jobs += 1
+        self.cost += cost
+        self._round_cost += cost
+        self._round_jobs += 1
+        if self._round_jobs >= self.limit:
+            self.adjust()
+            self._start_round()
+
+    def get_cpu_utilisation(self):
+        cpu_times = get_cpu_times()
+        if cpu_times is None or self._round_cpu is None or cpu_times[1] <= self._round_cpu[1]:
+            return None
+        return (cpu_times[0] - self._round_cpu[0]) / (cpu_times[1] - self._round_cpu[1])
+
+    def is_memory_low(self):
+        """
+        True if there isn't room for another ITURHFProp process as large as
+        the largest so far, while keeping MEMORY_RESERVE of memory free.
+        With a thread pool ITURHFProp runs as a child of this process and
+        its size is taken from getrusage() once it's been reaped.  With a
+        process pool the runs are grandchildren, which getrusage() doesn't
+        see until the workers exit, so the size of the live ones is sampled
+        from /proc at the end of each round instead.
+        """
+        memory = get_memory()
+        if memory is None:
+            return False
+        available, total = memory
+        self._job_rss = max(self._job_rss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+        if self.executor == 'process':
+            self._job_rss = max(self._job_rss, get_grandchild_rss())
+        return available < MEMORY_RESERVE * total + self._job_rss
+
+    def adjust(self):
+        """
+        Sets the limit for the next round from the throughput, CPU use, load
+        and free memory of the round just finished.
+        """
+        elapsed = time.perf_counter() - self._round_start
+        throughput = self._round_cost / elapsed if elapsed > 0 else None
+        cpu = self.get_cpu_utilisation()
+        load = os.getloadavg()[0] / (os.cpu_count() or 1) if hasattr(os, 'getloadavg') else 0.0
+        limit = self.limit
+        if self.is_memory_low():
+            reason = 'memory'
+            limit = math.floor(limit * DECREASE_FACTOR)
+        elif load > MAX_LOAD:
+            reason = 'load'
+            limit = math.floor(limit * DECREASE_FACTOR)
+        elif (self._last_change > 0 and throughput is not None and self._last_throughput
+              and throughput < self._last_throughput * (1 - TOLERANCE)):
+            reason = 'throughput'
+            limit = math.floor(limit * DECREASE_FACTOR)
+        elif (cpu is None or cpu < MAX_CPU or throughput is None or not self._last_throughput
+              or throughput > self._last_throughput * (1 + TOLERANCE)):
+            reason = 'increase'
+            limit += 1
+        else:
+            reason = 'hold'
+        # A change stopped by the bounds keeps its reason, 'hold' is only
+        # recorded when no change was wanted
+        limit = max(self.min_concurrent, min(limit, self.max_concurrent))
+        self._last_change = limit - self.limit
+        self._last_throughput = throughput
+        self.adjustments.append((time.time(), self.limit, limit, throughput, cpu, load, reason))
+        self.limit = limit
+        self.peak = max(self.peak, limit)
+
+    def get_stats(self):
+        return {'jobs': self.jobs, 'cost': self.cost, 'elapsed': self.elapsed, 'limit': self.limit, 'peak': self.peak,
+                'adjustments': len(self.adjustments)}
+
+    def __str__(self):
+        buf = []
+        throughput = self.cost / self.elapsed if self.elapsed else 0.0
+        buf.append("Scheduler: {:d} jobs in {:.1f}s, {:.4g} cost/s, concurrency {:d} (peak {:d}, range {:d}-{:d})".format(
+                   self.jobs, self.elapsed, throughput, self.limit, self.peak, self.min_concurrent, self.max_concurrent))
+        reasons = {}
+        for adjustment in self.adjustments:
+            reasons[adjustment[-1]] = reasons.get(adjustment[-1], 0) + 1
+        if reasons:
+            buf.append("  Adjustments: " + ", ".join("{:s} {:d}".format(reason, count) for reason, count in sorted(reasons.items())))
+        return '\n'.join(buf)
@@ -0,0 +1,216 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Working space for the ITURHFProp input and output files.
+
+Each process creates a single working directory under the scratch root
+the first time it's used, by default /dev/shm where it exists so the
+files never touch the disk.  The root may be set with the PSC_SCRATCH_DIR
+environment variable.  The files for each run are given unique names in
+the directory and are removed as soon as the run is finished, even if the
+run fails.  The directory is removed when the process exits normally.
+Pool workers exit with os._exit(), skipping atexit handlers, so the
+directories of processes that no longer exist are swept up the next time
+a process creates its directory.
+
+The counters of runs and bytes are kept per process.  Worker processes
+return theirs with pop_stats() for the parent to add with add_stats().
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from hfprop.timing import stage_timer
+
+DEFAULT_SCRATCH_ROOT = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+DIR_PREFIX = 'proppy_'
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_dir(path, pid):
+    # Forked children inherit the handler, only the owner removes the directory
+    if os.getpid() == pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def remove_stale_dirs(root):
+    """
+    Removes the working directories left under root by processes that no
+    longer exist.
+    """
+    try:
+        entries = os.listdir(root)
+    except OSError:
+        return
+    for entry in entries:
+        pid = entry[len(DIR_PREFIX):].partition('_')[0]
+        if not entry.startswith(DIR_PREFIX) or not pid.isdigit() or is_running(int(pid)):
+            continue
+        path = os.path.join(root, entry)
+        try:
+            if not os.path.isdir(path) or os.stat(path).st_uid != os.getuid():
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class ScratchRun:
+
+    def __init__(self, input_file, output_file):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.bytes_written = 0
+        self.output_bytes = 0
+
+
+class ScratchSpace:
+
+    def __init__(self, root=None):
+        self.root = root or os.environ.get('PSC_SCRATCH_DIR', DEFAULT_SCRATCH_ROOT)
+        self.runs = 0
+        self.bytes_written = 0
+        self.output_bytes = 0
+        self._dir = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Worker processes create their own directory
+        state = self.__dict__.copy()
+        state['_dir'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _check_pid(self):
+        # Forked worker processes start with a copy of the parent's
+        # counters, which the parent already holds, and its directory
+        if self._pid != os.getpid():
+            self.runs = 0
+            self.bytes_written = 0
+            self.output_bytes = 0
+            self._dir = None
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+
+    def get_dir(self):
+        """
+        Returns the working directory of the current process, creating it
+        if required.
+        """
+        self._check_pid()
+        with self._lock:
+            if self._dir is None:
+                os.makedirs(self.root, exist_ok=True)
+                remove_stale_dirs(self.root)
+                self._dir = tempfile.mkdtemp(prefix="{:s}{:d}_".format(DIR_PREFIX, self._pid), dir=self.root)
+                atexit.register(remove_dir, self._dir, self._pid)
+        return self._dir
+
+    @contextmanager
+    def open_run(self, text_in, input_file=None, output_file=None):
+        """
+        Writes the input deck to the working directory and yields a
+        ScratchRun holding the names of the input and output files.  Both
+        files are removed when the block exits.  If the caller names the
+        input and output files they are used instead and are left in place
+        for inspection.
+        """
+        keep_files = bool(input_file and output_file)
+        if keep_files:
+            fd = os.open(input_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            # Don't let a failed run pick up the output of an earlier one
+            if os.path.exists(output_file):
+                os.remove(output_file)
+        else:
+            fd, input_file = tempfile.mkstemp(prefix=DIR_PREFIX, suffix='.in', dir=self.get_dir())
+            output_file = input_file[:-3] + '.out'
+        run = ScratchRun(input_file, output_file)
+        try:
+            with stage_timer.stage('write_input'):
+                with os.fdopen(fd, 'w') as f:
+                    f.write(text_in)
+                run.bytes_written = os.path.getsize(input_file)
+            yield run
+        finally:
+            with stage_timer.stage('cleanup'):
+                if os.path.exists(output_file):
+                    run.output_bytes = os.path.getsize(output_file)
+                    if not keep_files:
+                        os.remove(output_file)
+                if not keep_files:
+                    os.remove(input_file)
+            self._check_pid()
+            with self._lock:
+                self.runs += 1
+                self.bytes_written += run.bytes_written
+                self.output_bytes += run.output_bytes
+
+    def get_stats(self):
+        self._check_pid()
+        with self._lock:
+            return {'runs': self.runs, 'bytes_written': self.bytes_written, 'output_bytes': self.output_bytes}
+
+    def pop_stats(self):
+        """
+        Returns the counters of the current process and clears them.
+        """
+        self._check_pid()
+        with self._lock:
+            stats = {'runs': self.runs, 'bytes_written': self.bytes_written, 'output_bytes': self.output_bytes}
+            self.runs = 0
+            self.bytes_written = 0
+            self.output_bytes = 0
+        return stats
+
+    def add_stats(self, stats):
+        self._check_pid()
+        with self._lock:
+            self.runs += stats['runs']
+            self.bytes_written += stats['bytes_written']
+            self.output_bytes += stats['output_bytes']
+
+    def __str__(self):
+        return "Scratch space {:s}: {:d} runs, {:d} bytes of input written, {:d} bytes of output".format(self.root, self.runs, self.bytes_written, self.output_bytes)
+
+
+default_scratch_space = ScratchSpace()
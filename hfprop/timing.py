@@ -0,0 +1,193 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Timing of the stages of a prediction run.
+
+The scripts wrap each stage of a prediction (building the deck, writing
+the input file, running ITURHFProp, parsing the report, writing the
+results) in
+
+    with stage_timer.stage('parse'):
+        ...
+
+and the batch drivers are decorated with @stage_timer.timed(name).
+
+The timer is disabled by default and stage() then returns a shared object
+that does nothing, so the hooks cost a method call and a test.  Enable it
+with enable(), or by setting the PSC_PROFILE environment variable (to a
+file name to also write a trace).  The summary (str(stage_timer)) gives
+the count, total, median, 95th percentile and maximum time of each stage.
+The trace is a Chrome trace event file, open it with chrome://tracing or
+https://ui.perfetto.dev.
+
+Worker processes time their own stages, return pop_records() with their
+results and the parent adds them with add_records().
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+PROFILE_ENV = 'PSC_PROFILE'
+
+
+class NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.add(self.name, self.start, time.perf_counter())
+        return False
+
+
+class StageTimer:
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_file = None
+        self.durations = defaultdict(list)
+        self.events = []
+        self._pid = os.getpid()
+        setting = os.environ.get(PROFILE_ENV)
+        if setting:
+            self.enable(None if setting == '1' else setting)
+
+    def enable(self, trace_file=None):
+        """
+        Starts timing, the setting is copied to the environment so that
+        worker processes time their stages too.
+        """
+        self.enabled = True
+        self.trace_file = trace_file
+        os.environ[PROFILE_ENV] = trace_file or '1'
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def timed(self, name):
+        """
+        Decorator timing each call of a function as a stage, used for the
+        batch drivers.
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _check_pid(self):
+        # Forked worker processes start with a copy of the parent's records,
+        # which the parent already holds
+        if self._pid != os.getpid():
+            self.durations = defaultdict(list)
+            self.events = []
+            self._pid = os.getpid()
+
+    def add(self, name, start, end):
+        self._check_pid()
+        self.durations[name].append(end - start)
+        if self.trace_file:
+            # perf_counter() is the system wide monotonic clock on Linux so
+            # the events from all of the processes share a time base.
+            self.events.append((name, start, end, os.getpid(), threading.get_ident()))
+
+    def pop_records(self):
+        """
+        Returns the stages recorded so far and clears them.
+        """
+        self._check_pid()
+        records = (dict(self.durations), self.events)
+        self.durations = defaultdict(list)
+        self.events = []
+        return records
+
+    def add_records(self, records):
+        durations, events = records
+        for name, stage_durations in durations.items():
+            self.durations[name].extend(stage_durations)
+        self.events.extend(events)
+
+    def get_summary(self):
+        """
+        Returns a dict of {stage: {count, total, p50, p95, max}}, times are
+        in seconds.
+        """
+        summary = {}
+        for name, stage_durations in self.durations.items():
+            values = np.array(stage_durations)
+            p50, p95 = np.percentile(values, [50, 95])
+            summary[name] = {'count': len(values), 'total': values.sum(), 'p50': p50, 'p95': p95, 'max': values.max()}
+        return summary
+
+    def write_trace(self, trace_file=None):
+        """
+        Writes the recorded stages as a Chrome trace event file.
+        """
+        trace_file = trace_file or self.trace_file
+        if not trace_file:
+            return
+        trace_events = [{'name': name, 'cat': 'psc', 'ph': 'X', 'ts': start * 1e6, 'dur': (end - start) * 1e6, 'pid': pid, 'tid': tid}
+                        for name, start, end, pid, tid in self.events]
+        with open(trace_file, 'w') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+    def __str__(self):
+        buf = []
+        buf.append("{:28s}{:>8s}{:>12s}{:>12s}{:>12s}{:>12s}".format("Stage", "Count", "Total (s)", "p50 (ms)", "p95 (ms)", "Max (ms)"))
+        for name, stats in self.get_summary().items():
+            buf.append("{:28s}{:>8d}{:>12.3f}{:>12.3f}{:>12.3f}{:>12.3f}".format(name, stats['count'], stats['total'], stats['p50'] * 1e3, stats['p95'] * 1e3, stats['max'] * 1e3))
+        return '\n'.join(buf)
+
+
+stage_timer = StageTimer()
@@ -0,0 +1,233 @@
+"""
+MIT License
+
+Copyright (c) 2019 James Watson
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Resource accounting of ITURHFProp runs.
+
+Each run's wall time, user and system CPU time and maximum resident set
+size (from os.wait4()) are held in a RunUsage, along with the size of the
+prediction: the number of frequencies, hours and receive locations and
+the path length.  The runners attach it to the returned PredictionResult
+as result.usage, it's None for a result read from the cache.  Results of
+an area prediction share the usage of their run.
+
+A UsageSummary collects the usage of a batch of runs (a D1 table, noise
+sweep or radcom page), e.g.
+
+    usage_summary = UsageSummary()
+    run_radcom_predictions(45.0, 1.5, 50, usage_summary=usage_summary)
+    print(usage_summary)
+"""
+
+import csv
+import math
+from collections.abc import Mapping
+
+import numpy as np
+
+R0 = 6371.0 # km
+
+USAGE_FIELDS = ['wall', 'user', 'system', 'max_rss', 'return_code', 'frequencies', 'hours', 'points', 'distance']
+
+
+def get_path_distance(tx_lat, tx_lng, rx_lat, rx_lng):
+    """
+    Returns the great circle distance in km between two points given in
+    degrees.
+    """
+    tx_lat, tx_lng, rx_lat, rx_lng = (math.radians(float(value)) for value in [tx_lat, tx_lng, rx_lat, rx_lng])
+    a = math.sin((rx_lat - tx_lat) / 2) ** 2 + math.cos(tx_lat) * math.cos(rx_lat) * math.sin((rx_lng - tx_lng) / 2) ** 2
+    return 2 * R0 * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def get_deck_size(deck):
+    """
+    Returns a tuple of (frequencies, hours, receive locations, path length
+    in km) for a deck parsed by hfprop.iturhfprop.parse_deck().
+    """
+    frequencies = len([f for f in deck.get('Path.frequency', '').split(',') if f.strip()])
+    hours = len([h for h in deck.get('Path.hour', '').split(',') if h.strip()])
+    points = 1
+    if 'latinc' in deck:
+        points = ((int(round((float(deck['UR.lat']) - float(deck['LL.lat'])) / float(deck['latinc']))) + 1) *
+                  (int(round((float(deck['UR.lng']) - float(deck['LL.lng'])) / float(deck['lnginc']))) + 1))
+    distance = 0.0
+    if 'Path.L_tx.lat' in deck and 'Path.L_rx.lat' in deck:
+        distance = get_path_distance(*(deck[key] for key in ['Path.L_tx.lat', 'Path.L_tx.lng', 'Path.L_rx.lat', 'Path.L_rx.lng']))
+    return frequencies, hours, points, distance
+
+
+class RunUsage:
+
+    __slots__ = USAGE_FIELDS
+
+    def __init__(self, wall=0.0, user=0.0, system=0.0, max_rss=0, return_code=0, frequencies=0, hours=0, points=1, distance=0.0):
+        self.wall = wall
+        self.user = user
+        self.system = system
+        self.max_rss = max_rss # KiB
+        self.return_code = return_code
+        self.frequencies = frequencies
+        self.hours = hours
+        self.points = points
+        self.distance = distance
+
+    @classmethod
+    def from_rusage(cls, wall, rusage, return_code, deck=None):
+        frequencies, hours, points, distance = get_deck_size(deck) if deck else (0, 0, 1, 0.0)
+        return cls(wall, rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss, return_code, frequencies, hours, points, distance)
+
+    def __getstate__(self):
+        return self.as_dict()
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def cpu(self):
+        return self.user + self.system
+
+    @property
+    def predictions(self):
+        """
+        The number of (frequency, hour, location) predictions in the run.
+        """
+        return self.frequencies * self.hours * self.points
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in USAGE_FIELDS}
+
+    def __repr__(self):
+        return "RunUsage({:s})".format(", ".join("{:s}={!r}".format(field, getattr(self, field)) for field in USAGE_FIELDS))
+
+
+def attach_usage(result, usage):
+    """
+    Sets the usage of a PredictionResult, or of each of a dict of them
+    keyed by zone.
+    """
+    if hasattr(result, 'usage'):
+        result.usage = usage
+    elif isinstance(result, Mapping):
+        for zone_result in result.values():
+            zone_result.usage = usage
+
+
+class UsageSummary:
+
+    def __init__(self):
+        self.runs = []
+        self._seen = set()
+
+    def add(self, usage):
+        """
+        Adds a run.  None (a cached result) and runs that have already been
+        added (the other zones of an area prediction) are ignored.
+        """
+        if usage is None or id(usage) in self._seen:
+            return
+        self._seen.add(id(usage))
+        self.runs.append(usage)
+
+    def add_result(self, result):
+        """
+        Adds the run of a PredictionResult, or the runs of a dict of them
+        keyed by zone.
+        """
+        if hasattr(result, 'usage'):
+            self.add(result.usage)
+        elif isinstance(result, Mapping):
+            for zone_result in result.values():
+                self.add(getattr(zone_result, 'usage', None))
+
+    def update(self, other):
+        """
+        Adds the runs of another summary, e.g. one returned by a worker
+        process.
+        """
+        for usage in other.runs:
+            self.add(usage)
+
+    def get_summary(self):
+        """
+        Returns a dict of the totals and the mean, 95th percentile and maximum
+        of the wall time, CPU time and max RSS of the runs.
+        """
+        summary = {'runs': len(self.runs)}
+        if not self.runs:
+            return summary
+        for name in ['wall', 'cpu', 'user', 'system', 'max_rss']:
+            values = np.array([getattr(usage, name) for usage in self.runs], dtype=np.float64)
+            summary[name] = {'total': values.sum(), 'mean': values.mean(), 'p95': np.percentile(values, 95), 'max': values.max()}
+        predictions = sum(usage.predictions for usage in self.runs)
+        summary['predictions'] = predictions
+        summary['cpu_per_prediction'] = summary['cpu']['total'] / predictions if predictions else None
+        return summary
+
+    def get_scaling(self, key='frequencies'):
+        """
+        Returns a list of (value, runs, mean wall, mean CPU, mean max RSS) for
+        each value of key (frequencies, hours, points or distance, the
+        distance is grouped into 1000km bins).
+        """
+        groups = {}
+        for usage in self.runs:
+            value = getattr(usage, key)
+            if key == 'distance':
+                value = int(value // 1000) * 1000
+            groups.setdefault(value, []).append(usage)
+        return [(value,
+                 len(runs),
+                 np.mean([usage.wall for usage in runs]),
+                 np.mean([usage.cpu for usage in runs]),
+                 np.mean([usage.max_rss for usage in runs]))
+                for value, runs in sorted(groups.items())]
+
+    def write_csv(self, csv_file):
+        """
+        Writes the usage of each run to a csv file.
+        """
+        with open(csv_file, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=USAGE_FIELDS)
+            writer.writeheader()
+            writer.writerows(usage.as_dict() for usage in self.runs)
+
+    def __str__(self):
+        summary = self.get_summary()
+        buf = []
+        buf.append("ITURHFProp usage: {:d} runs".format(summary['runs']))
+        if not self.runs:
+            return buf[0]
+        buf.append("{:12s}{:>12s}{:>12s}{:>12s}{:>12s}".format("", "Total", "Mean", "p95", "Max"))
+        for name, label in [('wall', 'Wall (s)'), ('cpu', 'CPU (s)'), ('user', 'User (s)'), ('system', 'System (s)')]:
+            stats = summary[name]
+            buf.append("{:12s}{:>12.3f}{:>12.3f}{:>12.3f}{:>12.3f}".format(label, stats['total'], stats['mean'], stats['p95'], stats['max']))
+        stats = summary['max_rss']
+        buf.append("{:12s}{:>12s}{:>12.0f}{:>12.0f}{:>12.0f}".format("RSS (KiB)", "", stats['mean'], stats['p95'], stats['max']))
+        if summary['cpu_per_prediction'] is not None:
+            buf.append("CPU per frequency/hour/location: {:.3f} ms".format(summary['cpu_per_prediction'] * 1e3))
+        buf.append("{:>12s}{:>8s}{:>12s}{:>12s}{:>12s}".format("Frequencies", "Runs", "Wall (s)", "CPU (s)", "RSS (KiB)"))
+        for value, runs, wall, cpu, max_rss in self.get_scaling('frequencies'):
+            buf.append("{:>12d}{:>8d}{:>12.3f}{:>12.3f}{:>12.0f}".format(value, runs, wall, cpu, max_rss))
+        return '\n'.join(buf)
@@ -29,13 +29,22 @@ RPT_NOISESOURCES		Noise (Atmospheric) FaA, (Man-made) FaM & (Galactic) FaG (dB)
 RPT_NOISETOTAL			Total Noise, FamT (dB)
 """
 
-import csv
 import datetime
-from math import log10
+from math import log10, pi
 from operator import sub
 import os
-import subprocess
-from tempfile import NamedTemporaryFile
+import sys
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from hfprop.area import DEFAULT_AREA_STEP, get_area, get_area_deck, get_area_groups, get_area_size, get_zone_offset, get_zone_predictions
+from hfprop.cache import PredictionCache
+from hfprop.failures import FailureLedger
+from hfprop.iturhfprop import ITURHFPropError, run_iturhfprop_checked
+from hfprop.results import get_predictions_as_dict
+from hfprop.scheduler import AdaptiveScheduler, get_job_cost
+from hfprop.scratch import default_scratch_space
+from hfprop.timing import stage_timer
+from hfprop.usage import R0, UsageSummary, attach_usage, get_path_distance
 
 target_zones = [{"id":"UA_MOSCOW", "location":"UA Moscow", "path":"SHORTPATH", "lat":55.7558, "lng":37.6173},
         {"id":"UA_YAKUTSK", "location":"UA Yakutsk, Siberia", "path":"SHORTPATH", "lat":62.0355, "lng":129.6755},
@@ -72,54 +81,98 @@ target_zones = [{"id":"UA_MOSCOW", "location":"UA Moscow", "path":"SHORTPATH", "
 
 
 
-def run_noise_predictions(tx_lat, tx_lng, traffic, noise_level, path_ssn, path_month, path_year, data_path):
-    predictions_list = []
-    for zone in target_zones:
-        rx_lat = float(zone['lat'])
-        rx_lng = float(zone['lng'])
-        predictions = run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
-                path_frequency=[28.85, 24.94, 21.225, 18.118, 14.175, 10.125, 7.1, 5.33, 3.65],
+def get_zone_distance(tx_lat, tx_lng, zone):
+    """
+    Returns the length of the path to the zone in km, the long way round
+    for long path zones.
+    """
+    distance = get_path_distance(tx_lat, tx_lng, zone['lat'], zone['lng'])
+    return 2 * pi * R0 - distance if zone['path'] == 'LONGPATH' else distance
+
+
+@stage_timer.timed('run_noise_predictions')
+def run_noise_predictions(tx_lat, tx_lng, traffic, noise_level, path_ssn, path_month, path_year, data_path, cache=None, area_step=None, usage_summary=None, failures=None, scheduler=None):
+    """
+    Run the predictions for each of the target zones.  If area_step is given
+    groups of nearby short path zones are predicted with an ITURHFProp area
+    prediction each, on a grid of area_step degrees, and the distance each
+    of their zones is moved to the grid is given in km as its 'grid_offset'
+    (see hfprop/area.py).  The other zones, and all long path zones, are
+    predicted individually.  The runs are made by the scheduler if one is
+    given (see hfprop/scheduler.py).  The usage of each
+    ITURHFProp run is added to usage_summary if it's given.  If a failures
+    ledger is given a zone whose prediction fails is added to it and left
+    out of the results, otherwise the ITURHFPropError is raised.
+    """
+    prediction_args = dict(path_frequency=[28.85, 24.94, 21.225, 18.118, 14.175, 10.125, 7.1, 5.33, 3.65],
                 path_bw=traffic[0],
                 path_SNRr=traffic[1],
-                path_sorl=zone['path'],
                 path_manmade_noise = noise_level,
                 report_format=['RPT_NOISESOURCES', 'RPT_NOISETOTAL'],
                 path_month=path_month,
                 path_year=path_year,
                 report_dict_keys=['FaM', 'FamT', 'FaA', 'FaG'],
                 data_path=data_path,
-                zeroMidnight=True)
+                zeroMidnight=True,
+                cache=cache)
+    def run_zone_predictions(zones):
+        try:
+            if len(zones) > 1:
+                return run_p2p_prediction(tx_lat, tx_lng, zones[0]['lat'], zones[0]['lng'], path_ssn,
+                        path_sorl='SHORTPATH',
+                        area_zones=zones,
+                        area_step=area_step,
+                        **prediction_args)
+            return {zones[0]['id']: run_p2p_prediction(tx_lat, tx_lng, float(zones[0]['lat']), float(zones[0]['lng']), path_ssn,
+                    path_sorl=zones[0]['path'],
+                    **prediction_args)}
+        except ITURHFPropError as e:
+            if failures is None:
+                raise
+            if len(zones) > 1:
+                failures.add('area:' + ','.join(zone['id'] for zone in zones), e, zones=[zone['id'] for zone in zones])
+            else:
+                failures.add(zones[0]['id'], e)
+            return {}
+
+    def get_cost(zones):
+        points = get_area_size(get_area(zones, area_step), area_step) if len(zones) > 1 else 1
+        return get_job_cost(get_zone_distance(tx_lat, tx_lng, zones[0]), len(prediction_args['path_frequency']), points=points)
+
+    if area_step:
+        area_groups, p2p_zones = get_area_groups([zone for zone in target_zones if zone['path'] == 'SHORTPATH'], area_step)
+        p2p_zones = [zone for zone in target_zones if zone in p2p_zones or zone['path'] != 'SHORTPATH']
+    else:
+        area_groups, p2p_zones = [], target_zones
+    jobs = area_groups + [[zone] for zone in p2p_zones]
+    if scheduler:
+        job_predictions = scheduler.map(run_zone_predictions, jobs, costs=[get_cost(zones) for zones in jobs])
+    else:
+        job_predictions = [run_zone_predictions(zones) for zones in jobs]
+    zone_predictions = {}
+    for predictions in job_predictions:
+        zone_predictions.update(predictions)
+    area_zones = [zone['id'] for zones in area_groups for zone in zones]
+    predictions_list = []
+    for zone in target_zones:
+        predictions = zone_predictions.get(zone['id'])
+        if predictions is None:
+            continue
         #print(predictions)
+        if usage_summary is not None:
+            usage_summary.add_result(predictions)
         meta = {}
         meta['location'] = zone['location']
         meta['path'] = zone['path']
+        if zone['id'] in area_zones:
+            meta['grid_offset'] = round(get_zone_offset(zone, area_step), 1)
         prediction = {'meta':meta,'predictions':predictions}
         predictions_list.append(prediction)
     return predictions_list
 
 
-def get_predictions_as_dict(csv_file, parameters, zeroMidnight=False):
-    predictions = {}
-    with open(csv_file) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row['frequency'] not in predictions:
-                predictions[row['frequency']] = {}
-                for parameter in parameters:
-                    predictions[row['frequency']][parameter] = []
-            for parameter in parameters:
-                predictions[row['frequency']][parameter].append(row[parameter])
-
-    if zeroMidnight:
-        for freq, params in predictions.items():
-            for param, preds in params.items():
-                preds.insert(0, preds.pop())
-
-    return predictions
-
 
-
-def run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
+def get_input_deck(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
                     path_name="",
                     tx_antenna="ISOTROPIC",
                     tx_gos=0.0,
@@ -136,12 +189,13 @@ def run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
                     path_manmade_noise="CITY",
                     report_format=["RPT_BCR"],
                     data_path="./data/",
-                    report_dict_keys=['BCR'],
-                    zeroMidnight=False,
-                    returnInputFile=False,
-                    returnOutputFile=False
+                    area_zones=None,
+                    area_step=DEFAULT_AREA_STEP
                     ):
-
+    """
+    Returns the input deck, for an area covering all of the zones if
+    area_zones is given.
+    """
     tx_power = 10 * (log10(tx_power/1000.0))
 
     report_format_str = " | ".join(report_format)
@@ -183,44 +237,98 @@ def run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
     buf.append('Path.ManMadeNoise "{:s}"'.format(path_manmade_noise))
     buf.append('Path.SorL "{:s}"'.format(path_sorl))
     buf.append('RptFileFormat "{:s}"'.format(report_format_str))
-    buf.append('LL.lat {:.6f}'.format(rx_lat))
-    buf.append('LL.lng {:.6f}'.format(rx_lng))
-    buf.append('LR.lat {:.6f}'.format(rx_lat))
-    buf.append('LR.lng {:.6f}'.format(rx_lng))
-    buf.append('UL.lat {:.6f}'.format(rx_lat))
-    buf.append('UL.lng {:.6f}'.format(rx_lng))
-    buf.append('UR.lat {:.6f}'.format(rx_lat))
-    buf.append('UR.lng {:.6f}'.format(rx_lng))
+    if area_zones:
+        buf.extend(get_area_deck(get_area(area_zones, area_step), area_step))
+    else:
+        buf.append('LL.lat {:.6f}'.format(rx_lat))
+        buf.append('LL.lng {:.6f}'.format(rx_lng))
+        buf.append('LR.lat {:.6f}'.format(rx_lat))
+        buf.append('LR.lng {:.6f}'.format(rx_lng))
+        buf.append('UL.lat {:.6f}'.format(rx_lat))
+        buf.append('UL.lng {:.6f}'.format(rx_lng))
+        buf.append('UR.lat {:.6f}'.format(rx_lat))
+        buf.append('UR.lng {:.6f}'.format(rx_lng))
     buf.append('DataFilePath "{:s}"'.format(data_path))
 
-    input_file = NamedTemporaryFile(mode='w+t', prefix="proppy_", suffix='.in', delete=False)
-    text_in = "{:s}\n".format('\n'.join(buf))
+    return "{:s}\n".format('\n'.join(buf))
+
+
+def run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
+                    path_name="",
+                    tx_antenna="ISOTROPIC",
+                    tx_gos=0.0,
+                    rx_antenna="ISOTROPIC",
+                    rx_gos=0.0,
+                    path_month=None,
+                    path_year=None,
+                    path_hour=[1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24],
+                    path_frequency=[10],
+                    path_bw=3000,
+                    path_SNRr=15,
+                    tx_power=100,
+                    path_sorl="SHORTPATH",
+                    path_manmade_noise="CITY",
+                    report_format=["RPT_BCR"],
+                    data_path="./data/",
+                    report_dict_keys=['BCR'],
+                    zeroMidnight=False,
+                    returnInputFile=False,
+                    returnOutputFile=False,
+                    cache=None,
+                    area_zones=None,
+                    area_step=DEFAULT_AREA_STEP,
+                    scratch=default_scratch_space
+                    ):
+    """
+    Run a single ITURHFProp prediction.  If area_zones is given an area
+    prediction covering all of the zones is made and a dict of predictions
+    keyed by zone id is returned.
+    """
+    with stage_timer.stage('deck'):
+        text_in = get_input_deck(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
+                        path_name=path_name,
+                        tx_antenna=tx_antenna,
+                        tx_gos=tx_gos,
+                        rx_antenna=rx_antenna,
+                        rx_gos=rx_gos,
+                        path_month=path_month,
+                        path_year=path_year,
+                        path_hour=path_hour,
+                        path_frequency=path_frequency,
+                        path_bw=path_bw,
+                        path_SNRr=path_SNRr,
+                        tx_power=tx_power,
+                        path_sorl=path_sorl,
+                        path_manmade_noise=path_manmade_noise,
+                        report_format=report_format,
+                        data_path=data_path,
+                        area_zones=area_zones,
+                        area_step=area_step)
     #print(text_in)
-    input_file.write(text_in)
-    input_file.close()
-
-    FNULL = open(os.devnull, 'w')
-    output_file = NamedTemporaryFile(prefix="proppy_", suffix='.out', delete=False)
-
-    return_code = subprocess.call(["ITURHFProp",
-        '-c',
-        input_file.name,
-        output_file.name],
-        stderr=subprocess.STDOUT)
-
-    if return_code != 232:
-        raise ITURHFPropError("Internal Server Error: Return Code {:d}".format(return_code))
-
-    try:
-        prediction_dict = get_predictions_as_dict(output_file.name, report_dict_keys, zeroMidnight=zeroMidnight)
-    except:
-        print("Unexpected error:", sys.exc_info()[0])
-        raise ITURHFPropError("Internal Server Error: Error parsing file")
-
-    print(input_file.name)
-    print(output_file.name)
-    #os.remove(input_file.name)
-    #os.remove(output_file.name)
+    if cache:
+        cache_key = cache.get_key(text_in, data_path, report_dict_keys, zeroMidnight, area_zones)
+        prediction_dict = cache.get(cache_key)
+        if prediction_dict is not None:
+            return prediction_dict
+
+    with scratch.open_run(text_in) as run:
+        with stage_timer.stage('iturhfprop'):
+            usage = run_iturhfprop_checked(['-c'], run.input_file, run.output_file, text_in)
+
+        try:
+            with stage_timer.stage('parse'):
+                if area_zones:
+                    prediction_dict = get_zone_predictions(run.output_file, area_zones, report_dict_keys, area_step, zeroMidnight=zeroMidnight)
+                else:
+                    prediction_dict = get_predictions_as_dict(run.output_file, report_dict_keys, zeroMidnight=zeroMidnight)
+        except Exception as e:
+            raise ITURHFPropError("Internal Server Error: Error parsing file: {:s}".format(str(e)), usage.return_code, usage) from e
+
+    if cache:
+        cache.put(cache_key, prediction_dict)
+    # Set after the result is cached, cached results have no usage
+    attach_usage(prediction_dict, usage)
+
     return prediction_dict
 
 
@@ -231,24 +339,41 @@ if __name__ == "__main__":
     path_year = 2019
     noise_level = 'RESIDENTIAL'
     data_path = "/home/jwatson/develop/proppy/flask/data/"
-    json_data = run_noise_predictions(45.0, 1.5, traffic, noise_level, path_ssn, path_month, path_year, data_path)
+    cache = PredictionCache()
+    usage_summary = UsageSummary()
+    failures = FailureLedger()
+    scheduler = AdaptiveScheduler()
+    json_data = run_noise_predictions(45.0, 1.5, traffic, noise_level, path_ssn, path_month, path_year, data_path, cache=cache, usage_summary=usage_summary, failures=failures, scheduler=scheduler)
+    print(cache)
+    print(scheduler)
+    print(usage_summary)
+    if failures:
+        print(failures)
+    print(default_scratch_space)
+    if stage_timer.enabled:
+        print(stage_timer)
+        stage_timer.write_trace()
 
     out_buf = []    #print(json_data)
     for location in json_data:
-        out_buf.append("\n{:s} ({:s})".format(location['meta']['location'], location['meta']['path']))
-        for idx, freq in enumerate(sorted(location['predictions'].keys(), key=float)):
-            utc = list(range(0,24))
-            faa = location['predictions'][freq]['FaA']
-            fam = location['predictions'][freq]['FaM']
-            fag = location['predictions'][freq]['FaG']
-            famt = location['predictions'][freq]['FamT']
-            delta = [float(a) - float(b) for a, b in zip(famt, fam)]
+        if 'grid_offset' in location['meta']:
+            out_buf.append("\n{:s} ({:s}, predicted {:.1f} km away on the area grid)".format(location['meta']['location'], location['meta']['path'], location['meta']['grid_offset']))
+        else:
+            out_buf.append("\n{:s} ({:s})".format(location['meta']['location'], location['meta']['path']))
+        predictions = location['predictions']
+        utc = predictions.hours.tolist()
+        for idx, freq in enumerate(predictions.frequency_labels):
+            faa = predictions.get_parameter('FaA')[idx]
+            fam = predictions.get_parameter('FaM')[idx]
+            fag = predictions.get_parameter('FaG')[idx]
+            famt = predictions.get_parameter('FamT')[idx]
+            delta = famt - fam
             out_buf.append("-"*180)
             out_buf.append((" Freq.   UTC" + (" {: >6d}")*24).format(*utc))
-            out_buf.append(("{:>6s}  FamT" + (" {: >6s}")*24).format(freq, *famt))
-            out_buf.append(("{:>6s}   FaM" + (" {: >6s}")*24).format(freq, *fam))
-            out_buf.append(("{:>6s}   FaA" + (" {: >6s}")*24).format(freq, *faa))
-            out_buf.append(("{:>6s}   FaG" + (" {: >6s}")*24).format(freq, *fag))
+            out_buf.append(("{:>6s}  FamT" + (" {: >6.2f}")*24).format(freq, *famt))
+            out_buf.append(("{:>6s}   FaM" + (" {: >6.2f}")*24).format(freq, *fam))
+            out_buf.append(("{:>6s}   FaA" + (" {: >6.2f}")*24).format(freq, *faa))
+            out_buf.append(("{:>6s}   FaG" + (" {: >6.2f}")*24).format(freq, *fag))
             out_buf.append(("{:>6s} delta" + (" {: >6.2f}")*24).format(freq, *delta))
     with open('noise_'+noise_level+'.txt', 'w') as out_file:
         out_file.write("{:s}\n".format('\n'.join(out_buf)))
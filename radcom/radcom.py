@@ -24,6 +24,11 @@ SOFTWARE.
 
 """
 Create radcom style Predictions
+
+There's no asyncio API.  ITURHFProp is waited for with os.wait4() to
+collect the resources each run used, which an event loop's child watcher
+would prevent, so the zones are run concurrently on a thread pool by
+passing a scheduler (hfprop/scheduler.py) to run_radcom_predictions().
 """
 
 """
@@ -32,12 +37,21 @@ On Ubuntu this is installed with;
 sudo apt install python3-pysolar
 """
 
-import csv
 import datetime
 import math
 import os
-import subprocess
-from tempfile import NamedTemporaryFile
+import sys
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from hfprop.area import DEFAULT_AREA_STEP, get_area, get_area_deck, get_area_groups, get_area_size, get_zone_offset, get_zone_predictions
+from hfprop.cache import PredictionCache
+from hfprop.failures import FailureLedger
+from hfprop.iturhfprop import ITURHFPropError, run_iturhfprop_checked
+from hfprop.results import format_value, get_predictions_as_dict
+from hfprop.scheduler import AdaptiveScheduler, get_job_cost
+from hfprop.scratch import default_scratch_space
+from hfprop.timing import stage_timer
+from hfprop.usage import UsageSummary, attach_usage, get_path_distance
 
 
 target_zones = [{"id":"4U1UN", "location":"New York City", "entity":"United Nations", "lat":"40.750", "lng":"-74.000"},
@@ -61,33 +75,68 @@ target_zones = [{"id":"4U1UN", "location":"New York City", "entity":"United Nati
           ]
 
 
-def run_radcom_predictions(tx_lat, tx_lng, path_ssn):
+@stage_timer.timed('run_radcom_predictions')
+def run_radcom_predictions(tx_lat, tx_lng, path_ssn, cache=None, area_step=None, usage_summary=None, failures=None, scheduler=None):
+    """
+    Run the predictions for each of the target zones.  If area_step is given
+    groups of nearby zones are predicted with an ITURHFProp area prediction
+    each, on a grid of area_step degrees, and the distance each of their
+    zones is moved to the grid is given in km as its 'grid_offset' (see
+    hfprop/area.py).  The other zones are predicted one at a time.  The runs
+    are made by the scheduler if one is given (see hfprop/scheduler.py).
+    The usage of each ITURHFProp run is added to usage_summary if it's
+    given.  If a failures ledger is given a zone whose prediction fails is
+    added to it and left out of the results, otherwise the ITURHFPropError
+    is raised.
+    """
+    def run_zone_predictions(zones):
+        try:
+            if len(zones) > 1:
+                return run_area_prediction(tx_lat, tx_lng, zones, path_ssn, "/snap/iturhfprop/current/usr/share/iturhfprop/data/", area_step=area_step, cache=cache)
+            return {zones[0]['id']: run_p2p_prediction(tx_lat, tx_lng, float(zones[0]['lat']), float(zones[0]['lng']), path_ssn, "/snap/iturhfprop/current/usr/share/iturhfprop/data/", cache=cache)}
+        except ITURHFPropError as e:
+            if failures is None:
+                raise
+            if len(zones) > 1:
+                failures.add('area:' + ','.join(zone['id'] for zone in zones), e, zones=[zone['id'] for zone in zones])
+            else:
+                failures.add(zones[0]['id'], e)
+            return {}
+
+    def get_cost(zones):
+        points = get_area_size(get_area(zones, area_step), area_step) if len(zones) > 1 else 1
+        return get_job_cost(get_path_distance(tx_lat, tx_lng, zones[0]['lat'], zones[0]['lng']), 9, points=points)
+
+    if area_step:
+        area_groups, p2p_zones = get_area_groups(target_zones, area_step)
+    else:
+        area_groups, p2p_zones = [], target_zones
+    jobs = area_groups + [[zone] for zone in p2p_zones]
+    if scheduler:
+        job_predictions = scheduler.map(run_zone_predictions, jobs, costs=[get_cost(zones) for zones in jobs])
+    else:
+        job_predictions = [run_zone_predictions(zones) for zones in jobs]
+    zone_predictions = {}
+    for predictions in job_predictions:
+        zone_predictions.update(predictions)
+    area_zones = [zone['id'] for zones in area_groups for zone in zones]
     radcom_predictions = {}
     for zone in target_zones:
-        rx_lat = float(zone['lat'])
-        rx_lng = float(zone['lng'])
+        predictions = zone_predictions.get(zone['id'])
+        if predictions is None:
+            continue
         radcom_predictions[zone['id']] = {}
-        radcom_predictions[zone['id']]['predictions'] = run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn, "/snap/iturhfprop/current/usr/share/iturhfprop/data/")
+        radcom_predictions[zone['id']]['predictions'] = predictions
         radcom_predictions[zone['id']]['meta'] = {}
         radcom_predictions[zone['id']]['meta']['location'] = zone['location']
+        if zone['id'] in area_zones:
+            radcom_predictions[zone['id']]['meta']['grid_offset'] = round(get_zone_offset(zone, area_step), 1)
+        if usage_summary is not None:
+            usage_summary.add_result(radcom_predictions[zone['id']]['predictions'])
     return radcom_predictions
 
 
-def get_predictions_as_dict(csv_file, parameters):
-    predictions = {}
-    with open(csv_file) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row['frequency'] not in predictions:
-                predictions[row['frequency']] = {}
-                for parameter in parameters:
-                    predictions[row['frequency']][parameter] = []
-            for parameter in parameters:
-                predictions[row['frequency']][parameter].append(row[parameter])
-    return predictions
-
-
-def run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
+def get_input_deck(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
                     data_file_path,
                     path_name="",
                     tx_antenna="ISOTROPIC",
@@ -99,7 +148,9 @@ def run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
                     path_hour='1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24',
                     tx_power=100,
                     path_sorl="SHORTPATH",
-                    path_manmade_noise="CITY"
+                    path_manmade_noise="CITY",
+                    area=None,
+                    area_step=DEFAULT_AREA_STEP
                     ):
     tx_power = 10 * (math.log10(tx_power)/1000)
     buf = []
@@ -136,48 +187,117 @@ def run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
     buf.append('Path.ManMadeNoise "{:s}"'.format(path_manmade_noise))
     buf.append('Path.SorL "{:s}"'.format(path_sorl))
     buf.append('RptFileFormat "RPT_BCR"')
-    buf.append('LL.lat {:.6f}'.format(rx_lat))
-    buf.append('LL.lng {:.6f}'.format(rx_lng))
-    buf.append('LR.lat {:.6f}'.format(rx_lat))
-    buf.append('LR.lng {:.6f}'.format(rx_lng))
-    buf.append('UL.lat {:.6f}'.format(rx_lat))
-    buf.append('UL.lng {:.6f}'.format(rx_lng))
-    buf.append('UR.lat {:.6f}'.format(rx_lat))
-    buf.append('UR.lng {:.6f}'.format(rx_lng))
+    if area:
+        buf.extend(get_area_deck(area, area_step))
+    else:
+        buf.append('LL.lat {:.6f}'.format(rx_lat))
+        buf.append('LL.lng {:.6f}'.format(rx_lng))
+        buf.append('LR.lat {:.6f}'.format(rx_lat))
+        buf.append('LR.lng {:.6f}'.format(rx_lng))
+        buf.append('UL.lat {:.6f}'.format(rx_lat))
+        buf.append('UL.lng {:.6f}'.format(rx_lng))
+        buf.append('UR.lat {:.6f}'.format(rx_lat))
+        buf.append('UR.lng {:.6f}'.format(rx_lng))
     buf.append('DataFilePath "{:s}"'.format(data_file_path))
 
-    input_file = NamedTemporaryFile(mode='w+t', prefix="proppy_", suffix='.in', delete=False)
-    text_in = "{:s}\n".format('\n'.join(buf))
-    #print(text_in)
-    input_file.write(text_in)
-    input_file.close()
-
-    FNULL = open(os.devnull, 'w')
-    output_file = NamedTemporaryFile(prefix="proppy_", suffix='.out', delete=False)
-    print(input_file.name)
-    print(output_file.name)
+    return "{:s}\n".format('\n'.join(buf))
 
-    return_code = subprocess.call(["ITURHFProp",
-        '-s',
-        '-c',
-        input_file.name,
-        output_file.name],
-        stderr=subprocess.STDOUT)
-
-    if return_code != 232:
-        print(text_in)
-        raise ITURHFPropError("Internal Server Error: Return Code {:d}".format(return_code))
 
+def get_prediction_results(usage, output_file_name, zones=None, area_step=DEFAULT_AREA_STEP):
     try:
-        #prediction = REC533Out(output_file.name)
+        #prediction = REC533Out(output_file_name)
         #muf, mesh_grid, params = prediction.get_p2p_plot_data('BCR')
         #print(params.title)
-        bcr_dict = get_predictions_as_dict(output_file.name, ['BCR',])
-    except:
-        print("Unexpected error:", sys.exc_info()[0])
-        raise ITURHFPropError("Internal Server Error: Error parsing file")
+        if zones:
+            bcr_dict = get_zone_predictions(output_file_name, zones, ['BCR',], area_step)
+        else:
+            bcr_dict = get_predictions_as_dict(output_file_name, ['BCR',])
+    except Exception as e:
+        raise ITURHFPropError("Internal Server Error: Error parsing file: {:s}".format(str(e)), usage.return_code, usage) from e
+    return bcr_dict
+
+
+def run_p2p_prediction(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
+                    data_file_path,
+                    path_name="",
+                    tx_antenna="ISOTROPIC",
+                    tx_gos=0.0,
+                    rx_antenna="ISOTROPIC",
+                    rx_gos=0.0,
+                    path_month=None,
+                    path_year=None,
+                    path_hour='1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24',
+                    tx_power=100,
+                    path_sorl="SHORTPATH",
+                    path_manmade_noise="CITY",
+                    cache=None,
+                    scratch=default_scratch_space
+                    ):
+    with stage_timer.stage('deck'):
+        text_in = get_input_deck(tx_lat, tx_lng, rx_lat, rx_lng, path_ssn,
+                        data_file_path,
+                        path_name=path_name,
+                        tx_antenna=tx_antenna,
+                        tx_gos=tx_gos,
+                        rx_antenna=rx_antenna,
+                        rx_gos=rx_gos,
+                        path_month=path_month,
+                        path_year=path_year,
+                        path_hour=path_hour,
+                        tx_power=tx_power,
+                        path_sorl=path_sorl,
+                        path_manmade_noise=path_manmade_noise)
+    if cache:
+        cache_key = cache.get_key(text_in, data_file_path)
+        bcr_dict = cache.get(cache_key)
+        if bcr_dict is not None:
+            return bcr_dict
+    with scratch.open_run(text_in) as run:
+        with stage_timer.stage('iturhfprop'):
+            usage = run_iturhfprop_checked(['-s', '-c'], run.input_file, run.output_file, text_in)
+
+        with stage_timer.stage('parse'):
+            bcr_dict = get_prediction_results(usage, run.output_file)
+    if cache:
+        cache.put(cache_key, bcr_dict)
+    attach_usage(bcr_dict, usage)
     return bcr_dict
 
+
+def run_area_prediction(tx_lat, tx_lng, zones, path_ssn,
+                    data_file_path,
+                    area_step=DEFAULT_AREA_STEP,
+                    cache=None,
+                    scratch=default_scratch_space
+                    ):
+    """
+    Predict all of the zones with a single ITURHFProp area prediction, each
+    zone is predicted at its nearest grid point.  Returns a dict of
+    predictions keyed by zone id.
+    """
+    area = get_area(zones, area_step)
+    with stage_timer.stage('deck'):
+        text_in = get_input_deck(tx_lat, tx_lng, float(zones[0]['lat']), float(zones[0]['lng']), path_ssn,
+                        data_file_path,
+                        area=area,
+                        area_step=area_step)
+    if cache:
+        cache_key = cache.get_key(text_in, data_file_path, [(zone['id'], zone['lat'], zone['lng']) for zone in zones])
+        zone_predictions = cache.get(cache_key)
+        if zone_predictions is not None:
+            return zone_predictions
+    with scratch.open_run(text_in) as run:
+        with stage_timer.stage('iturhfprop'):
+            usage = run_iturhfprop_checked(['-s', '-c'], run.input_file, run.output_file, text_in)
+
+        with stage_timer.stage('parse'):
+            zone_predictions = get_prediction_results(usage, run.output_file, zones, area_step)
+    if cache:
+        cache.put(cache_key, zone_predictions)
+    attach_usage(zone_predictions, usage)
+    return zone_predictions
+
+
 """
 Values in the range 0-100
 """
@@ -191,17 +311,33 @@ def get_html_table(json_data, parameter):
     buf = []
     buf.append('<table><tr><th>&nbsp;</th><th colspan=24>'+json_data['meta']['location']+'</th></tr>')
     buf.append('<tr><th>&nbsp;</th><th>01</th><th>02</th><th>03</th><th>04</th><th>05</th><th>06</th><th>07</th><th>08</th><th>09</th><th>10</th><th>11</th><th>12</th><th>13</th><th>14</th><th>15</th><th>16</th><th>17</th><th>18</th><th>19</th><th>20</th><th>21</th><th>22</th><th>23</th><th>24</th></tr>')
-    for freq, predictions in json_data['predictions'].items():
-        buf.append('<tr><td>{:s}</td>'.format(freq))
-        for prediction in predictions[parameter]:
-            buf.append('<td bgcolor="{:s}" title="BCR={:s}%"></td>'.format(get_colour(float(prediction)), prediction))
+    predictions = json_data['predictions']
+    values = predictions.get_parameter(parameter)
+    # Rows are listed in the same order as the frequencies in the input deck
+    for idx in predictions.frequency_order:
+        buf.append('<tr><td>{:s}</td>'.format(predictions.frequency_labels[idx]))
+        for prediction in values[idx]:
+            buf.append('<td bgcolor="{:s}" title="BCR={:s}%"></td>'.format(get_colour(prediction), format_value(prediction)))
         buf.append('</tr>')
     return buf
 
 
 if __name__ == "__main__":
     path_ssn = 4
-    json_data = run_radcom_predictions(45.0, 1.5, path_ssn)
+    cache = PredictionCache()
+    usage_summary = UsageSummary()
+    failures = FailureLedger()
+    scheduler = AdaptiveScheduler()
+    json_data = run_radcom_predictions(45.0, 1.5, path_ssn, cache=cache, usage_summary=usage_summary, failures=failures, scheduler=scheduler)
+    print(cache)
+    print(scheduler)
+    print(usage_summary)
+    if failures:
+        print(failures)
+    print(default_scratch_space)
+    if stage_timer.enabled:
+        print(stage_timer)
+        stage_timer.write_trace()
     html_doc = []
     html_doc.append('<html>')
     html_doc.append('<meta name="viewport" content="width=device-width, initial-scale=1"><title>DX Charts</title>')